@@ -1,60 +1,323 @@
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import StreamingResponse
-from sqlmodel import Session, select
+from collections.abc import Callable, Iterator
+from datetime import date, datetime
 
-from ..core.deps import get_session
-from ..models.shift_history import ShiftHistory
-from ..schemas.history import AllocationResponse
-from ..services.allocation_engine import AllocationEngine
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlmodel import Session
+
+from ..core.config import get_settings
+from ..core.deps import get_read_session, get_session, stream_with_session
+from ..core.metrics import observe_allocation
+from ..core.responses import FastJSONResponse
+from ..db import session_scope
+from ..models.allocation_run import AllocationRun
+from ..models.site import DEFAULT_SITE
+from ..schemas.history import (
+    AllocationRangeRequest,
+    AllocationRangeResponse,
+    AllocationRequest,
+    AllocationResponse,
+    AllocationRunRead,
+    AllocationSitesRequest,
+    AllocationSitesResponse,
+    HistoryArchiveRequest,
+    HistoryArchiveResponse,
+    RepairRequest,
+    RepairResponse,
+)
+from ..services.allocation_engine import SOLVERS, AllocationEngine, jalali_date, parse_day
+from ..services.batch_allocation import allocate_range, allocate_sites
+from ..services.history import (
+    HISTORY_MAX_PAGE_SIZE,
+    HISTORY_PAGE_SIZE,
+    history_criteria,
+    iter_history_ndjson,
+    page_history,
+)
+from ..services.history_archive import archive_history, iter_archived_history
+from ..services.import_export import iter_history_csv, iter_rows_csv
+from ..services.jobs import Job, QueueFull, job_queue
+from ..services.result_cache import (
+    allocation_cache,
+    allocation_fingerprint,
+    etag_for,
+    etag_matches,
+    invalidate_allocation_cache,
+)
+from ..services.run_store import get_run, latest_run, latest_run_id, run_to_dict, save_run, unpack_rows
+from ..services.settings_snapshot import settings_snapshot
 
 router = APIRouter(prefix="/allocate", tags=["allocation"])
 
 
-@router.post("", response_model=AllocationResponse)
-def allocate(session: Session = Depends(get_session)):
-    engine = AllocationEngine(session)
+def _parse_day(value: str) -> date:
+    try:
+        return parse_day(value)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=f"Invalid date: {value}") from exc
+
+
+def _require_site(session: Session, site: str) -> None:
+    """422 for a site without a ``Setting`` row, before any planning starts."""
+    if settings_snapshot(session, site) is None:
+        raise HTTPException(status_code=422, detail=f"Settings missing for site {site!r}")
+
+
+def _run_allocation(
+    session: Session,
+    today: date,
+    solver: str,
+    progress: Callable[[int, int], None] | None = None,
+    site: str = DEFAULT_SITE,
+) -> tuple[dict, str, bool]:
+    """Serve ``today`` from the cache or allocate and store a new run; returns (result, etag, hit).
+
+    A cached result is only served while its run is still the newest of the
+    day at ``site``; a run stored since by another worker process makes it
+    stale even though this process's cache never saw the write.
+    """
+    fingerprint = allocation_fingerprint(session, today, solver, site)
+    cached = allocation_cache.get(fingerprint)
+    if cached is not None and cached["run_id"] == latest_run_id(session, jalali_date(today), site):
+        return cached, etag_for(fingerprint, cached["run_id"]), True
+    engine = AllocationEngine(session, today=today, solver=solver, progress=progress, site=site)
     result = engine.allocate()
-    request_state["engine"] = engine
-    return result
+    observe_allocation(engine.timings, len(result["long"]), engine.slot_count, engine.filled_slots)
+    run = save_run(session, result, engine.jalali_date, engine.setting, fingerprint=fingerprint, site=site)
+    result = {**result, "run_id": run.id}
+    allocation_cache.put(fingerprint, result)
+    return result, etag_for(fingerprint, run.id), False
+
+
+@router.post("", response_model=AllocationResponse)
+def allocate(
+    request: Request,
+    payload: AllocationRequest | None = None,
+    solver: str | None = Query(default=None, pattern=f"^({'|'.join(SOLVERS)})$"),
+    run_async: bool = Query(default=False, alias="async"),
+    session: Session = Depends(get_session),
+):
+    """Allocate one day. With ``async=true`` the work is queued and ``202`` returns the job to poll."""
+    today = _parse_day(payload.date) if payload and payload.date else datetime.now().date()
+    site = payload.site if payload else DEFAULT_SITE
+    _require_site(session, site)
+    solver = solver or get_settings().allocation_solver
+    if run_async:
+        return _submit_allocation(request, today, solver, site)
+    result, etag, hit = _run_allocation(session, today, solver, site=site)
+    # Engine results already have the AllocationResponse shape.
+    return FastJSONResponse(result, headers={"ETag": etag, "X-Allocation-Cache": "hit" if hit else "miss"})
+
+
+def _submit_allocation(request: Request, today: date, solver: str, site: str) -> JSONResponse:
+    def work(job: Job) -> dict:
+        with session_scope() as job_session:
+            result, _, hit = _run_allocation(job_session, today, solver, progress=job.progress, site=site)
+        if hit:
+            job.done = job.total = 1
+        return result
+
+    try:
+        job = job_queue.submit("allocate", work)
+    except QueueFull as exc:
+        raise HTTPException(
+            status_code=503, detail="Allocation queue is full", headers={"Retry-After": "1"}
+        ) from exc
+    return JSONResponse(
+        status_code=202,
+        content=jsonable_encoder(job.to_dict()),
+        headers={"Location": str(request.url_for("read_job", job_id=job.id))},
+    )
+
+
+@router.post("/range", response_model=AllocationRangeResponse)
+def allocate_date_range(payload: AllocationRangeRequest, session: Session = Depends(get_session)):
+    """Allocate consecutive days in date order; each day sees the history of the days before it."""
+    start = _parse_day(payload.start_date)
+    end = _parse_day(payload.end_date)
+    if end < start:
+        raise HTTPException(status_code=422, detail="end_date is before start_date")
+    settings = get_settings()
+    if (end - start).days + 1 > settings.max_batch_days:
+        raise HTTPException(status_code=422, detail=f"At most {settings.max_batch_days} days per batch")
+    _require_site(session, payload.site)
+    invalidate_allocation_cache()
+    return allocate_range(
+        session,
+        start,
+        end,
+        solver=payload.solver or settings.allocation_solver,
+        site=payload.site,
+    )
+
+
+@router.post("/sites", response_model=AllocationSitesResponse)
+def allocate_all_sites(payload: AllocationSitesRequest | None = None, session: Session = Depends(get_session)):
+    """Allocate one day for every site (or ``sites``), one site per worker process."""
+    payload = payload or AllocationSitesRequest()
+    today = _parse_day(payload.date) if payload.date else datetime.now().date()
+    settings = get_settings()
+    invalidate_allocation_cache()
+    try:
+        return allocate_sites(
+            session,
+            today,
+            sites=payload.sites,
+            workers=payload.workers or settings.allocation_workers,
+            solver=payload.solver or settings.allocation_solver,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
 
 
 @router.get("/history")
-def read_history(date: str | None = None, session: Session = Depends(get_session)):
-    statement = select(ShiftHistory)
-    if date:
-        statement = statement.where(ShiftHistory.date_jalali == date)
-    records = session.exec(statement).all()
-    return [
-        {
-            "id": row.id,
-            "date_jalali": row.date_jalali,
-            "guard_name": row.guard_name,
-            "location_name": row.location_name,
-            "start": row.start,
-            "end": row.end,
-            "kind": row.kind,
-            "created_at": row.created_at,
-        }
-        for row in records
-    ]
-
-
-request_state: dict[str, AllocationEngine] = {}
+def read_history(
+    request: Request,
+    response: Response,
+    date: str | None = None,
+    start: str | None = None,
+    end: str | None = None,
+    guard: str | None = None,
+    location: str | None = None,
+    site: str | None = None,
+    after_id: int | None = Query(default=None, ge=0),
+    limit: int | None = Query(default=None, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    format: str | None = Query(default=None, pattern="^(json|ndjson)$"),
+    session: Session = Depends(get_read_session),
+):
+    """Keyset-paginated history in id order.
 
+    With ``limit`` or ``after_id``, JSON pages return at most ``limit`` rows
+    (default ``HISTORY_PAGE_SIZE``) and set ``X-Next-After-Id`` when more may
+    follow; without either, every matching row is returned as before paging
+    existed. ``format=ndjson`` (or ``Accept: application/x-ndjson``) streams
+    every matching row instead, one JSON object per line. Rows of archived
+    months are read from the archive and merged in.
+    """
+    filters = dict(date=date, start=start, end=end, guard=guard, location=location, site=site)
+    criteria = history_criteria(**filters)
+    archived = iter_archived_history(session, **filters, after_id=after_id)
+    if format == "ndjson" or (format is None and "application/x-ndjson" in request.headers.get("accept", "")):
+        return StreamingResponse(
+            stream_with_session(iter_history_ndjson, criteria, after_id=after_id, limit=limit, archived=archived),
+            media_type="application/x-ndjson",
+        )
+    page_size = limit or (HISTORY_PAGE_SIZE if after_id is not None else None)
+    records = page_history(session, criteria, after_id=after_id, limit=page_size, archived=archived)
+    if page_size is not None and len(records) == page_size:
+        response.headers["X-Next-After-Id"] = str(records[-1]["id"])
+    return records
 
-@router.get("/export/wide.csv")
-def export_wide():
-    engine = request_state.get("engine")
-    if not engine:
+
+@router.post("/history/archive", response_model=HistoryArchiveResponse)
+def archive_closed_months(payload: HistoryArchiveRequest | None = None, session: Session = Depends(get_session)):
+    """Move closed months of history into compressed per-month archive files.
+
+    ``GET /history`` keeps returning archived rows; only the live table shrinks.
+    """
+    payload = payload or HistoryArchiveRequest()
+    try:
+        months = archive_history(session, site=payload.site, before=payload.before)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+    return {"months": months, "rows": sum(month["rows"] for month in months)}
+
+
+@router.get("/history/export.csv")
+def export_history(
+    start: str | None = None,
+    end: str | None = None,
+    guard: str | None = None,
+    location: str | None = None,
+    site: str | None = None,
+):
+    chunks = stream_with_session(iter_history_csv, start=start, end=end, guard=guard, location=location, site=site)
+    return _csv_response(chunks, "history.csv")
+
+
+def _get_run_or_404(session: Session, run_id: int) -> AllocationRun:
+    run = get_run(session, run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Allocation run not found")
+    return run
+
+
+def _latest_run_or_400(session: Session, site: str | None = None) -> AllocationRun:
+    run = latest_run(session, site)
+    if not run:
         raise HTTPException(status_code=400, detail="No allocation run yet")
-    csv_bytes = engine.export_wide_csv()
-    return StreamingResponse(iter([csv_bytes]), media_type="text/csv", headers={"Content-Disposition": "attachment; filename=wide.csv"})
+    return run
+
+
+def _csv_response(chunks: Iterator[bytes], filename: str, etag: str | None = None) -> StreamingResponse:
+    headers = {"Content-Disposition": f"attachment; filename={filename}"}
+    if etag:
+        headers["ETag"] = etag
+    return StreamingResponse(chunks, media_type="text/csv", headers=headers)
+
+
+def _not_modified(request: Request, run: AllocationRun) -> tuple[str, Response | None]:
+    etag = etag_for(run.fingerprint, run.id)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return etag, Response(status_code=304, headers={"ETag": etag})
+    return etag, None
+
+
+@router.get("/runs/{run_id}", response_model=AllocationRunRead)
+def read_run(run_id: int, request: Request, session: Session = Depends(get_read_session)):
+    run = _get_run_or_404(session, run_id)
+    etag, not_modified = _not_modified(request, run)
+    if not_modified:
+        return not_modified
+    return FastJSONResponse(run_to_dict(run), headers={"ETag": etag})
+
+
+@router.post("/runs/{run_id}/repair", response_model=RepairResponse)
+def repair_run(run_id: int, payload: RepairRequest, session: Session = Depends(get_session)):
+    """Re-fill only the slots of one absent guard or one opened/closed location.
+
+    The repaired day is stored as a new run; assignments the change does not
+    touch keep their guards. Only the newest run of a day can be repaired,
+    since the day's history was written from it; older runs answer 409.
+    """
+    if (payload.guard is None) == (payload.location is None):
+        raise HTTPException(status_code=422, detail="Give exactly one of guard or location")
+    run = _get_run_or_404(session, run_id)
+    latest = latest_run_id(session, run.date_jalali, run.site)
+    if latest != run.id:
+        raise HTTPException(status_code=409, detail=f"Run {run.id} was superseded by run {latest}")
+    engine = AllocationEngine(session, today=_parse_day(run.date_jalali), site=run.site)
+    result = engine.repair(
+        unpack_rows(run.wide), unpack_rows(run.long), guard=payload.guard, location=payload.location
+    )
+    invalidate_allocation_cache()
+    repaired = save_run(session, result, engine.jalali_date, engine.setting, site=run.site)
+    return FastJSONResponse({**result, "run_id": repaired.id})
+
+
+def _export_run(request: Request, run: AllocationRun, kind: str) -> Response:
+    etag, not_modified = _not_modified(request, run)
+    if not_modified:
+        return not_modified
+    return _csv_response(iter_rows_csv(unpack_rows(getattr(run, kind))), f"{kind}.csv", etag)
+
+
+@router.get("/runs/{run_id}/export/wide.csv")
+def export_run_wide(run_id: int, request: Request, session: Session = Depends(get_read_session)):
+    return _export_run(request, _get_run_or_404(session, run_id), "wide")
+
+
+@router.get("/runs/{run_id}/export/long.csv")
+def export_run_long(run_id: int, request: Request, session: Session = Depends(get_read_session)):
+    return _export_run(request, _get_run_or_404(session, run_id), "long")
+
+
+@router.get("/export/wide.csv")
+def export_wide(request: Request, site: str | None = None, session: Session = Depends(get_read_session)):
+    return _export_run(request, _latest_run_or_400(session, site), "wide")
 
 
 @router.get("/export/long.csv")
-def export_long():
-    engine = request_state.get("engine")
-    if not engine:
-        raise HTTPException(status_code=400, detail="No allocation run yet")
-    csv_bytes = engine.export_long_csv()
-    return StreamingResponse(iter([csv_bytes]), media_type="text/csv", headers={"Content-Disposition": "attachment; filename=long.csv"})
+def export_long(request: Request, site: str | None = None, session: Session = Depends(get_read_session)):
+    return _export_run(request, _latest_run_or_400(session, site), "long")
@@ -0,0 +1,22 @@
+from fastapi import APIRouter, HTTPException
+
+from ..schemas.job import JobRead
+from ..services.jobs import Job, job_queue
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+
+def _job_or_404(job: Job | None) -> Job:
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.get("/{job_id}", response_model=JobRead)
+def read_job(job_id: str):
+    return _job_or_404(job_queue.get(job_id)).to_dict()
+
+
+@router.post("/{job_id}/cancel", response_model=JobRead)
+def cancel_job(job_id: str):
+    return _job_or_404(job_queue.cancel(job_id)).to_dict()
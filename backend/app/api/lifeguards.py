@@ -2,22 +2,34 @@ from fastapi import APIRouter, Depends, HTTPException, UploadFile
 from fastapi.responses import StreamingResponse
 from sqlmodel import Session, select
 
-from ..core.deps import get_session
+from ..core.deps import get_read_session, get_session, stream_with_session
+from ..core.responses import rows_response
 from ..models.lifeguard import Lifeguard
-from ..schemas.lifeguard import LifeguardCreate, LifeguardRead, LifeguardUpdate
-from ..services.import_export import export_lifeguards_to_csv, load_lifeguards_from_csv
+from ..models.site import DEFAULT_SITE
+from ..schemas.lifeguard import LifeguardBulkUpdate, LifeguardCreate, LifeguardRead, LifeguardUpdate
+from ..services.import_export import iter_lifeguards_csv, load_lifeguards_from_csv
+from ..services.result_cache import invalidate_allocation_cache
+from ..services.roster import bulk_update
 
 router = APIRouter(prefix="/lifeguards", tags=["lifeguards"])
 
 
 @router.get("", response_model=list[LifeguardRead])
-def list_lifeguards(present: bool | None = None, q: str | None = None, session: Session = Depends(get_session)):
-    statement = select(Lifeguard)
+def list_lifeguards(
+    present: bool | None = None,
+    q: str | None = None,
+    site: str | None = None,
+    session: Session = Depends(get_read_session),
+):
+    fields = LifeguardRead.model_fields
+    statement = select(*(getattr(Lifeguard, field) for field in fields))
+    if site is not None:
+        statement = statement.where(Lifeguard.site == site)
     if present is not None:
         statement = statement.where(Lifeguard.present == present)
     if q:
         statement = statement.where(Lifeguard.name.contains(q))
-    return session.exec(statement).all()
+    return rows_response(fields, session.exec(statement))
 
 
 @router.post("", response_model=LifeguardRead)
@@ -25,10 +37,24 @@ def create_lifeguard(payload: LifeguardCreate, session: Session = Depends(get_se
     guard = Lifeguard(**payload.dict())
     session.add(guard)
     session.commit()
+    invalidate_allocation_cache()
     session.refresh(guard)
     return guard
 
 
+@router.patch("")
+def bulk_update_lifeguards(
+    payload: list[LifeguardBulkUpdate], site: str = DEFAULT_SITE, session: Session = Depends(get_session)
+):
+    """Apply many partial updates to rows of ``site`` at once; nothing is written unless every item resolves."""
+    try:
+        updated = bulk_update(session, Lifeguard, [item.model_dump(exclude_unset=True) for item in payload], site=site)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+    invalidate_allocation_cache()
+    return {"ok": True, "updated": updated}
+
+
 @router.put("/{guard_id}", response_model=LifeguardRead)
 def update_lifeguard(guard_id: int, payload: LifeguardUpdate, session: Session = Depends(get_session)):
     guard = session.get(Lifeguard, guard_id)
@@ -38,6 +64,7 @@ def update_lifeguard(guard_id: int, payload: LifeguardUpdate, session: Session =
         setattr(guard, key, value)
     session.add(guard)
     session.commit()
+    invalidate_allocation_cache()
     session.refresh(guard)
     return guard
 
@@ -49,16 +76,26 @@ def delete_lifeguard(guard_id: int, session: Session = Depends(get_session)):
         raise HTTPException(status_code=404, detail="Guard not found")
     session.delete(guard)
     session.commit()
+    invalidate_allocation_cache()
     return {"ok": True}
 
 
 @router.post("/import")
-def import_lifeguards(file: UploadFile, session: Session = Depends(get_session)):
-    load_lifeguards_from_csv(file, session)
-    return {"ok": True}
+def import_lifeguards(
+    file: UploadFile, dry_run: bool = False, site: str = DEFAULT_SITE, session: Session = Depends(get_session)
+):
+    """Upsert rows of ``site`` by name; ``dry_run`` reports the diff without writing."""
+    summary = load_lifeguards_from_csv(file, session, dry_run=dry_run, site=site)
+    if not dry_run:
+        invalidate_allocation_cache()
+    return {"ok": True, **summary}
 
 
 @router.get("/export")
-def export_lifeguards(session: Session = Depends(get_session)):
-    csv_bytes = export_lifeguards_to_csv(session)
-    return StreamingResponse(iter([csv_bytes]), media_type="text/csv", headers={"Content-Disposition": "attachment; filename=lifeguards.csv"})
+def export_lifeguards(site: str = DEFAULT_SITE):
+    """CSV of one site's rows, in the shape ``/import`` reads back for the same ``site``."""
+    return StreamingResponse(
+        stream_with_session(iter_lifeguards_csv, site=site),
+        media_type="text/csv",
+        headers={"Content-Disposition": "attachment; filename=lifeguards.csv"},
+    )
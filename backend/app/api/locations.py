@@ -2,20 +2,29 @@ from fastapi import APIRouter, Depends, HTTPException, UploadFile
 from fastapi.responses import StreamingResponse
 from sqlmodel import Session, select
 
-from ..core.deps import get_session
+from ..core.deps import get_read_session, get_session, stream_with_session
+from ..core.responses import rows_response
 from ..models.location import Location
-from ..schemas.location import LocationCreate, LocationRead, LocationUpdate
-from ..services.import_export import export_locations_to_csv, load_locations_from_csv
+from ..models.site import DEFAULT_SITE
+from ..schemas.location import LocationBulkUpdate, LocationCreate, LocationRead, LocationUpdate
+from ..services.import_export import iter_locations_csv, load_locations_from_csv
+from ..services.result_cache import invalidate_allocation_cache
+from ..services.roster import bulk_update
 
 router = APIRouter(prefix="/locations", tags=["locations"])
 
 
 @router.get("", response_model=list[LocationRead])
-def list_locations(active_today: bool | None = None, session: Session = Depends(get_session)):
-    statement = select(Location)
+def list_locations(
+    active_today: bool | None = None, site: str | None = None, session: Session = Depends(get_read_session)
+):
+    fields = LocationRead.model_fields
+    statement = select(*(getattr(Location, field) for field in fields))
+    if site is not None:
+        statement = statement.where(Location.site == site)
     if active_today is not None:
         statement = statement.where(Location.active_today == active_today)
-    return session.exec(statement).all()
+    return rows_response(fields, session.exec(statement))
 
 
 @router.post("", response_model=LocationRead)
@@ -23,10 +32,24 @@ def create_location(payload: LocationCreate, session: Session = Depends(get_sess
     location = Location(**payload.dict())
     session.add(location)
     session.commit()
+    invalidate_allocation_cache()
     session.refresh(location)
     return location
 
 
+@router.patch("")
+def bulk_update_locations(
+    payload: list[LocationBulkUpdate], site: str = DEFAULT_SITE, session: Session = Depends(get_session)
+):
+    """Apply many partial updates to rows of ``site`` at once; nothing is written unless every item resolves."""
+    try:
+        updated = bulk_update(session, Location, [item.model_dump(exclude_unset=True) for item in payload], site=site)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+    invalidate_allocation_cache()
+    return {"ok": True, "updated": updated}
+
+
 @router.put("/{location_id}", response_model=LocationRead)
 def update_location(location_id: int, payload: LocationUpdate, session: Session = Depends(get_session)):
     location = session.get(Location, location_id)
@@ -36,6 +59,7 @@ def update_location(location_id: int, payload: LocationUpdate, session: Session
         setattr(location, key, value)
     session.add(location)
     session.commit()
+    invalidate_allocation_cache()
     session.refresh(location)
     return location
 
@@ -47,16 +71,26 @@ def delete_location(location_id: int, session: Session = Depends(get_session)):
         raise HTTPException(status_code=404, detail="Location not found")
     session.delete(location)
     session.commit()
+    invalidate_allocation_cache()
     return {"ok": True}
 
 
 @router.post("/import")
-def import_locations(file: UploadFile, session: Session = Depends(get_session)):
-    load_locations_from_csv(file, session)
-    return {"ok": True}
+def import_locations(
+    file: UploadFile, dry_run: bool = False, site: str = DEFAULT_SITE, session: Session = Depends(get_session)
+):
+    """Upsert rows of ``site`` by name; ``dry_run`` reports the diff without writing."""
+    summary = load_locations_from_csv(file, session, dry_run=dry_run, site=site)
+    if not dry_run:
+        invalidate_allocation_cache()
+    return {"ok": True, **summary}
 
 
 @router.get("/export")
-def export_locations(session: Session = Depends(get_session)):
-    csv_bytes = export_locations_to_csv(session)
-    return StreamingResponse(iter([csv_bytes]), media_type="text/csv", headers={"Content-Disposition": "attachment; filename=locations.csv"})
+def export_locations(site: str = DEFAULT_SITE):
+    """CSV of one site's rows, in the shape ``/import`` reads back for the same ``site``."""
+    return StreamingResponse(
+        stream_with_session(iter_locations_csv, site=site),
+        media_type="text/csv",
+        headers={"Content-Disposition": "attachment; filename=locations.csv"},
+    )
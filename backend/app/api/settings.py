@@ -2,38 +2,32 @@ from fastapi import APIRouter, Depends, HTTPException, UploadFile
 from fastapi.responses import StreamingResponse
 from sqlmodel import Session
 
-from ..core.deps import get_session
-from ..models.setting import Setting
+from ..core.deps import get_read_session, get_session
+from ..models.site import DEFAULT_SITE
 from ..schemas.setting import SettingRead, SettingUpdate
-from ..services.import_export import export_settings_to_yaml, load_settings_from_yaml
+from ..services.import_export import export_settings_to_yaml, load_settings_from_yaml, setting_to_dict
+from ..services.result_cache import invalidate_allocation_cache
+from ..services.settings_snapshot import (
+    invalidate_settings_cache,
+    load_setting,
+    new_setting,
+    settings_snapshot,
+)
 
 router = APIRouter(prefix="/settings", tags=["settings"])
 
 
 @router.get("", response_model=SettingRead)
-def get_settings(session: Session = Depends(get_session)):
-    setting = session.get(Setting, 1)
-    if not setting:
+def get_settings(site: str = DEFAULT_SITE, session: Session = Depends(get_read_session)):
+    snapshot = settings_snapshot(session, site)
+    if not snapshot:
         raise HTTPException(status_code=404, detail="Settings not configured")
-    return SettingRead(
-        start=setting.start,
-        end=setting.end,
-        shift_hours=setting.shift_hours,
-        special_hours=setting.special_hours,
-        lunch_min=setting.lunch_min,
-        dinner_min=setting.dinner_min,
-        shower_min=setting.shower_min,
-        max_concurrent_lunch=setting.max_concurrent_lunch,
-        check_windows_min=setting.check_windows,
-        check_window_len_min=setting.check_window_len_min,
-    )
+    return setting_to_dict(snapshot)
 
 
 @router.put("", response_model=SettingRead)
-def update_settings(payload: SettingUpdate, session: Session = Depends(get_session)):
-    setting = session.get(Setting, 1)
-    if not setting:
-        setting = Setting(id=1)
+def update_settings(payload: SettingUpdate, site: str = DEFAULT_SITE, session: Session = Depends(get_session)):
+    setting = load_setting(session, site) or new_setting(session, site)
     setting.start = payload.start
     setting.end = payload.end
     setting.shift_hours = payload.shift_hours
@@ -46,19 +40,22 @@ def update_settings(payload: SettingUpdate, session: Session = Depends(get_sessi
     setting.check_window_len_min = payload.check_window_len_min
     session.add(setting)
     session.commit()
-    session.refresh(setting)
-    return get_settings(session)
+    invalidate_settings_cache()
+    invalidate_allocation_cache()
+    return get_settings(site, session)
 
 
 @router.post("/import")
-def import_settings(file: UploadFile, session: Session = Depends(get_session)):
-    load_settings_from_yaml(file, session)
+def import_settings(file: UploadFile, site: str = DEFAULT_SITE, session: Session = Depends(get_session)):
+    load_settings_from_yaml(file, session, site)
+    invalidate_settings_cache()
+    invalidate_allocation_cache()
     return {"ok": True}
 
 
 @router.get("/export")
-def export_settings(session: Session = Depends(get_session)):
-    yaml_bytes = export_settings_to_yaml(session)
+def export_settings(site: str = DEFAULT_SITE, session: Session = Depends(get_read_session)):
+    yaml_bytes = export_settings_to_yaml(session, site)
     return StreamingResponse(
         iter([yaml_bytes]),
         media_type="application/x-yaml",
@@ -0,0 +1,64 @@
+"""Maintenance commands. Run from ``backend/``::
+
+    python -m app.cli rebuild-workload                      # every site, all history
+    python -m app.cli rebuild-workload --site pool --since 1403/01/01
+    python -m app.cli archive-history                       # every month before the current one
+    python -m app.cli archive-history --site pool --before 1403/07 --vacuum
+"""
+from __future__ import annotations
+
+import argparse
+import re
+import time
+
+from sqlalchemy import text
+
+from .db import engine, init_db, session_scope
+from .services.history_archive import archive_history
+from .services.workload import rebuild_workload
+
+
+def _rebuild_workload(args: argparse.Namespace) -> None:
+    began = time.perf_counter()
+    with session_scope() as session:
+        written = rebuild_workload(session, site=args.site, since=args.since)
+    print(f"rebuilt {written} workload rows in {time.perf_counter() - began:.2f}s")
+
+
+def _month(value: str) -> str:
+    if not re.fullmatch(r"\d{4}/\d{2}", value):
+        raise argparse.ArgumentTypeError("expected a Jalali month like 1403/07")
+    return value
+
+
+def _archive_history(args: argparse.Namespace) -> None:
+    began = time.perf_counter()
+    with session_scope() as session:
+        months = archive_history(session, site=args.site, before=args.before)
+    for month in months:
+        print(f"{month['site']} {month['month']}: {month['rows']} rows -> {month['path']}")
+    if args.vacuum and months:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.execute(text("VACUUM"))
+    print(f"archived {sum(month['rows'] for month in months)} rows in {time.perf_counter() - began:.2f}s")
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="Maintenance commands.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    rebuild = commands.add_parser("rebuild-workload", help="recompute guard workload totals from shift history")
+    rebuild.add_argument("--site", help="only this site (default: every site with history)")
+    rebuild.add_argument("--since", help="only history on or after this Jalali date, e.g. 1403/01/01")
+    rebuild.set_defaults(handler=_rebuild_workload)
+    archive = commands.add_parser("archive-history", help="move closed months of shift history into gzip archives")
+    archive.add_argument("--site", help="only this site (default: every site)")
+    archive.add_argument("--before", type=_month, help="archive months before this one (default: the current month)")
+    archive.add_argument("--vacuum", action="store_true", help="VACUUM the database afterwards to reclaim the space")
+    archive.set_defaults(handler=_archive_history)
+    args = parser.parse_args(argv)
+    init_db()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
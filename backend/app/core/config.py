@@ -9,6 +9,30 @@ class Settings(BaseSettings):
     app_name: str = "Lifeguard Shift Manager"
     database_url: str = Field(default="sqlite:///./lifeguards.db", alias="DATABASE_URL")
     cors_origins: List[str] = Field(default_factory=lambda: ["*"])
+    sqlite_journal_mode: str = Field(default="wal", alias="SQLITE_JOURNAL_MODE", pattern="^(wal|delete|truncate|persist|memory)$")
+    sqlite_synchronous: str = Field(default="normal", alias="SQLITE_SYNCHRONOUS", pattern="^(off|normal|full|extra)$")
+    sqlite_cache_size_kib: int = Field(default=65536, alias="SQLITE_CACHE_SIZE_KIB", ge=0)
+    sqlite_mmap_size_mib: int = Field(default=256, alias="SQLITE_MMAP_SIZE_MIB", ge=0)
+    sqlite_busy_timeout_ms: int = Field(default=5000, alias="SQLITE_BUSY_TIMEOUT_MS", ge=0)
+    db_writer_pool_size: int = Field(default=4, alias="DB_WRITER_POOL_SIZE", ge=1)
+    db_reader_pool_size: int = Field(default=8, alias="DB_READER_POOL_SIZE", ge=1)
+    db_pool_timeout_s: float = Field(default=30.0, alias="DB_POOL_TIMEOUT_S", gt=0)
+    allocation_workers: int = Field(default=4, alias="ALLOCATION_WORKERS")
+    max_batch_days: int = Field(default=31, alias="MAX_BATCH_DAYS")
+    run_store_max_runs: int = Field(default=50, alias="RUN_STORE_MAX_RUNS")
+    run_store_max_age_days: int = Field(default=30, alias="RUN_STORE_MAX_AGE_DAYS")
+    allocation_cache_size: int = Field(default=32, alias="ALLOCATION_CACHE_SIZE")
+    allocation_solver: str = Field(default="greedy", alias="ALLOCATION_SOLVER", pattern="^(greedy|matching)$")
+    fairness_weight: int = Field(default=1, alias="FAIRNESS_WEIGHT", ge=0)
+    fairness_unit_min: int = Field(default=240, alias="FAIRNESS_UNIT_MIN", gt=0)
+    history_archive_dir: str = Field(default="./history_archive", alias="HISTORY_ARCHIVE_DIR")
+    setting_cache_ttl_s: float = Field(default=60.0, alias="SETTING_CACHE_TTL_S", ge=0)
+    job_workers: int = Field(default=2, alias="JOB_WORKERS", ge=1)
+    job_queue_size: int = Field(default=32, alias="JOB_QUEUE_SIZE", ge=1)
+    job_history_size: int = Field(default=100, alias="JOB_HISTORY_SIZE", ge=0)
+    gzip_min_bytes: int = Field(default=1024, alias="GZIP_MIN_BYTES", ge=0)
+    gzip_level: int = Field(default=5, alias="GZIP_LEVEL", ge=1, le=9)
+    metrics_enabled: bool = Field(default=True, alias="METRICS_ENABLED")
 
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8")
 
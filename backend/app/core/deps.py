@@ -1,8 +1,8 @@
-from collections.abc import Generator
+from collections.abc import Callable, Generator, Iterator
 from sqlmodel import Session
 
 from .config import get_settings
-from ..db import engine
+from ..db import engine, read_engine
 
 
 def get_session() -> Generator[Session, None, None]:
@@ -10,5 +10,22 @@ def get_session() -> Generator[Session, None, None]:
         yield session
 
 
+def get_read_session() -> Generator[Session, None, None]:
+    """Session from the read-only pool, for handlers that never write."""
+    with Session(read_engine) as session:
+        yield session
+
+
+def stream_with_session(produce: Callable[..., Iterator[bytes]], *args, **kwargs) -> Iterator[bytes]:
+    """Run a streaming producer on its own session.
+
+    Request-scoped sessions are closed before a ``StreamingResponse`` body is
+    consumed, so streamed bodies must not borrow them. Streams only read, so
+    they use the reader pool.
+    """
+    with Session(read_engine) as session:
+        yield from produce(session, *args, **kwargs)
+
+
 def get_cors_origins() -> list[str]:
     return get_settings().cors_origins
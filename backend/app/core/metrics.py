@@ -0,0 +1,129 @@
+"""Minimal in-process metrics: Prometheus-text histograms and Server-Timing.
+
+Nothing here is active unless ``Settings.metrics_enabled`` is set; with it
+off, the middleware is not installed, no query hooks are registered and the
+``observe_*`` helpers return immediately.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, Iterable, Mapping, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .config import get_settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (10, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+RATIO_BUCKETS = (0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99, 1.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0)
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float], labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # per-bucket counts (+Inf last), then sum
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            snapshot = {key: list(series) for key, series in self._series.items()}
+        for key, series in sorted(snapshot.items()):
+            labels = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key)]
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), series[:-1]):
+                cumulative += count
+                bucket_labels = ",".join([*labels, f'le="{bound}"'])
+                yield f"{self.name}_bucket{{{bucket_labels}}} {cumulative}"
+            suffix = f"{{{','.join(labels)}}}" if labels else ""
+            yield f"{self.name}_sum{suffix} {series[-1]}"
+            yield f"{self.name}_count{suffix} {cumulative}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency.", LATENCY_BUCKETS, ("method", "route", "status")
+)
+ALLOCATION_PHASE = Histogram(
+    "allocation_phase_duration_seconds", "Time spent per AllocationEngine phase.", LATENCY_BUCKETS, ("phase",)
+)
+ALLOCATION_SIZE = Histogram("allocation_assignments", "Schedule entries produced per allocation.", SIZE_BUCKETS)
+SLOT_FILL_RATE = Histogram("allocation_slot_fill_ratio", "Share of shift slots that received a guard.", RATIO_BUCKETS)
+DB_QUERY_TIME = Histogram("db_query_duration_seconds", "Time spent executing SQL statements.", QUERY_BUCKETS)
+
+REGISTRY = (REQUEST_LATENCY, ALLOCATION_PHASE, ALLOCATION_SIZE, SLOT_FILL_RATE, DB_QUERY_TIME)
+
+_server_timing: ContextVar[Optional[Dict[str, float]]] = ContextVar("server_timing", default=None)
+
+
+def metrics_enabled() -> bool:
+    return get_settings().metrics_enabled
+
+
+def render_metrics() -> str:
+    return "\n".join(line for histogram in REGISTRY for line in histogram.render()) + "\n"
+
+
+def begin_request_timing() -> Dict[str, float]:
+    timings: Dict[str, float] = {}
+    _server_timing.set(timings)
+    return timings
+
+
+def record_timing(name: str, seconds: float) -> None:
+    """Add ``seconds`` to the current request's Server-Timing entry ``name``."""
+    timings = _server_timing.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+def format_server_timing(timings: Mapping[str, float]) -> str:
+    return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in timings.items())
+
+
+def observe_allocation(timings: Mapping[str, float], assignments: int, slots: int, filled: int) -> None:
+    if not metrics_enabled():
+        return
+    for phase, seconds in timings.items():
+        ALLOCATION_PHASE.observe(seconds, phase=phase)
+        record_timing(phase, seconds)
+    ALLOCATION_SIZE.observe(assignments)
+    if slots:
+        SLOT_FILL_RATE.observe(filled / slots)
+
+
+def install_query_timer(bind: Engine) -> None:
+    """Time every statement on ``bind`` into ``DB_QUERY_TIME`` and Server-Timing ``db``."""
+
+    @event.listens_for(bind, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(bind, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        DB_QUERY_TIME.observe(elapsed)
+        record_timing("db", elapsed)
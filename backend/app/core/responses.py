@@ -0,0 +1,53 @@
+"""JSON rendering for large responses.
+
+``FastJSONResponse`` encodes with ``orjson`` when it is installed and with
+the stdlib ``json`` module otherwise; both produce the same document. Routes
+that build their payload from data that already has the response model's
+shape (engine results, stored runs, whole table rows) return it directly,
+which skips FastAPI's per-item validation of ``response_model``; the model
+still documents the route in OpenAPI.
+"""
+from __future__ import annotations
+
+import json
+from datetime import date, datetime, time
+from typing import Any, Iterable
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - exercised only where orjson is missing
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if hasattr(value, "item"):  # numpy scalars
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps_stdlib(content: Any) -> bytes:
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+if orjson is not None:
+
+    def dumps(content: Any) -> bytes:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+
+else:
+    dumps = dumps_stdlib
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def rows_response(fields: Iterable[str], rows: Iterable[tuple]) -> FastJSONResponse:
+    """JSON list of objects from column tuples selected in ``fields`` order."""
+    fields = tuple(fields)
+    return FastJSONResponse([dict(zip(fields, row)) for row in rows])
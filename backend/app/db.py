@@ -2,12 +2,65 @@ from contextlib import contextmanager
 from pathlib import Path
 from typing import Iterator
 
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import StaticPool
 from sqlmodel import SQLModel, create_engine
 
-from .core.config import get_settings
+from .core.config import Settings, get_settings
 
 settings = get_settings()
-engine = create_engine(settings.database_url, echo=False, connect_args={"check_same_thread": False})
+
+
+def configure_sqlite(db_engine: Engine, profile: Settings, read_only: bool = False) -> Engine:
+    """Apply the SQLite performance profile to every new connection of ``db_engine``.
+
+    WAL lets readers keep going while a writer commits; the journal mode is
+    stored in the database file, the other pragmas are per connection.
+    """
+    if db_engine.dialect.name != "sqlite":
+        return db_engine
+
+    @event.listens_for(db_engine, "connect")
+    def _set_pragmas(dbapi_connection, _record) -> None:
+        cursor = dbapi_connection.cursor()
+        if not read_only:
+            cursor.execute(f"PRAGMA journal_mode={profile.sqlite_journal_mode}")
+        cursor.execute(f"PRAGMA synchronous={profile.sqlite_synchronous}")
+        cursor.execute(f"PRAGMA busy_timeout={profile.sqlite_busy_timeout_ms}")
+        cursor.execute(f"PRAGMA cache_size=-{profile.sqlite_cache_size_kib}")
+        cursor.execute(f"PRAGMA mmap_size={profile.sqlite_mmap_size_mib * 1024 * 1024}")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+    return db_engine
+
+
+def _create_engine(pool_size: int, read_only: bool = False) -> Engine:
+    options = {"pool_size": pool_size, "max_overflow": 0, "pool_timeout": settings.db_pool_timeout_s}
+    db_engine = create_engine(
+        settings.database_url, echo=False, connect_args={"check_same_thread": False}, **options
+    )
+    return configure_sqlite(db_engine, settings, read_only=read_only)
+
+
+def _is_memory_database(url: str) -> bool:
+    parsed = make_url(url)
+    return parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:")
+
+
+if _is_memory_database(settings.database_url):
+    # Every connection to ``:memory:`` is its own database, so one
+    # single-connection engine has to serve reads and writes alike.
+    engine = read_engine = create_engine(
+        settings.database_url, echo=False, connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+else:
+    # Writers and readers get separate pools: a burst of writes queues for
+    # the small writer pool instead of starving reads of connections.
+    engine = _create_engine(settings.db_writer_pool_size)
+    read_engine = _create_engine(settings.db_reader_pool_size, read_only=True)
 
 
 @contextmanager
@@ -26,9 +79,46 @@ def session_scope() -> Iterator:
 
 
 def init_db() -> None:
-    from .models import lifeguard, location, setting, shift_history  # noqa: F401
+    from .models import (  # noqa: F401
+        allocation_run,
+        background_job,
+        guard_workload,
+        lifeguard,
+        location,
+        setting,
+        shift_history,
+    )
 
     SQLModel.metadata.create_all(engine)
+    upgrade_schema(engine)
+
+
+def upgrade_schema(bind: Engine) -> None:
+    """Bring databases created by older releases up to the current schema.
+
+    ``create_all`` only creates missing tables, so columns and indexes added
+    to existing tables later are created here. Every step is idempotent.
+    """
+    inspector = inspect(bind)
+    existing = set(inspector.get_table_names())
+    for table in SQLModel.metadata.sorted_tables:
+        if table.name not in existing:
+            continue
+        present = {column["name"] for column in inspector.get_columns(table.name)}
+        with bind.begin() as conn:
+            for column in table.columns:
+                if column.name not in present:
+                    conn.execute(text(_add_column_sql(bind, table.name, column)))
+        for index in table.indexes:
+            index.create(bind, checkfirst=True)
+
 
+def _add_column_sql(bind: Engine, table_name: str, column) -> str:
+    preparer = bind.dialect.identifier_preparer
+    sql = f"ALTER TABLE {preparer.quote(table_name)} ADD COLUMN {preparer.quote(column.name)} {column.type.compile(bind.dialect)}"
+    if column.server_default is not None:
+        default = column.server_default.arg
+        sql += f" DEFAULT {default.text if hasattr(default, 'text') else repr(default)}"
+    return sql
 
 DATA_DIR = Path(__file__).resolve().parent / "seeds"
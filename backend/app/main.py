@@ -1,13 +1,21 @@
-from fastapi import FastAPI
+import time
+
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import PlainTextResponse
 
-from .api import allocation, lifeguards, locations, settings
+from .api import allocation, jobs, lifeguards, locations, settings
+from .core import metrics
+from .core.config import get_settings
 from .core.deps import get_cors_origins
-from .db import init_db, session_scope
+from .core.responses import FastJSONResponse
+from .db import engine, init_db, read_engine, session_scope
 from .services.import_export import seed_if_empty
+from .services.jobs import job_queue
 
 
-app = FastAPI(title="Lifeguard Shift Manager", version="1.0.0")
+app = FastAPI(title="Lifeguard Shift Manager", version="1.0.0", default_response_class=FastJSONResponse)
 
 origins = get_cors_origins()
 app.add_middleware(
@@ -17,9 +25,35 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Compresses JSON and the CSV/NDJSON streams alike; GZIP_MIN_BYTES=0 turns it off.
+config = get_settings()
+if config.gzip_min_bytes:
+    app.add_middleware(GZipMiddleware, minimum_size=config.gzip_min_bytes, compresslevel=config.gzip_level)
 
 init_db()
 
+if metrics.metrics_enabled():
+    metrics.install_query_timer(engine)
+    if read_engine is not engine:
+        metrics.install_query_timer(read_engine)
+
+    @app.middleware("http")
+    async def server_timing(request: Request, call_next):
+        timings = metrics.begin_request_timing()
+        began = time.perf_counter()
+        response = await call_next(request)
+        elapsed = time.perf_counter() - began
+        route = request.scope.get("route")
+        metrics.REQUEST_LATENCY.observe(
+            elapsed,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=str(response.status_code),
+        )
+        timings["total"] = elapsed
+        response.headers["Server-Timing"] = metrics.format_server_timing(timings)
+        return response
+
 
 @app.on_event("startup")
 async def startup_event() -> None:
@@ -27,12 +61,25 @@ async def startup_event() -> None:
         seed_if_empty(session)
 
 
+@app.on_event("shutdown")
+def shutdown_event() -> None:
+    job_queue.shutdown()
+
+
 app.include_router(lifeguards.router, prefix="/api/v1")
 app.include_router(locations.router, prefix="/api/v1")
 app.include_router(settings.router, prefix="/api/v1")
 app.include_router(allocation.router, prefix="/api/v1")
+app.include_router(jobs.router, prefix="/api/v1")
 
 
 @app.get("/healthz")
 async def healthz() -> dict[str, str]:
     return {"status": "ok"}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics() -> PlainTextResponse:
+    if not metrics.metrics_enabled():
+        raise HTTPException(status_code=404, detail="Metrics disabled")
+    return PlainTextResponse(metrics.render_metrics(), media_type="text/plain; version=0.0.4")
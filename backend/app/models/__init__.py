@@ -1,6 +1,19 @@
+from .allocation_run import AllocationRun
+from .background_job import BackgroundJob
+from .guard_workload import GuardWorkload
 from .lifeguard import Lifeguard
 from .location import Location
 from .setting import Setting
 from .shift_history import ShiftHistory
+from .site import DEFAULT_SITE
 
-__all__ = ["Lifeguard", "Location", "Setting", "ShiftHistory"]
+__all__ = [
+    "DEFAULT_SITE",
+    "AllocationRun",
+    "BackgroundJob",
+    "GuardWorkload",
+    "Lifeguard",
+    "Location",
+    "Setting",
+    "ShiftHistory",
+]
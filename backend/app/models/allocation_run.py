@@ -0,0 +1,18 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlmodel import Field, SQLModel
+
+from .site import site_field
+
+
+class AllocationRun(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    date_jalali: str = Field(index=True)
+    site: str = site_field()
+    caption: str
+    wide: str = Field(description="packed JSON: {columns, rows}")
+    long: str = Field(description="packed JSON: {columns, rows}")
+    settings: str = Field(description="JSON snapshot of the Setting row used")
+    fingerprint: Optional[str] = Field(default=None, description="hash of the engine inputs")
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
@@ -0,0 +1,19 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlmodel import Field, SQLModel
+
+
+class BackgroundJob(SQLModel, table=True):
+    """Status of one ``JobQueue`` job, readable and cancellable from any worker process."""
+
+    id: str = Field(primary_key=True)
+    kind: str
+    status: str = Field(index=True)
+    done: int = Field(default=0)
+    total: Optional[int] = None
+    result: Optional[str] = Field(default=None, description="JSON of the job's return value")
+    error: Optional[str] = None
+    cancel_requested: bool = Field(default=False)
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    finished_at: Optional[datetime] = None
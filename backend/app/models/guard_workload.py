@@ -0,0 +1,29 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import Index
+from sqlmodel import Field, SQLModel
+
+from .site import DEFAULT_SITE
+
+
+class GuardWorkload(SQLModel, table=True):
+    """Running totals of one guard's assigned time, materialized from ``ShiftHistory``.
+
+    One row per ``(site, guard_name, dimension, key)``; ``dimension`` is
+    ``location``, ``difficulty`` or ``kind`` and ``key`` the location name,
+    difficulty level or assignment kind.
+    """
+
+    __table_args__ = (
+        Index("ux_guardworkload_site_guard_dimension_key", "site", "guard_name", "dimension", "key", unique=True),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    site: str = Field(default=DEFAULT_SITE, sa_column_kwargs={"server_default": DEFAULT_SITE})
+    guard_name: str
+    dimension: str
+    key: str
+    minutes: int = Field(default=0)
+    shifts: int = Field(default=0)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
@@ -3,10 +3,13 @@ from typing import Optional
 
 from sqlmodel import Field, SQLModel
 
+from .site import site_field
+
 
 class Lifeguard(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str = Field(index=True)
+    site: str = site_field()
     present: bool = Field(default=True)
     team: Optional[str] = None
     experience: str = Field(description="expert|medium|low")
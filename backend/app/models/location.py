@@ -2,10 +2,13 @@ from typing import Optional
 
 from sqlmodel import Field, SQLModel
 
+from .site import site_field
+
 
 class Location(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str = Field(index=True)
+    site: str = site_field()
     difficulty: str = Field(default="medium")
     is_water: bool = Field(default=False)
     active_today: bool = Field(default=True)
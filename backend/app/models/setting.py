@@ -1,8 +1,11 @@
 from sqlmodel import Field, SQLModel
 
+from .site import site_field
+
 
 class Setting(SQLModel, table=True):
     id: int = Field(default=1, primary_key=True)
+    site: str = site_field(unique=True)
     start: str = Field(default="09:00")
     end: str = Field(default="22:00")
     shift_hours: float = Field(default=2.0)
@@ -1,12 +1,25 @@
 from datetime import datetime
 from typing import Optional
 
+from sqlalchemy import Index
 from sqlmodel import Field, SQLModel
 
+from .site import DEFAULT_SITE
+
 
 class ShiftHistory(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_shifthistory_date_guard_location", "date_jalali", "guard_name", "location_name"),
+        # SQLite appends the rowid to every index, so these also serve
+        # "guard = ? AND id > ? ORDER BY id" keyset pages.
+        Index("ix_shifthistory_guard", "guard_name"),
+        Index("ix_shifthistory_location", "location_name"),
+        Index("ix_shifthistory_site_date", "site", "date_jalali"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     date_jalali: str
+    site: str = Field(default=DEFAULT_SITE, sa_column_kwargs={"server_default": DEFAULT_SITE})
     guard_name: str
     location_name: str
     start: str
@@ -0,0 +1,12 @@
+from sqlmodel import Field
+
+DEFAULT_SITE = "default"
+
+
+def site_field(**kwargs):
+    """``site`` column shared by the per-site tables.
+
+    The server default lets ``upgrade_schema`` add the column to databases
+    from single-site releases, whose rows all belong to ``DEFAULT_SITE``.
+    """
+    return Field(default=DEFAULT_SITE, index=True, sa_column_kwargs={"server_default": DEFAULT_SITE}, **kwargs)
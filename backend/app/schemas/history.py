@@ -1,7 +1,9 @@
 from datetime import datetime
 from typing import List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+from ..models.site import DEFAULT_SITE
 
 
 class ShiftHistoryRead(BaseModel):
@@ -12,11 +14,49 @@ class ShiftHistoryRead(BaseModel):
     start: str
     end: str
     kind: str
+    site: str
     created_at: datetime
 
 
+class HistoryArchiveRequest(BaseModel):
+    site: Optional[str] = None
+    before: Optional[str] = Field(default=None, pattern=r"^\d{4}/\d{2}$")
+
+
+class ArchivedMonth(BaseModel):
+    site: str
+    month: str
+    rows: int
+    path: str
+
+
+class HistoryArchiveResponse(BaseModel):
+    months: List[ArchivedMonth]
+    rows: int
+
+
 class AllocationRequest(BaseModel):
     date: Optional[str] = None
+    site: str = DEFAULT_SITE
+
+
+class AllocationRangeRequest(BaseModel):
+    start_date: str
+    end_date: str
+    site: str = DEFAULT_SITE
+    solver: Optional[str] = Field(default=None, pattern="^(greedy|matching)$")
+
+
+class AllocationSitesRequest(BaseModel):
+    date: Optional[str] = None
+    sites: Optional[List[str]] = None
+    workers: Optional[int] = Field(default=None, ge=1)
+    solver: Optional[str] = Field(default=None, pattern="^(greedy|matching)$")
+
+
+class RepairRequest(BaseModel):
+    guard: Optional[str] = None
+    location: Optional[str] = None
 
 
 class WideRow(BaseModel):
@@ -37,3 +77,44 @@ class AllocationResponse(BaseModel):
     team: List[dict]
     history: List[dict]
     caption: str
+    run_id: Optional[int] = None
+
+
+class RepairResponse(AllocationResponse):
+    removed: List[dict]
+    added: List[dict]
+
+
+class AllocationRunRead(BaseModel):
+    id: int
+    date_jalali: str
+    site: str
+    caption: str
+    created_at: datetime
+    wide: List[dict]
+    long: List[dict]
+    settings: dict
+
+
+class DayAllocation(AllocationResponse):
+    date: str
+    date_jalali: str
+    allocate_ms: float
+    persist_ms: float
+
+
+class AllocationRangeResponse(BaseModel):
+    days: List[DayAllocation]
+    elapsed_ms: float
+
+
+class SiteAllocation(DayAllocation):
+    site: str
+    timings_ms: dict[str, float]
+
+
+class AllocationSitesResponse(BaseModel):
+    date: str
+    sites: List[SiteAllocation]
+    workers: int
+    elapsed_ms: float
@@ -1,11 +1,14 @@
 from datetime import datetime
 from typing import Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
+
+from ..models.site import DEFAULT_SITE
 
 
 class LifeguardBase(BaseModel):
     name: str
+    site: str = DEFAULT_SITE
     present: bool = True
     team: Optional[str] = None
     experience: str = Field(pattern="^(expert|medium|low)$")
@@ -26,6 +29,7 @@ class LifeguardRead(LifeguardBase):
 
 class LifeguardUpdate(BaseModel):
     name: Optional[str] = None
+    site: Optional[str] = None
     present: Optional[bool] = None
     team: Optional[str] = None
     experience: Optional[str] = Field(default=None, pattern="^(expert|medium|low)$")
@@ -33,3 +37,21 @@ class LifeguardUpdate(BaseModel):
     lunch_at: Optional[str] = None
     backup_name: Optional[str] = None
     swap_at: Optional[str] = None
+
+
+class LifeguardBulkUpdate(LifeguardUpdate):
+    """One row of ``PATCH /lifeguards``: keyed by ``id``, or by ``name`` when no id is given.
+
+    Rows are looked up in the request's ``site``; moving a row to another
+    site is left to ``PUT``.
+    """
+
+    id: Optional[int] = None
+
+    @model_validator(mode="after")
+    def _has_key(self) -> "LifeguardBulkUpdate":
+        if self.id is None and not self.name:
+            raise ValueError("id or name is required")
+        if "site" in self.model_fields_set:
+            raise ValueError("site cannot be changed by a bulk update")
+        return self
@@ -1,10 +1,13 @@
 from typing import Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
+
+from ..models.site import DEFAULT_SITE
 
 
 class LocationBase(BaseModel):
     name: str
+    site: str = DEFAULT_SITE
     difficulty: str = Field(default="medium", pattern="^(easy|medium|hard)$")
     is_water: bool = False
     active_today: bool = True
@@ -20,6 +23,25 @@ class LocationRead(LocationBase):
 
 class LocationUpdate(BaseModel):
     name: Optional[str] = None
+    site: Optional[str] = None
     difficulty: Optional[str] = Field(default=None, pattern="^(easy|medium|hard)$")
     is_water: Optional[bool] = None
     active_today: Optional[bool] = None
+
+
+class LocationBulkUpdate(LocationUpdate):
+    """One row of ``PATCH /locations``: keyed by ``id``, or by ``name`` when no id is given.
+
+    Rows are looked up in the request's ``site``; moving a row to another
+    site is left to ``PUT``.
+    """
+
+    id: Optional[int] = None
+
+    @model_validator(mode="after")
+    def _has_key(self) -> "LocationBulkUpdate":
+        if self.id is None and not self.name:
+            raise ValueError("id or name is required")
+        if "site" in self.model_fields_set:
+            raise ValueError("site cannot be changed by a bulk update")
+        return self
@@ -1,63 +1,129 @@
 from __future__ import annotations
 
+import re
+from bisect import bisect_left, bisect_right
 from collections import defaultdict, deque
+from contextlib import contextmanager
 from dataclasses import dataclass
-from datetime import datetime, timedelta
-from typing import Dict, Iterable, List, Optional
+from datetime import date, datetime
+from time import perf_counter
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
 
 import jdatetime
-from sqlmodel import Session
+import numpy as np
+from sqlalchemy import delete, insert, tuple_
+from sqlmodel import Session, select
 
+from ..core.config import get_settings
 from ..models.lifeguard import Lifeguard
 from ..models.location import Location
-from ..models.setting import Setting
 from ..models.shift_history import ShiftHistory
+from ..models.site import DEFAULT_SITE
+from .assignment import min_cost_assignment
+from .history_archive import archived_history
+from .schedule import CHECK, CHECK_COLUMN, GENERAL, SLOT_COLUMN, WATER, Schedule, clock_text, history_entry
+from .settings_snapshot import SettingsSnapshot, clock_minutes, settings_snapshot
+from .workload import (
+    DIFFICULTY,
+    HISTORY_COLUMNS,
+    KIND,
+    apply_workload_delta,
+    history_dicts,
+    history_since,
+    load_workload,
+)
 
 
 @dataclass
 class GuardState:
+    """Per-guard bookings for one day.
+
+    Times are minutes after midnight. Busy time is kept as a bitmask over
+    ``resolution``-minute cells counted from ``origin`` (the opening time):
+    bit ``i`` covers ``[origin + i*resolution, origin + (i+1)*resolution)``.
+    Time before ``origin`` is clamped away. Zero-length blocks (swap instants)
+    go into ``points`` and only conflict with intervals that strictly contain
+    them, as before.
+    """
+
     guard: Lifeguard
-    assignments: List[tuple[datetime, datetime]]
-    breaks: List[tuple[datetime, datetime]]
-
-    def is_available(self, start: datetime, end: datetime) -> bool:
-        for b_start, b_end in self.breaks:
-            if not (end <= b_start or start >= b_end):
-                return False
-        for a_start, a_end in self.assignments:
-            if not (end <= a_start or start >= a_end):
-                return False
+    assignments: List[tuple[int, int]]
+    breaks: List[tuple[int, int]]
+    origin: int
+    resolution: int = 1
+    busy: int = 0
+    points: int = 0
+
+    def _cell(self, minute: int, *, ceil: bool = False) -> int:
+        offset = minute - self.origin
+        cell = -(-offset // self.resolution) if ceil else offset // self.resolution
+        return max(cell, 0)
+
+    def _span(self, start: int, end: int) -> int:
+        first = self._cell(start)
+        last = self._cell(end, ceil=True)
+        if last <= first:
+            return 0
+        return ((1 << (last - first)) - 1) << first
+
+    def _inner_span(self, start: int, end: int) -> int:
+        first = self._cell(start) + 1
+        last = self._cell(end, ceil=True)
+        if last <= first:
+            return 0
+        return ((1 << (last - first)) - 1) << first
+
+    def is_available(self, start: int, end: int) -> bool:
+        if self.busy & self._span(start, end):
+            return False
+        if self.points and self.points & self._inner_span(start, end):
+            return False
         return True
 
-    def assign(self, start: datetime, end: datetime) -> None:
+    def assign(self, start: int, end: int) -> None:
         self.assignments.append((start, end))
+        self.busy |= self._span(start, end)
 
-    def block(self, start: datetime, end: datetime) -> None:
+    def block(self, start: int, end: int) -> None:
         self.breaks.append((start, end))
+        if end <= start:
+            if start > self.origin:
+                self.points |= 1 << self._cell(start)
+            return
+        self.busy |= self._span(start, end)
 
 
 class AllocationContext:
-    def __init__(self, session: Session):
+    def __init__(self, session: Session, today: Optional[date] = None, site: str = DEFAULT_SITE):
         self.session = session
-        self.setting: Setting = session.get(Setting, 1)
+        self.site = site
+        self.setting: SettingsSnapshot = settings_snapshot(session, site)
         if not self.setting:
-            raise ValueError("Settings missing")
-        self.today = datetime.now().date()
-        self.start_dt = datetime.combine(self.today, datetime.strptime(self.setting.start, "%H:%M").time())
-        self.end_dt = datetime.combine(self.today, datetime.strptime(self.setting.end, "%H:%M").time())
-        self.history_rows: List[dict] = []
-        self.wide_rows: List[dict] = []
-        self.long_rows: List[dict] = []
-        self.caption = ""
-        self.generated_wide_header: List[str] = []
-        self.generated_check_header: List[str] = []
-        self.last_allocation_cache: Dict[str, List[dict]] = {}
+            raise ValueError(f"Settings missing for site {site!r}")
+        self.today = today or datetime.now().date()
+        # Opening and closing time in minutes after midnight, the engine's time unit.
+        self.start = self.setting.start_min
+        self.end = self.setting.end_min
 
     def jalali_today(self) -> str:
-        today_j = jdatetime.datetime.fromgregorian(date=self.today)
-        return today_j.strftime("%Y/%m/%d")
+        return jalali_date(self.today)
+
+
+def parse_day(value: str) -> date:
+    """Parse ``YYYY-MM-DD`` (Gregorian) or ``YYYY/MM/DD`` (Jalali) into a date."""
+    value = value.strip()
+    if "/" in value:
+        return jdatetime.datetime.strptime(value, "%Y/%m/%d").togregorian().date()
+    return date.fromisoformat(value)
 
 
+def jalali_date(day: date) -> str:
+    return jdatetime.datetime.fromgregorian(date=day).strftime("%Y/%m/%d")
+
+
+AVAILABILITY_RESOLUTION_MIN = 1
+DINNER_START = "17:00"
+
 SKILL_TO_DIFFICULTY = {
     "expert": {"easy", "medium", "hard"},
     "medium": {"easy", "medium"},
@@ -70,39 +136,256 @@ ROLE_PRIORITY = {
     "ناجی چک": 2,
 }
 
+SOLVERS = ("greedy", "matching")
+# Cost tiers for the matching solver: eligible scores start at -1, fallback
+# edges are always dearer than any eligible one.
+MATCHING_PRIMARY_SHIFT = 2
+MATCHING_FALLBACK_TIER = 200
+
+SLOT_HEADER_RANGE = re.compile(r"\((\d{2}:\d{2})-(\d{2}:\d{2})\)$")
+
 CHECK_PRIORITY = {
     "ناجی چک": 0,
     "سر ناجی": 1,
     "ناجی": 2,
 }
 
+# Integer codes for the vectorised scorer. ``SKILL_TO_DIFFICULTY`` is nested
+# (easy ⊂ medium ⊂ hard), so "can cover" reduces to ``level >= difficulty``.
+DIFFICULTY_LEVEL = {"easy": 0, "medium": 1, "hard": 2}
+EXPERIENCE_LEVEL = {
+    experience: max(DIFFICULTY_LEVEL[difficulty] for difficulty in allowed)
+    for experience, allowed in SKILL_TO_DIFFICULTY.items()
+}
+UNKNOWN_DIFFICULTY_LEVEL = len(DIFFICULTY_LEVEL)
+MISMATCH_SCORE = 99
+# The fairness term only orders guards within one role/repeat tier; the cap
+# bounds it for the matching solver's cost encoding.
+FAIRNESS_MAX_TERM = 20
+FAIRNESS_SPAN = FAIRNESS_MAX_TERM + 1
+
+
+@dataclass
+class SlotScores:
+    """Per-guard arrays for one slot, aligned with ``GuardScorer.names``."""
+
+    available: np.ndarray
+    eligible: np.ndarray
+    matched: np.ndarray
+    primary: np.ndarray
+    fairness: np.ndarray
+    counts: np.ndarray
+
+
+class GuardScorer:
+    """Scoring and eligibility rules of the solvers, over the whole roster at once.
+
+    A guard is eligible for a slot when they are free, skilled enough for the
+    location's difficulty, not at a lunch that already hits the concurrency
+    cap, and not a checker (or, off hard posts, a head guard) on water. The
+    greedy path takes the lowest ``(primary, fairness, count, name)``, where
+    ``primary`` is the role priority adjusted for water and hard posts plus
+    a penalty for a repeated guard/location pair.
+
+    Static guard attributes (role, experience, lunch window) are encoded
+    once; per slot only availability and assignment counts are read from the
+    ``GuardState`` objects, everything else is one vectorised expression.
+    """
+
+    def __init__(self, engine: "AllocationEngine"):
+        self.engine = engine
+        self.states = list(engine.lifeguards.values())
+        self.names = [state.guard.name for state in self.states]
+        self.origin = engine.ctx.start
+        ranks = {name: rank for rank, name in enumerate(sorted(self.names))}
+        self.name_rank = np.array([ranks[name] for name in self.names], dtype=np.int64)
+        roles = [state.guard.role for state in self.states]
+        self.role_base = np.array([ROLE_PRIORITY.get(role, 3) for role in roles], dtype=np.int64)
+        self.is_checker = np.array([role == "ناجی چک" for role in roles], dtype=bool)
+        self.is_head = np.array([role == "سر ناجی" for role in roles], dtype=bool)
+        self.skill = np.array(
+            [EXPERIENCE_LEVEL.get(state.guard.experience, DIFFICULTY_LEVEL["easy"]) for state in self.states],
+            dtype=np.int64,
+        )
+        lunch_start = []
+        lunch_end = []
+        for name in self.names:
+            window = engine.lunch_windows.get(name)
+            if window is None:
+                lunch_start.append(0)
+                lunch_end.append(0)
+            else:
+                lunch_start.append(window[0])
+                lunch_end.append(window[1])
+        self.lunch_start = np.array(lunch_start, dtype=np.int64)
+        self.lunch_end = np.array(lunch_end, dtype=np.int64)
+        # Only guards whose lunch already hits the concurrency cap are ever
+        # turned away for a slot crossing their lunch window.
+        self.lunch_full = np.array(
+            [
+                name in engine.lunch_windows and engine.lunch_overlaps[name] >= engine.setting.max_concurrent_lunch
+                for name in self.names
+            ],
+            dtype=bool,
+        )
+        self.history_by_location: Dict[str, set[str]] = defaultdict(set)
+        for guard_name, location_name in engine.history_pairs:
+            self.history_by_location[location_name].add(guard_name)
+        self._penalties: Dict[str, np.ndarray] = {}
+        self._fairness: Dict[tuple[str, bool], np.ndarray] = {}
+
+    def _penalty(self, location: Location) -> np.ndarray:
+        penalty = self._penalties.get(location.name)
+        if penalty is None:
+            seen = self.history_by_location.get(location.name, set())
+            penalty = np.array([5 if name in seen else 0 for name in self.names], dtype=np.int64)
+            self._penalties[location.name] = penalty
+        return penalty
+
+    def _fairness_terms(self, location: Location) -> np.ndarray:
+        key = (location.difficulty, bool(location.is_water))
+        fairness = self._fairness.get(key)
+        if fairness is None:
+            terms = self.engine._fairness_terms(location)
+            fairness = self._fairness[key] = np.array([terms.get(name, 0) for name in self.names], dtype=np.int64)
+        return fairness
+
+    def occupancy(self, slot_start: int, slot_end: int) -> tuple[np.ndarray, np.ndarray]:
+        """``(available, counts)`` of every guard for the slot, shared by all locations."""
+        size = len(self.states)
+        if size:
+            span = self.states[0]._span(slot_start, slot_end)
+            inner = self.states[0]._inner_span(slot_start, slot_end)
+        else:
+            span = inner = 0
+        available = np.fromiter(
+            (not (state.busy & span or state.points & inner) for state in self.states), dtype=bool, count=size
+        )
+        counts = np.fromiter((len(state.assignments) for state in self.states), dtype=np.int64, count=size)
+        return available, counts
+
+    def lunch_blocked(self, slot_start: int, slot_end: int) -> np.ndarray:
+        """Guards kept off the slot because it crosses a lunch already at the concurrency cap."""
+        return self.lunch_full & (self.lunch_start < slot_end) & (self.lunch_end > slot_start)
+
+    def score(
+        self,
+        location: Location,
+        slot_start: int,
+        slot_end: int,
+        occupancy: Optional[tuple[np.ndarray, np.ndarray]] = None,
+    ) -> SlotScores:
+        available, counts = occupancy or self.occupancy(slot_start, slot_end)
+
+        water = bool(location.is_water)
+        hard = location.difficulty == "hard"
+        matched = self.skill >= DIFFICULTY_LEVEL.get(location.difficulty, UNKNOWN_DIFFICULTY_LEVEL)
+        primary = self.role_base + (self.is_checker & water) - (self.is_head & hard) + self._penalty(location)
+
+        lunch_blocked = self.lunch_blocked(slot_start, slot_end)
+        role_blocked = (self.is_checker & water) | (self.is_head & (water and not hard))
+        eligible = available & matched & ~lunch_blocked & ~role_blocked
+        return SlotScores(available, eligible, matched, primary, self._fairness_terms(location), counts)
+
+    def select(self, location: Location, slot_start: int, slot_end: int) -> Optional[str]:
+        """Greedy choice: lowest ``(primary, fairness, count, name)`` among eligible guards,
+        else among all available ones with mismatched guards ranked last."""
+        scores = self.score(location, slot_start, slot_end)
+        picks = np.flatnonzero(scores.eligible)
+        if picks.size:
+            primary = scores.primary[picks]
+            fairness = scores.fairness[picks]
+            counts = scores.counts[picks]
+        else:
+            picks = np.flatnonzero(scores.available)
+            if not picks.size:
+                return None
+            matched = scores.matched[picks]
+            primary = np.where(matched, scores.primary[picks], MISMATCH_SCORE)
+            fairness = np.where(matched, scores.fairness[picks], 0)
+            counts = np.where(matched, scores.counts[picks], MISMATCH_SCORE)
+        best = np.lexsort((self.name_rank[picks], counts, fairness, primary))[0]
+        return self.names[picks[best]]
+
 
 class AllocationEngine:
-    def __init__(self, session: Session):
-        self.ctx = AllocationContext(session)
+    def __init__(
+        self,
+        session: Session,
+        today: Optional[date] = None,
+        solver: str = "greedy",
+        progress: Optional[Callable[[int, int], None]] = None,
+        site: str = DEFAULT_SITE,
+    ):
+        if solver not in SOLVERS:
+            raise ValueError(f"Unknown solver: {solver}")
+        self.solver = solver
+        self.site = site
+        # Called as ``progress(done, total)`` after each location (greedy) or
+        # time window (matching); may raise to abort before anything is persisted.
+        self.progress = progress
+        self.timings: Dict[str, float] = defaultdict(float)
+        with self._phase("load_settings"):
+            self.ctx = AllocationContext(session, today, site)
         self.session = session
         self.setting = self.ctx.setting
-        self.lifeguards = self._load_lifeguards()
-        self.locations = self._load_locations()
+        with self._phase("load_guards"):
+            self.lifeguards = self._load_lifeguards()
+            self.lunch_windows = self._load_lunch_windows()
+            self.lunch_overlaps = self._count_lunch_overlaps()
+        with self._phase("load_locations"):
+            self.locations = self._load_locations()
         self.jalali_date = self.ctx.jalali_today()
-        self.long_cache: List[dict] = []
-        self.wide_cache: List[dict] = []
+        self._slot_templates: Dict[int, tuple[tuple[int, int], ...]] = {}
+        self.check_windows = [
+            (idx, start, min(start + self.setting.check_window_len_min, self.ctx.end))
+            for idx, start in enumerate((self.ctx.start + minute for minute in self.setting.check_windows), start=1)
+        ]
+        with self._phase("load_history"):
+            settings = get_settings()
+            self.fairness_weight = settings.fairness_weight
+            self.fairness_unit = settings.fairness_unit_min
+            if self.fairness_weight:
+                # the day's own rows and any later days come back out: only earlier days count
+                later = history_since(session, site, self.jalali_date)
+                day_rows = [row for row in later if row["date_jalali"] == self.jalali_date]
+                self.workload = load_workload(session, site, exclude=later)
+            else:
+                day_rows = self._load_day_history()
+                self.workload = {}
+            self.history_pairs = {(row["guard_name"], row["location_name"]) for row in day_rows}
+            self._fairness: Dict[tuple[str, bool], Dict[str, int]] = {}
+            self.scorer = GuardScorer(self)
+        self.schedule = Schedule()
+        self.slot_count = 0
+        self.filled_slots = 0
+
+    @contextmanager
+    def _phase(self, name: str) -> Iterator[None]:
+        """Accumulate wall time spent in ``name`` into ``self.timings`` (seconds)."""
+        began = perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] += perf_counter() - began
 
     def _load_lifeguards(self) -> Dict[str, GuardState]:
         guards = {
-            g.name: GuardState(guard=g, assignments=[], breaks=[])
-            for g in self.session.query(Lifeguard).filter(Lifeguard.present == True).all()  # noqa: E712
+            g.name: GuardState(guard=g, assignments=[], breaks=[], origin=self.ctx.start, resolution=AVAILABILITY_RESOLUTION_MIN)
+            for g in self.session.query(Lifeguard)
+            .filter(Lifeguard.site == self.site, Lifeguard.present == True)  # noqa: E712
+            .all()
         }
-        lunch_window = timedelta(minutes=self.setting.lunch_min + self.setting.shower_min)
-        dinner_window = timedelta(minutes=self.setting.dinner_min)
-        dinner_start = datetime.combine(self.ctx.today, datetime.strptime("17:00", "%H:%M").time())
+        lunch_window = self.setting.lunch_window_min
+        dinner_window = self.setting.dinner_min
+        dinner_start = clock_minutes(DINNER_START)
         for guard_state in guards.values():
             guard = guard_state.guard
             if guard.lunch_at and guard.lunch_at != "-":
-                start = datetime.combine(self.ctx.today, datetime.strptime(guard.lunch_at, "%H:%M").time())
+                start = clock_minutes(guard.lunch_at)
                 guard_state.block(start, start + lunch_window)
             if guard.swap_at and guard.swap_at != "-" and guard.backup_name and guard.backup_name != "-":
-                swap_time = datetime.combine(self.ctx.today, datetime.strptime(guard.swap_at, "%H:%M").time())
+                swap_time = clock_minutes(guard.swap_at)
                 guard_state.block(swap_time, swap_time)
             guard_state.block(dinner_start, dinner_start + dinner_window)
         return guards
@@ -110,138 +393,346 @@ class AllocationEngine:
     def _load_locations(self) -> List[Location]:
         return (
             self.session.query(Location)
-            .filter(Location.active_today == True)  # noqa: E712
+            .filter(Location.site == self.site, Location.active_today == True)  # noqa: E712
             .order_by(Location.difficulty.desc())
             .all()
         )
 
-    def _slot_length(self, location: Location) -> timedelta:
-        hours = self.setting.special_hours if ("(" in location.name or "چاله" in location.name) else self.setting.shift_hours
-        return timedelta(hours=hours)
+    def _load_day_history(self) -> List[dict]:
+        return history_dicts(
+            self.session.exec(
+                select(*HISTORY_COLUMNS).where(ShiftHistory.date_jalali == self.jalali_date, ShiftHistory.site == self.site)
+            )
+        )
+
+    def _slot_length(self, location: Location) -> int:
+        if "(" in location.name or "چاله" in location.name:
+            return self.setting.special_len_min
+        return self.setting.shift_len_min
 
-    def _build_slots(self, location: Location) -> List[tuple[datetime, datetime]]:
-        slots = []
+    def _build_slots(self, location: Location) -> tuple[tuple[int, int], ...]:
+        """Slots of ``location``; only two lengths exist, so each is laid out once per day."""
         slot_length = self._slot_length(location)
-        start = self.ctx.start_dt
-        index = 0
-        while start < self.ctx.end_dt:
-            end = min(start + slot_length, self.ctx.end_dt)
-            slots.append((start, end))
-            start = end
-            index += 1
+        slots = self._slot_templates.get(slot_length)
+        if slots is None:
+            bounds = list(range(self.ctx.start, self.ctx.end, slot_length)) + [self.ctx.end]
+            slots = self._slot_templates[slot_length] = tuple(zip(bounds, bounds[1:]))
         return slots
 
-    def _score_guard(self, guard_state: GuardState, location: Location, slot_start: datetime, slot_end: datetime) -> tuple:
-        guard = guard_state.guard
-        difficulty_match = location.difficulty in SKILL_TO_DIFFICULTY.get(guard.experience, {"easy"})
-        if not difficulty_match:
-            return (99, 99, 99, guard.name)
-        role_priority = ROLE_PRIORITY.get(guard.role, 3)
-        is_water = location.is_water
-        if guard.role == "ناجی چک" and is_water:
-            role_priority += 1
-        if guard.role == "سر ناجی" and location.difficulty == "hard":
-            role_priority -= 1
-        repeat_penalty = 0
-        if self.session.query(ShiftHistory).filter(
-            ShiftHistory.date_jalali == self.jalali_date,
-            ShiftHistory.guard_name == guard.name,
-            ShiftHistory.location_name == location.name,
-        ).count() > 0:
-            repeat_penalty = 5
-        return (role_priority + repeat_penalty, len(guard_state.assignments), guard_state.guard.name)
-
-    def _check_lunch_concurrency(self, start: datetime, end: datetime, guard_state: GuardState) -> bool:
-        if guard_state.guard.lunch_at in (None, "-"):
-            return True
-        lunch_time = datetime.combine(self.ctx.today, datetime.strptime(guard_state.guard.lunch_at, "%H:%M").time())
-        lunch_end = lunch_time + timedelta(minutes=self.setting.lunch_min + self.setting.shower_min)
-        if end <= lunch_time or start >= lunch_end:
-            return True
-        overlapping = 0
-        for other_state in self.lifeguards.values():
-            if other_state.guard.name == guard_state.guard.name:
+    def _fairness_terms(self, location: Location) -> Dict[str, int]:
+        """Cross-day fairness penalty of each guard for ``location``.
+
+        A guard's load is their minutes on earlier days at the location's
+        difficulty, plus their water minutes for a water post. Each full
+        ``fairness_unit_min`` above the least-loaded present guard costs
+        ``fairness_weight`` points, capped at ``FAIRNESS_MAX_TERM``.
+        """
+        key = (location.difficulty, bool(location.is_water))
+        terms = self._fairness.get(key)
+        if terms is None:
+            terms = {}
+            if self.workload:
+                loads = {
+                    name: self.workload.get(name, {}).get((DIFFICULTY, location.difficulty), 0)
+                    + (self.workload.get(name, {}).get((KIND, "Water"), 0) if location.is_water else 0)
+                    for name in self.lifeguards
+                }
+                floor = min(loads.values(), default=0)
+                terms = {
+                    name: min(self.fairness_weight * ((load - floor) // self.fairness_unit), FAIRNESS_MAX_TERM)
+                    for name, load in loads.items()
+                    if load - floor >= self.fairness_unit
+                }
+            self._fairness[key] = terms
+        return terms
+
+    def _load_lunch_windows(self) -> Dict[str, tuple[int, int]]:
+        window = self.setting.lunch_window_min
+        windows: Dict[str, tuple[int, int]] = {}
+        for name, guard_state in self.lifeguards.items():
+            lunch_at = guard_state.guard.lunch_at
+            if lunch_at in (None, "-"):
                 continue
-            if other_state.guard.lunch_at in (None, "-"):
-                continue
-            other_start = datetime.combine(self.ctx.today, datetime.strptime(other_state.guard.lunch_at, "%H:%M").time())
-            other_end = other_start + timedelta(minutes=self.setting.lunch_min + self.setting.shower_min)
-            if not (lunch_end <= other_start or lunch_time >= other_end):
-                overlapping += 1
-        return overlapping < self.setting.max_concurrent_lunch
-
-    def allocate(self) -> dict:
-        long_rows: List[dict] = []
-        wide_rows: List[dict] = []
-        history_rows: List[dict] = []
-        wide_headers: Dict[str, int] = defaultdict(int)
-        check_rot = deque([name for name, g in self.lifeguards.items() if g.guard.role == "ناجی چک"])
-        if not check_rot:
-            fallback = [name for name, g in self.lifeguards.items() if g.guard.role == "سر ناجی"]
-            if not fallback:
-                fallback = [name for name in self.lifeguards.keys()]
-            check_rot = deque(fallback)
+            start = clock_minutes(lunch_at)
+            windows[name] = (start, start + window)
+        return windows
+
+    def _count_lunch_overlaps(self) -> Dict[str, int]:
+        """Number of *other* guards whose lunch window overlaps each guard's.
+
+        Sorted sweep: a window ``[s, e)`` overlaps every window that starts
+        before ``e`` minus those that already ended by ``s``.
+        """
+        if self.setting.lunch_window_min <= 0:
+            return {name: 0 for name in self.lunch_windows}
+        starts = sorted(start for start, _ in self.lunch_windows.values())
+        ends = sorted(end for _, end in self.lunch_windows.values())
+        return {
+            name: bisect_left(starts, end) - bisect_right(ends, start) - 1
+            for name, (start, end) in self.lunch_windows.items()
+        }
 
-        for location in self.locations:
-            slots = self._build_slots(location)
-            row = {"لوکیشن": location.name}
+    def allocate(self, persist: bool = True) -> dict:
+        schedule = self.plan()
+        if persist:
+            with self._phase("persist"):
+                self._persist_history(schedule)
+        return schedule.result()
+
+    def plan(self) -> Schedule:
+        """Run the solver; the day comes back as a compact ``Schedule``."""
+        self.schedule = Schedule(self.lifeguards, (location.name for location in self.locations))
+        check_rot = self._check_rotation()
+        if self.solver == "matching":
+            self._allocate_matching(check_rot)
+        else:
+            self._allocate_greedy(check_rot)
+        self.schedule.caption = self._caption()
+        self.schedule.team = [self._guard_to_dict(g.guard) for g in self.lifeguards.values()]
+        return self.schedule
+
+    def _allocate_greedy(self, check_rot: deque[str]) -> None:
+        """Fill locations one after another, each slot with the best remaining guard."""
+        for done, location in enumerate(self.locations, start=1):
+            with self._phase("build_slots"):
+                slots = self._build_slots(location)
+            row = self.schedule.row(location.name)
             for idx, (slot_start, slot_end) in enumerate(slots, start=1):
-                candidate = self._select_guard(location, slot_start, slot_end)
-                if not candidate:
-                    cell_value = "--"
-                else:
-                    guard_state = self.lifeguards[candidate]
-                    guard_state.assign(slot_start, slot_end)
-                    cell_value, entries = self._build_assignment(guard_state, location, slot_start, slot_end)
-                    history_rows.extend(entries)
-                    long_rows.extend(entries)
-                header = f"شیفت {idx} ({slot_start.strftime('%H:%M')}-{slot_end.strftime('%H:%M')})"
-                row[header] = cell_value
-                wide_headers[header] += 1
-            wide_rows.append(row)
+                with self._phase("select"):
+                    candidate = self._select_guard(location, slot_start, slot_end)
+                row[self._slot_column(idx, slot_start, slot_end)] = self._place_guard(
+                    candidate, location, slot_start, slot_end
+                )
 
             if location.is_water:
-                for idx, minute in enumerate(self.setting.check_windows, start=1):
-                    check_start = self.ctx.start_dt + timedelta(minutes=minute)
-                    check_end = min(check_start + timedelta(minutes=self.setting.check_window_len_min), self.ctx.end_dt)
-                    assignee_name = self._rotate_check(check_rot)
-                    check_state = self.lifeguards.get(assignee_name)
-                    if check_state and check_state.is_available(check_start, check_end):
-                        check_state.assign(check_start, check_end)
-                        entry = {
-                            "Location": location.name,
-                            "Start": check_start.strftime("%H:%M"),
-                            "End": check_end.strftime("%H:%M"),
-                            "Assignee": assignee_name,
-                            "Kind": "Check",
-                        }
-                        long_rows.append(entry)
-                        history_rows.append({
-                            "guard_name": assignee_name,
-                            "location_name": f"چک - {location.name}",
-                            "start": entry["Start"],
-                            "end": entry["End"],
-                            "kind": "Check",
-                        })
-                        row[f"چک {idx}"] = assignee_name
-                    else:
-                        row[f"چک {idx}"] = "--"
-
-        caption = (
-            f"تاریخ: {self.jalali_date} | از {self.setting.start} تا {self.setting.end} — برنامه تولید شد ✅"
-        )
-        self.long_cache = long_rows
-        self.wide_cache = wide_rows
-        self.ctx.caption = caption
-        self._persist_history(history_rows)
+                with self._phase("checks"):
+                    self._assign_checks(location, check_rot)
+            if self.progress:
+                self.progress(done, len(self.locations))
+
+    def _allocate_matching(self, check_rot: deque[str]) -> None:
+        """Fill all locations sharing a time slot at once with a min-cost assignment.
+
+        Slots are visited in time order; for each distinct ``(start, end)``
+        window the guards × locations cost matrix is built from the same
+        eligibility rules and ``GuardScorer`` ordering as the greedy path.
+        Check windows are assigned afterwards, in location order.
+        """
+        windows: Dict[tuple[int, int], List[tuple[Location, tuple]]] = defaultdict(list)
+        with self._phase("build_slots"):
+            for location in self.locations:
+                row = self.schedule.row(location.name)
+                for idx, (slot_start, slot_end) in enumerate(self._build_slots(location), start=1):
+                    column = self._slot_column(idx, slot_start, slot_end)
+                    row[column] = ()
+                    windows[(slot_start, slot_end)].append((location, column))
+        name_rank = {name: rank for rank, name in enumerate(sorted(self.lifeguards))}
+
+        ordered = sorted(windows.items(), key=lambda item: item[0])
+        for done, ((slot_start, slot_end), members) in enumerate(ordered, start=1):
+            with self._phase("select"):
+                chosen = self._match_window([location for location, _ in members], slot_start, slot_end, name_rank)
+            for (location, column), candidate in zip(members, chosen):
+                self.schedule.row(location.name)[column] = self._place_guard(
+                    candidate, location, slot_start, slot_end
+                )
+            if self.progress:
+                self.progress(done, len(ordered))
+
+        with self._phase("checks"):
+            for location in self.locations:
+                if location.is_water:
+                    self._assign_checks(location, check_rot)
+
+    def _match_window(
+        self, locations: List[Location], slot_start: int, slot_end: int, name_rank: Dict[str, int]
+    ) -> List[Optional[str]]:
+        scorer = self.scorer
+        # nothing is assigned until the window is solved, so occupancy is shared
+        occupancy = scorer.occupancy(slot_start, slot_end)
+        slot_scores = [scorer.score(location, slot_start, slot_end, occupancy) for location in locations]
+        columns = np.flatnonzero(slot_scores[0].available) if slot_scores else np.array([], dtype=np.int64)
+        if not columns.size:
+            return [None] * len(locations)
+        available = [scorer.names[column] for column in columns]
+        width = len(scorer.names)
+        ranks = np.array([name_rank[name] for name in available], dtype=np.int64)
+        costs: List[np.ndarray] = []
+        for scores in slot_scores:
+            matched = scores.matched[columns]
+            primary = np.where(matched, scores.primary[columns], MISMATCH_SCORE)
+            fairness = np.where(matched, scores.fairness[columns], 0)
+            counts = np.where(matched, scores.counts[columns], MISMATCH_SCORE)
+            # the greedy path falls back to any available guard once eligible
+            # ones run out; keep that, but always dearer
+            tier = np.where(
+                scores.eligible[columns], primary + MATCHING_PRIMARY_SHIFT, MATCHING_FALLBACK_TIER + primary
+            )
+            count_span = int(scores.counts.max()) + 1
+            costs.append(((tier * FAIRNESS_SPAN + fairness) * count_span + counts) * width + ranks)
+        assignment = min_cost_assignment(np.vstack(costs))
+        return [available[column] if column is not None else None for column in assignment]
+
+    def _caption(self) -> str:
+        return f"تاریخ: {self.jalali_date} | از {self.setting.start} تا {self.setting.end} — برنامه تولید شد ✅"
+
+    def repair(
+        self,
+        wide_rows: List[dict],
+        long_rows: List[dict],
+        guard: Optional[str] = None,
+        location: Optional[str] = None,
+        persist: bool = True,
+    ) -> dict:
+        """Re-fill only what ``guard`` or ``location`` touches in an earlier run of this day.
+
+        Every other assignment is kept as announced and replayed into the guard
+        states, so freed slots are filled by ``_select_guard`` around them. A
+        slot is released whole when any of its entries is touched, since a swap
+        splits one slot into two entries. With ``location`` the row is rebuilt
+        if the location is still active and dropped otherwise. Only released
+        and new history rows are written.
+        """
+        if (guard is None) == (location is None):
+            raise ValueError("Give exactly one of guard or location")
+        active = {loc.name: loc for loc in self.locations}
+        rows = {row["لوکیشن"]: dict(row) for row in wide_rows}
+        check_columns = {clock_text(start): f"چک {idx}" for idx, start, _ in self.check_windows}
+
+        def column_of(entry: dict) -> Optional[str]:
+            if entry.get("Kind") == "Check":
+                return check_columns.get(entry["Start"])
+            for column in rows.get(entry["Location"], {}):
+                match = SLOT_HEADER_RANGE.search(column)
+                if match and match.group(1) <= entry["Start"] < match.group(2):
+                    return column
+            return None
+
+        keyed = [((entry["Location"], column_of(entry)), entry) for entry in long_rows]
+        if guard is not None:
+            released = {key: entry for key, entry in keyed if entry["Assignee"] == guard}
+        else:
+            released = {key: entry for key, entry in keyed if key[0] == location}
+        kept = [entry for key, entry in keyed if key not in released]
+        removed = [entry for key, entry in keyed if key in released]
+        for entry in kept:
+            state = self.lifeguards.get(entry["Assignee"])
+            if state:
+                state.assign(clock_minutes(entry["Start"]), clock_minutes(entry["End"]))
+
+        self.schedule = Schedule(self.lifeguards, active)
+        with self._phase("select"):
+            if location is not None:
+                self._repair_location(rows, active.get(location), location)
+            else:
+                self._repair_guard_slots(rows, active, released)
+
+        added = self.schedule.long_rows()
+        long_rows = kept + added
+        if persist:
+            with self._phase("persist"):
+                update_history(
+                    self.session,
+                    self.jalali_date,
+                    [history_entry(e) for e in removed],
+                    self.schedule.iter_history(),
+                    site=self.site,
+                )
         return {
-            "wide": wide_rows,
+            "wide": list(rows.values()),
             "long": long_rows,
             "team": [self._guard_to_dict(g.guard) for g in self.lifeguards.values()],
-            "history": history_rows,
-            "caption": caption,
+            "history": [history_entry(entry) for entry in long_rows],
+            "caption": self._caption(),
+            "removed": removed,
+            "added": added,
         }
 
+    def _repair_location(
+        self,
+        rows: Dict[str, dict],
+        location: Optional[Location],
+        name: str,
+    ) -> None:
+        if location is None:
+            rows.pop(name, None)
+            return
+        row = self.schedule.row(location.name)
+        for idx, (slot_start, slot_end) in enumerate(self._build_slots(location), start=1):
+            candidate = self._select_guard(location, slot_start, slot_end)
+            row[self._slot_column(idx, slot_start, slot_end)] = self._place_guard(
+                candidate, location, slot_start, slot_end
+            )
+        if location.is_water:
+            self._assign_checks(location, self._check_rotation())
+        rows[location.name] = self.schedule.wide_row(location.name)
+
+    def _repair_guard_slots(
+        self,
+        rows: Dict[str, dict],
+        active: Dict[str, Location],
+        released: Dict[tuple[str, Optional[str]], dict],
+    ) -> None:
+        check_rot = self._check_rotation()
+        for name, row in rows.items():
+            location = active.get(name)
+            for column in list(row):
+                entry = released.get((name, column))
+                if entry is None:
+                    continue
+                if location is None:
+                    row[column] = "--"
+                elif entry.get("Kind") == "Check":
+                    start, end = clock_minutes(entry["Start"]), clock_minutes(entry["End"])
+                    assignee = next(
+                        (n for n in check_rot if n in self.lifeguards and self.lifeguards[n].is_available(start, end)),
+                        None,
+                    )
+                    placed = (self._place_check(assignee, location, start, end),) if assignee else ()
+                    row[column] = self.schedule.cell_text(placed)
+                else:
+                    slot_start, slot_end = (clock_minutes(value) for value in SLOT_HEADER_RANGE.search(column).groups())
+                    candidate = self._select_guard(location, slot_start, slot_end)
+                    row[column] = self.schedule.cell_text(self._place_guard(candidate, location, slot_start, slot_end))
+
+    def _check_rotation(self) -> deque[str]:
+        check_rot = deque([name for name, g in self.lifeguards.items() if g.guard.role == "ناجی چک"])
+        if not check_rot:
+            fallback = [name for name, g in self.lifeguards.items() if g.guard.role == "سر ناجی"]
+            if not fallback:
+                fallback = [name for name in self.lifeguards.keys()]
+            check_rot = deque(fallback)
+        return check_rot
+
+    def _slot_column(self, idx: int, slot_start: int, slot_end: int) -> tuple:
+        return (SLOT_COLUMN, idx, slot_start, slot_end)
+
+    def _place_guard(
+        self, candidate: Optional[str], location: Location, slot_start: int, slot_end: int
+    ) -> tuple[int, ...]:
+        """Book ``candidate`` (if any) for the slot; returns the schedule entries of its cell."""
+        self.slot_count += 1
+        if not candidate:
+            return ()
+        self.filled_slots += 1
+        guard_state = self.lifeguards[candidate]
+        guard_state.assign(slot_start, slot_end)
+        return self._build_assignment(guard_state, location, slot_start, slot_end)
+
+    def _assign_checks(self, location: Location, check_rot: deque[str]) -> None:
+        row = self.schedule.row(location.name)
+        for idx, check_start, check_end in self.check_windows:
+            assignee_name = self._rotate_check(check_rot)
+            check_state = self.lifeguards.get(assignee_name)
+            if check_state and check_state.is_available(check_start, check_end):
+                row[(CHECK_COLUMN, idx, 0, 0)] = (self._place_check(assignee_name, location, check_start, check_end),)
+            else:
+                row[(CHECK_COLUMN, idx, 0, 0)] = ()
+
+    def _place_check(self, assignee_name: str, location: Location, check_start: int, check_end: int) -> int:
+        self.lifeguards[assignee_name].assign(check_start, check_end)
+        return self.schedule.add(location.name, assignee_name, check_start, check_end, CHECK)
+
     def _rotate_check(self, queue: deque[str]) -> str:
         queue.rotate(-1)
         return queue[0]
@@ -256,114 +747,99 @@ class AllocationEngine:
         }
 
     def _build_assignment(
-        self, guard_state: GuardState, location: Location, slot_start: datetime, slot_end: datetime
-    ) -> tuple[str, List[dict]]:
+        self, guard_state: GuardState, location: Location, slot_start: int, slot_end: int
+    ) -> tuple[int, ...]:
         guard = guard_state.guard
         swap_at = guard.swap_at if guard.swap_at and guard.swap_at != "-" else None
-        entries: List[dict] = []
+        kind = WATER if location.is_water else GENERAL
         if swap_at and guard.backup_name and guard.backup_name != "-":
-            swap_time = datetime.combine(self.ctx.today, datetime.strptime(swap_at, "%H:%M").time())
+            swap_time = clock_minutes(swap_at)
             if slot_start < swap_time < slot_end:
                 backup_state = self.lifeguards.get(guard.backup_name)
                 if backup_state and backup_state.is_available(swap_time, slot_end):
                     backup_state.assign(swap_time, slot_end)
-                    entries.append(
-                        {
-                            "Location": location.name,
-                            "Start": slot_start.strftime("%H:%M"),
-                            "End": swap_time.strftime("%H:%M"),
-                            "Assignee": guard.name,
-                            "Kind": "General" if not location.is_water else "Water",
-                        }
-                    )
-                    entries.append(
-                        {
-                            "Location": location.name,
-                            "Start": swap_time.strftime("%H:%M"),
-                            "End": slot_end.strftime("%H:%M"),
-                            "Assignee": backup_state.guard.name,
-                            "Kind": "General" if not location.is_water else "Water",
-                        }
+                    return (
+                        self.schedule.add(location.name, guard.name, slot_start, swap_time, kind),
+                        self.schedule.add(location.name, backup_state.guard.name, swap_time, slot_end, kind),
                     )
-                    text = f"{guard.name} ({slot_start.strftime('%H:%M')}-{swap_time.strftime('%H:%M')}) | {backup_state.guard.name} ({swap_time.strftime('%H:%M')}-{slot_end.strftime('%H:%M')})"
-                    return text, entries
-        entries.append(
-            {
-                "Location": location.name,
-                "Start": slot_start.strftime("%H:%M"),
-                "End": slot_end.strftime("%H:%M"),
-                "Assignee": guard.name,
-                "Kind": "Water" if location.is_water else "General",
-            }
-        )
-        text = f"{guard.name}"
-        return text, entries
-
-    def _select_guard(self, location: Location, slot_start: datetime, slot_end: datetime) -> Optional[str]:
-        candidates = []
-        for name, state in self.lifeguards.items():
-            if not state.is_available(slot_start, slot_end):
-                continue
-            if not self._check_lunch_concurrency(slot_start, slot_end, state):
-                continue
-            if location.is_water and state.guard.role == "ناجی چک":
-                continue
-            if state.guard.role == "سر ناجی" and location.is_water and location.difficulty != "hard":
-                continue
-            score = self._score_guard(state, location, slot_start, slot_end)
-            if score[0] < 99:
-                candidates.append((score, name))
-        if not candidates:
-            for name, state in self.lifeguards.items():
-                if not state.is_available(slot_start, slot_end):
-                    continue
-                score = self._score_guard(state, location, slot_start, slot_end)
-                candidates.append((score, name))
-        if not candidates:
-            return None
-        candidates.sort(key=lambda x: x[0])
-        return candidates[0][1]
-
-    def _persist_history(self, entries: List[dict]) -> None:
-        existing = self.session.query(ShiftHistory).filter(ShiftHistory.date_jalali == self.jalali_date)
-        existing.delete()
-        for entry in entries:
-            self.session.add(
-                ShiftHistory(
-                    date_jalali=self.jalali_date,
-                    guard_name=entry.get("guard_name") or entry.get("Assignee"),
-                    location_name=entry.get("location_name") or entry.get("Location"),
-                    start=entry.get("start") or entry.get("Start"),
-                    end=entry.get("end") or entry.get("End"),
-                    kind=entry.get("kind") or entry.get("Kind", "General"),
-                )
+        return (self.schedule.add(location.name, guard.name, slot_start, slot_end, kind),)
+
+    def _select_guard(self, location: Location, slot_start: int, slot_end: int) -> Optional[str]:
+        return self.scorer.select(location, slot_start, slot_end)
+
+    def _persist_history(self, schedule: Schedule) -> None:
+        replace_history(self.session, self.jalali_date, schedule.iter_history(), site=self.site)
+
+
+def _history_values(date_jalali: str, entry: dict, created_at: datetime, site: str = DEFAULT_SITE) -> dict:
+    return {
+        "date_jalali": date_jalali,
+        "site": site,
+        "guard_name": entry["guard_name"],
+        "location_name": entry["location_name"],
+        "start": entry["start"],
+        "end": entry["end"],
+        "kind": entry["kind"],
+        "created_at": created_at,
+    }
+
+
+def replace_history(
+    session: Session, date_jalali: str, entries: Iterable[dict], site: str = DEFAULT_SITE
+) -> None:
+    """Swap the stored history of one day at ``site`` for ``entries`` in a single transaction.
+
+    The guard workload totals are adjusted by the difference in the same transaction.
+    A day kept only in the archive counts as replaced too: once it has live
+    rows again, readers no longer see the archived copy.
+    """
+    created_at = datetime.utcnow()
+    rows = [_history_values(date_jalali, entry, created_at, site) for entry in entries]
+    shadowed = archived_history(session, date=date_jalali, site=site) if rows else []
+    replaced = session.execute(
+        delete(ShiftHistory)
+        .where(ShiftHistory.date_jalali == date_jalali, ShiftHistory.site == site)
+        .returning(*HISTORY_COLUMNS)
+    ).all()
+    if rows:
+        session.execute(insert(ShiftHistory), rows)
+    apply_workload_delta(session, site, history_dicts(replaced) + shadowed, rows)
+    session.commit()
+
+
+def update_history(
+    session: Session,
+    date_jalali: str,
+    removed: Iterable[dict],
+    added: Iterable[dict],
+    site: str = DEFAULT_SITE,
+) -> None:
+    """Delete ``removed`` and insert ``added`` for one day at ``site``, leaving other rows alone.
+
+    A day kept only in the archive is first copied back into the table with
+    its original ids, so the rows left alone stay visible next to the new ones.
+    """
+    created_at = datetime.utcnow()
+    keys = {
+        (row["guard_name"], row["location_name"], row["start"], row["end"], row["kind"])
+        for row in (_history_values(date_jalali, entry, created_at) for entry in removed)
+    }
+    rows = [_history_values(date_jalali, entry, created_at, site) for entry in added]
+    restored = archived_history(session, date=date_jalali, site=site) if keys or rows else []
+    if restored:
+        session.execute(insert(ShiftHistory), restored)
+    deleted = []
+    if keys:
+        deleted = session.execute(
+            delete(ShiftHistory)
+            .where(
+                ShiftHistory.date_jalali == date_jalali,
+                ShiftHistory.site == site,
+                tuple_(*HISTORY_COLUMNS).in_(keys),
             )
-        self.session.commit()
-
-    def export_wide_csv(self) -> bytes:
-        import csv
-        import io
-
-        if not self.wide_cache:
-            raise ValueError("No allocation available")
-        headers = list(self.wide_cache[0].keys())
-        buffer = io.StringIO()
-        writer = csv.DictWriter(buffer, fieldnames=headers)
-        writer.writeheader()
-        for row in self.wide_cache:
-            writer.writerow(row)
-        return buffer.getvalue().encode("utf-8")
-
-    def export_long_csv(self) -> bytes:
-        import csv
-        import io
-
-        if not self.long_cache:
-            raise ValueError("No allocation available")
-        headers = list(self.long_cache[0].keys())
-        buffer = io.StringIO()
-        writer = csv.DictWriter(buffer, fieldnames=headers)
-        writer.writeheader()
-        for row in self.long_cache:
-            writer.writerow(row)
-        return buffer.getvalue().encode("utf-8")
+            .returning(*HISTORY_COLUMNS)
+        ).all()
+    if rows:
+        session.execute(insert(ShiftHistory), rows)
+    apply_workload_delta(session, site, history_dicts(deleted), rows)
+    session.commit()
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+from typing import List, Optional, Sequence, Union
+
+import numpy as np
+
+# Large enough to stand for "no slack yet", small enough that subtracting
+# potentials from it never overflows int64.
+INFINITY = np.iinfo(np.int64).max // 4
+
+CostMatrix = Union[np.ndarray, Sequence[Sequence[Optional[int]]]]
+
+
+def min_cost_assignment(costs: CostMatrix) -> List[Optional[int]]:
+    """Min-cost assignment of rows to distinct columns (Hungarian algorithm).
+
+    ``costs[r][c]`` is the cost of giving column ``c`` to row ``r``, or
+    ``None`` when that pair is not allowed; an integer ``ndarray`` allows
+    every pair. Rows may stay unassigned; the solver first maximises the
+    number of assigned rows and then minimises the total cost. Returns the
+    chosen column per row, ``None`` if unassigned.
+
+    Every row gets a private "unassigned" column priced above any full set
+    of real edges, which keeps the problem rectangular (rows <= columns) for
+    the O(rows² · columns) potentials formulation. Each augmenting step scans
+    a whole row of slacks with numpy, so Python only loops once per step.
+    """
+    values, allowed = _cost_arrays(costs)
+    rows = values.shape[0]
+    if rows == 0:
+        return []
+    keep = _useful_columns(values, allowed)
+    if keep is not None:
+        reduced = _solve(values[:, keep], allowed[:, keep])
+        return [None if c is None else int(keep[c]) for c in reduced]
+    return _solve(values, allowed)
+
+
+def _solve(values: np.ndarray, allowed: np.ndarray) -> List[Optional[int]]:
+    rows, columns = values.shape
+    if allowed.any():
+        highest = int(values[allowed].max())
+        lowest = int(values[allowed].min())
+    else:
+        highest = lowest = 0
+    offset = -lowest if lowest < 0 else 0
+    unassigned = (highest + offset + 1) * (rows + 1)
+    forbidden = unassigned + 1
+    width = columns + rows
+
+    # Dense matrix with a leading dummy column so indexes line up with the
+    # 1-indexed potentials below.
+    matrix = np.full((rows, width + 1), forbidden, dtype=np.int64)
+    matrix[:, 0] = 0
+    matrix[:, 1 : columns + 1] = np.where(allowed, values + offset, forbidden)
+    matrix[np.arange(rows), columns + 1 + np.arange(rows)] = unassigned
+
+    # owner[c] is the (1-indexed) row holding column c, 0 when free.
+    u = np.zeros(rows + 1, dtype=np.int64)
+    v = np.zeros(width + 1, dtype=np.int64)
+    owner = np.zeros(width + 1, dtype=np.int64)
+    way = np.zeros(width + 1, dtype=np.int64)
+    for r in range(1, rows + 1):
+        owner[0] = r
+        free_col = 0
+        # Potentials move by the same delta for every visited row/column at
+        # each step, so the steps only track the running total and each
+        # column's total when it was visited; both are settled once a free
+        # column is reached. Visited columns hold INFINITY in ``min_slack``.
+        total = 0
+        min_slack = np.full(width + 1, INFINITY, dtype=np.int64)
+        unvisited = np.ones(width + 1, dtype=bool)
+        unvisited[0] = False
+        visited_at = np.zeros(width + 1, dtype=np.int64)
+        while True:
+            row = owner[free_col]
+            slack = matrix[row - 1] - v
+            slack += total - u[row]
+            improved = slack < min_slack
+            improved &= unvisited
+            np.copyto(min_slack, slack, where=improved)
+            np.copyto(way, free_col, where=improved)
+            # argmin takes the first minimum, the lowest column index
+            free_col = int(min_slack.argmin())
+            total = int(min_slack[free_col])
+            min_slack[free_col] = INFINITY
+            unvisited[free_col] = False
+            visited_at[free_col] = total
+            if owner[free_col] == 0:
+                break
+        visited = ~unvisited
+        shift = total - visited_at[visited]
+        u[owner[visited]] += shift
+        v[visited] -= shift
+        while free_col:
+            previous = way[free_col]
+            owner[free_col] = owner[previous]
+            free_col = previous
+
+    result: List[Optional[int]] = [None] * rows
+    for c in np.flatnonzero(owner[1 : columns + 1]):
+        result[owner[c + 1] - 1] = int(c)
+    return result
+
+
+def _cost_arrays(costs: CostMatrix) -> tuple[np.ndarray, np.ndarray]:
+    """``(values, allowed)`` int64/bool matrices for ``costs``."""
+    if isinstance(costs, np.ndarray):
+        values = costs.astype(np.int64, copy=False)
+        return values, np.ones(values.shape, dtype=bool)
+    rows = len(costs)
+    columns = len(costs[0]) if rows else 0
+    allowed = np.array([[cost is not None for cost in row] for row in costs], dtype=bool).reshape(rows, columns)
+    values = np.array(
+        [[0 if cost is None else cost for cost in row] for row in costs], dtype=np.int64
+    ).reshape(rows, columns)
+    return values, allowed
+
+
+def _useful_columns(values: np.ndarray, allowed: np.ndarray) -> Optional[np.ndarray]:
+    """Columns that can appear in some optimal assignment, or ``None`` if all can.
+
+    A row never needs more than its ``rows`` cheapest columns: if it holds a
+    dearer one, one of those cheaper columns is free and no worse.
+    """
+    rows, columns = values.shape
+    if columns <= rows:
+        return None
+    # order each row by (forbidden last, cost, column)
+    order = np.lexsort((np.broadcast_to(np.arange(columns), values.shape), values, ~allowed), axis=-1)
+    cheapest = order[:, :rows]
+    keep = np.zeros(columns, dtype=bool)
+    keep[cheapest[np.take_along_axis(allowed, cheapest, axis=1)]] = True
+    if keep.all():
+        return None
+    return np.flatnonzero(keep)
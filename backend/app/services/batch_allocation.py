@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+from sqlmodel import Session, select
+
+from ..core.metrics import observe_allocation
+from ..db import engine as db_engine
+from ..models.lifeguard import Lifeguard
+from ..models.location import Location
+from ..models.site import DEFAULT_SITE
+from .allocation_engine import AllocationEngine, replace_history
+from .result_cache import allocation_fingerprint
+from .run_store import save_run
+from .settings_snapshot import SettingsSnapshot, settings_snapshot
+
+
+def _init_worker() -> None:
+    # Connections inherited from the parent must not be shared across processes.
+    db_engine.dispose(close=False)
+
+
+def _plan_day(session: Session, day_iso: str, solver: str, site: str = DEFAULT_SITE) -> dict:
+    began = time.perf_counter()
+    engine = AllocationEngine(session, today=date.fromisoformat(day_iso), solver=solver, site=site)
+    schedule = engine.plan()
+    return {
+        "schedule": schedule,
+        "date": day_iso,
+        "site": site,
+        "date_jalali": engine.jalali_date,
+        "stats": (dict(engine.timings), engine.slot_count, engine.filled_slots),
+        "allocate_ms": round((time.perf_counter() - began) * 1000, 2),
+    }
+
+
+def _allocate_day(day_iso: str, solver: str, site: str = DEFAULT_SITE) -> dict:
+    """``_plan_day`` on a session of its own, for pool workers."""
+    with Session(db_engine) as session:
+        # The compact schedule crosses the process boundary; rows are built by the parent.
+        return _plan_day(session, day_iso, solver, site)
+
+
+def _persist(session: Session, result: dict, solver: str, setting: SettingsSnapshot) -> Dict[str, float]:
+    """Record metrics, history and the run for one ``_allocate_day`` result; returns its phase timings."""
+    result.update(result.pop("schedule").result())
+    timings, slots, filled = result.pop("stats")
+    observe_allocation(timings, len(result["long"]), slots, filled)
+    persist_began = time.perf_counter()
+    site = result["site"]
+    replace_history(session, result["date_jalali"], result["history"], site=site)
+    fingerprint = allocation_fingerprint(session, date.fromisoformat(result["date"]), solver, site)
+    result["run_id"] = save_run(
+        session, result, result["date_jalali"], setting, fingerprint=fingerprint, site=site
+    ).id
+    result["persist_ms"] = round((time.perf_counter() - persist_began) * 1000, 2)
+    return timings
+
+
+def allocate_range(
+    session: Session,
+    start: date,
+    end: date,
+    solver: str = "greedy",
+    site: str = DEFAULT_SITE,
+) -> dict:
+    """Plan every day in ``[start, end]`` in date order.
+
+    Each day is persisted before the next one is planned, so its history
+    (repeat pairs and workload totals) carries over exactly as if the days
+    had been allocated one by one. Days of one site therefore never run in
+    parallel; ``allocate_sites`` is where the process pool pays off.
+    """
+    began = time.perf_counter()
+    days = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+    setting = settings_snapshot(session, site)
+    results = []
+    for day in days:
+        result = _plan_day(session, day.isoformat(), solver, site)
+        _persist(session, result, solver, setting)
+        results.append(result)
+    return {
+        "days": results,
+        "elapsed_ms": round((time.perf_counter() - began) * 1000, 2),
+    }
+
+
+def _run_jobs(jobs: List[tuple], workers: int) -> List[dict]:
+    """``_allocate_day`` over ``jobs``, in a process pool when ``workers`` > 1."""
+    if workers == 1:
+        return [_allocate_day(*job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = [pool.submit(_allocate_day, *job) for job in jobs]
+        return [future.result() for future in futures]
+
+
+def known_sites(session: Session) -> List[str]:
+    """Every site that has at least one guard or location, sorted."""
+    sites = set(session.exec(select(Lifeguard.site).distinct()).all())
+    sites.update(session.exec(select(Location.site).distinct()).all())
+    return sorted(sites)
+
+
+def allocate_sites(
+    session: Session,
+    day: date,
+    sites: Optional[List[str]] = None,
+    workers: Optional[int] = None,
+    solver: str = "greedy",
+) -> dict:
+    """Plan ``day`` for each site, one site per worker.
+
+    Sites share nothing (guards, locations, settings and history are all
+    partitioned by site), so each is an independent ``_allocate_day`` job;
+    results are persisted from this process in site order. Sites without a
+    ``Setting`` row raise ``ValueError`` before any work starts.
+    """
+    began = time.perf_counter()
+    sites = sorted(set(sites)) if sites else known_sites(session)
+    settings = {site: settings_snapshot(session, site) for site in sites}
+    missing = [site for site, setting in settings.items() if setting is None]
+    if missing:
+        raise ValueError(f"Settings missing for site(s): {', '.join(missing)}")
+    jobs = [(day.isoformat(), solver, site) for site in sites]
+    workers = max(1, min(workers or 1, len(jobs) or 1))
+    results = _run_jobs(jobs, workers)
+
+    for result in results:
+        timings = _persist(session, result, solver, settings[result["site"]])
+        result["timings_ms"] = {phase: round(seconds * 1000, 2) for phase, seconds in timings.items()}
+    return {
+        "date": day.isoformat(),
+        "sites": results,
+        "workers": workers,
+        "elapsed_ms": round((time.perf_counter() - began) * 1000, 2),
+    }
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import heapq
+import json
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional
+
+from sqlmodel import Session, select
+
+from ..models.shift_history import ShiftHistory
+
+HISTORY_PAGE_SIZE = 1000
+HISTORY_MAX_PAGE_SIZE = 10000
+
+
+def history_criteria(
+    date: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    guard: Optional[str] = None,
+    location: Optional[str] = None,
+    site: Optional[str] = None,
+) -> list:
+    """WHERE clauses for the history filters; Jalali dates compare as zero-padded strings."""
+    criteria = []
+    if date:
+        criteria.append(ShiftHistory.date_jalali == date)
+    if start:
+        criteria.append(ShiftHistory.date_jalali >= start)
+    if end:
+        criteria.append(ShiftHistory.date_jalali <= end)
+    if guard:
+        criteria.append(ShiftHistory.guard_name == guard)
+    if location:
+        criteria.append(ShiftHistory.location_name == location)
+    if site:
+        criteria.append(ShiftHistory.site == site)
+    return criteria
+
+
+def history_to_dict(row: ShiftHistory) -> dict:
+    return {
+        "id": row.id,
+        "date_jalali": row.date_jalali,
+        "guard_name": row.guard_name,
+        "location_name": row.location_name,
+        "start": row.start,
+        "end": row.end,
+        "kind": row.kind,
+        "site": row.site,
+        "created_at": row.created_at,
+    }
+
+
+def _keyset(criteria: list, after_id: Optional[int]):
+    statement = select(ShiftHistory).where(*criteria)
+    if after_id is not None:
+        statement = statement.where(ShiftHistory.id > after_id)
+    return statement.order_by(ShiftHistory.id)
+
+
+def _merge(
+    live: Iterable[dict], archived: Iterable[dict], after_id: Optional[int], limit: Optional[int]
+) -> Iterator[dict]:
+    """Live and archived rows in one id order; ``archived`` is already id-sorted and read only as far as needed."""
+    if after_id is not None:
+        archived = (row for row in archived if row["id"] > after_id)
+    return islice(heapq.merge(live, archived, key=lambda row: row["id"]), limit)
+
+
+def page_history(
+    session: Session,
+    criteria: list,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = HISTORY_PAGE_SIZE,
+    archived: Iterable[dict] = (),
+) -> List[dict]:
+    """One keyset page: rows with ``id > after_id`` in id order, at most ``limit`` (``None``: all).
+
+    ``archived`` rows (from ``history_archive.iter_archived_history``) are merged in.
+    """
+    live = (history_to_dict(row) for row in session.exec(_keyset(criteria, after_id).limit(limit)))
+    return list(_merge(live, archived, after_id, limit))
+
+
+def iter_history_ndjson(
+    session: Session,
+    criteria: list,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    archived: Iterable[dict] = (),
+) -> Iterator[bytes]:
+    statement = _keyset(criteria, after_id)
+    if limit is not None:
+        statement = statement.limit(limit)
+    live = (history_to_dict(row) for row in session.exec(statement.execution_options(yield_per=HISTORY_PAGE_SIZE)))
+    lines: List[str] = []
+    for record in _merge(live, archived, after_id, limit):
+        record = {**record, "created_at": record["created_at"].isoformat()}
+        lines.append(json.dumps(record, ensure_ascii=False))
+        if len(lines) == HISTORY_PAGE_SIZE:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode("utf-8")
@@ -0,0 +1,347 @@
+"""Closed months of ``ShiftHistory`` moved out of SQLite into gzip'd NDJSON.
+
+Layout: ``<archive_dir>/<site>/<YYYY-MM>.ndjson.gz`` per Jalali month. Each
+archive run appends one gzip member to the month's file; a member starts with
+a header line (``{"format": "shift-history", ...}`` with the row count, id
+range and dates it holds) followed by one history row per line. Concatenated
+members read back as a single stream.
+
+A day can be archived more than once (re-planned after archiving, or a run
+interrupted between writing the file and deleting the rows), so readers take
+each day from the last member that holds it, and rows still in the live
+table win over archived ones.
+"""
+from __future__ import annotations
+
+import gzip
+import heapq
+import io
+import json
+import os
+import threading
+import zlib
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+import jdatetime
+from sqlalchemy import delete, func
+from sqlmodel import Session, select
+
+from ..core.config import get_settings
+from ..core.responses import orjson
+from ..models.shift_history import ShiftHistory
+from .history import history_to_dict
+
+ARCHIVE_FORMAT = "shift-history"
+ARCHIVE_VERSION = 1
+ARCHIVE_SUFFIX = ".ndjson.gz"
+
+loads = orjson.loads if orjson is not None else json.loads
+
+
+def archive_root(archive_dir: Optional[str | Path] = None) -> Path:
+    return Path(archive_dir or get_settings().history_archive_dir)
+
+
+def month_of(date_jalali: str) -> str:
+    """``1403/05`` for ``1403/05/02``."""
+    return date_jalali[:7]
+
+
+def current_month() -> str:
+    return jdatetime.date.today().strftime("%Y/%m")
+
+
+def _is_dir_name(site: str) -> bool:
+    return bool(site) and not site.startswith(".") and "/" not in site and "\\" not in site
+
+
+def _site_dir(root: Path, site: str) -> Path:
+    if not _is_dir_name(site):
+        raise ValueError(f"Site name cannot be used as an archive directory: {site!r}")
+    return root / site
+
+
+def month_path(root: Path, site: str, month: str) -> Path:
+    return _site_dir(root, site) / f"{month.replace('/', '-')}{ARCHIVE_SUFFIX}"
+
+
+def _encode(record: dict) -> str:
+    return json.dumps({**record, "created_at": record["created_at"].isoformat()}, ensure_ascii=False)
+
+
+def _append_member(path: Path, site: str, month: str, records: List[dict]) -> None:
+    header = {
+        "format": ARCHIVE_FORMAT,
+        "version": ARCHIVE_VERSION,
+        "site": site,
+        "month": month,
+        "rows": len(records),
+        "min_id": records[0]["id"],
+        "max_id": records[-1]["id"],
+        "dates": sorted({record["date_jalali"] for record in records}),
+        "archived_at": datetime.utcnow().isoformat(),
+    }
+    body = "\n".join([json.dumps(header, ensure_ascii=False), *(_encode(record) for record in records)]) + "\n"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("ab") as handle:
+        handle.write(gzip.compress(body.encode("utf-8")))
+        handle.flush()
+        os.fsync(handle.fileno())
+
+
+def archive_history(
+    session: Session,
+    site: Optional[str] = None,
+    before: Optional[str] = None,
+    archive_dir: Optional[str | Path] = None,
+) -> List[dict]:
+    """Move every month earlier than ``before`` (default: the current Jalali month) into the archive.
+
+    Each month is written and fsynced before its rows are deleted, one commit
+    per month. The month holding the table's newest row is left for a later
+    run: SQLite reuses the largest rowid once it is deleted, and archived ids
+    must stay unique for keyset pages that read through to the archive.
+    Returns one summary per archived month.
+    """
+    root = archive_root(archive_dir)
+    before = before or current_month()
+    newest_id = session.exec(select(func.max(ShiftHistory.id))).one()
+    criteria = [ShiftHistory.date_jalali < f"{before}/00"]
+    if site:
+        criteria.append(ShiftHistory.site == site)
+    months = session.exec(
+        select(ShiftHistory.site, func.substr(ShiftHistory.date_jalali, 1, 7), func.max(ShiftHistory.id))
+        .where(*criteria)
+        .group_by(ShiftHistory.site, func.substr(ShiftHistory.date_jalali, 1, 7))
+        .order_by(ShiftHistory.site, func.substr(ShiftHistory.date_jalali, 1, 7))
+    ).all()
+    archived = []
+    for month_site, month, max_id in months:
+        if max_id == newest_id:
+            continue
+        path = month_path(root, month_site, month)
+        in_month = [
+            ShiftHistory.site == month_site,
+            ShiftHistory.date_jalali >= f"{month}/00",
+            ShiftHistory.date_jalali <= f"{month}/99",
+        ]
+        records = [
+            history_to_dict(row)
+            for row in session.exec(select(ShiftHistory).where(*in_month).order_by(ShiftHistory.id))
+        ]
+        _append_member(path, month_site, month, records)
+        session.execute(delete(ShiftHistory).where(*in_month))
+        session.commit()
+        archive_index.forget(path)
+        archived.append({"site": month_site, "month": month, "rows": len(records), "path": str(path)})
+    return archived
+
+
+# -- reading -------------------------------------------------------------
+
+
+@dataclass(frozen=True)
+class ArchiveMember:
+    """Where one gzip member sits in its file and what its header says it holds."""
+
+    offset: int
+    length: int
+    min_id: int
+    max_id: int
+    dates: tuple[str, ...]
+    # days a later member of the same file archived again
+    superseded: frozenset[str]
+
+
+def _scan_members(path: Path) -> List[ArchiveMember]:
+    """Member offsets and headers of one month file; a torn trailing member is ignored."""
+    data = path.read_bytes()
+    headers = []
+    offset = 0
+    while offset < len(data):
+        inflater = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        body = inflater.decompress(data[offset:])
+        if not inflater.eof:
+            break  # an append cut short; its rows were never deleted from the table
+        end = len(data) - len(inflater.unused_data)
+        headers.append((offset, end - offset, json.loads(body[: body.index(b"\n")])))
+        offset = end
+    members: List[ArchiveMember] = []
+    later: set[str] = set()
+    for offset, length, header in reversed(headers):
+        dates = tuple(header["dates"])
+        superseded = frozenset(later.intersection(dates))
+        members.append(ArchiveMember(offset, length, header["min_id"], header["max_id"], dates, superseded))
+        later.update(dates)
+    members.reverse()
+    return members
+
+
+def _member_rows(path: Path, member: ArchiveMember) -> Iterator[dict]:
+    with path.open("rb") as handle:
+        handle.seek(member.offset)
+        raw = handle.read(member.length)
+    with gzip.GzipFile(fileobj=io.BytesIO(raw)) as stream:
+        next(stream)  # header
+        for line in stream:
+            record = loads(line)
+            record["created_at"] = datetime.fromisoformat(record["created_at"])
+            yield record
+
+
+class ArchiveIndex:
+    """Member headers of each month file, rescanned when the file's size or mtime changes.
+
+    Only headers are kept, so the index stays small however many months
+    are archived; rows are read from disk on every request.
+    """
+
+    def __init__(self):
+        self._entries: dict[Path, tuple[tuple[int, int], List[ArchiveMember]]] = {}
+        self._lock = threading.Lock()
+
+    def members(self, path: Path) -> List[ArchiveMember]:
+        stat = path.stat()
+        version = (stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            entry = self._entries.get(path)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        members = _scan_members(path)
+        with self._lock:
+            self._entries[path] = (version, members)
+        return members
+
+    def forget(self, path: Path) -> None:
+        with self._lock:
+            self._entries.pop(path, None)
+
+
+archive_index = ArchiveIndex()
+
+
+def archived_months(root: Path, site: Optional[str] = None) -> Iterator[tuple[str, str, Path]]:
+    """``(site, month, path)`` for every archive file, or only ``site``'s."""
+    if not root.is_dir() or (site and not _is_dir_name(site)):
+        return
+    site_dirs = [_site_dir(root, site)] if site else sorted(p for p in root.iterdir() if p.is_dir())
+    for site_dir in site_dirs:
+        for path in sorted(site_dir.glob(f"*{ARCHIVE_SUFFIX}")):
+            yield site_dir.name, path.name[: -len(ARCHIVE_SUFFIX)].replace("-", "/"), path
+
+
+def iter_archived_history(
+    session: Session,
+    date: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    guard: Optional[str] = None,
+    location: Optional[str] = None,
+    site: Optional[str] = None,
+    after_id: Optional[int] = None,
+    archive_dir: Optional[str | Path] = None,
+) -> Iterator[dict]:
+    """Archived rows matching the ``history_criteria`` filters with ``id > after_id``, in id order.
+
+    Which members to read is settled up front from their headers: months
+    the date filters miss, members wholly at or below ``after_id`` and days
+    that are live again are never decompressed. The rest are opened lazily,
+    each only once the merge reaches its lowest id, so a keyset page reads
+    just the members it needs. The database is queried before this returns.
+    """
+    if date:
+        start = end = date
+    picked: List[tuple[str, Path, ArchiveMember, set[str]]] = []
+    for month_site, month, path in archived_months(archive_root(archive_dir), site):
+        if (start and month < month_of(start)) or (end and month > month_of(end)):
+            continue
+        for member in archive_index.members(path):
+            if after_id is not None and member.max_id <= after_id:
+                continue
+            days = {
+                day
+                for day in member.dates
+                if day not in member.superseded and (not start or day >= start) and (not end or day <= end)
+            }
+            if days:
+                picked.append((month_site, path, member, days))
+    if not picked:
+        return iter(())
+    live_days = set(
+        session.exec(
+            select(ShiftHistory.site, ShiftHistory.date_jalali)
+            .where(ShiftHistory.date_jalali.in_({day for *_, days in picked for day in days}))
+            .distinct()
+        ).all()
+    )
+    readers = []
+    for month_site, path, member, days in picked:
+        days = {day for day in days if (month_site, day) not in live_days}
+        if days:
+            readers.append((member.min_id, _filtered_rows(path, member, days, guard, location, after_id)))
+    return _merge_by_id(readers)
+
+
+def _filtered_rows(
+    path: Path,
+    member: ArchiveMember,
+    days: set[str],
+    guard: Optional[str],
+    location: Optional[str],
+    after_id: Optional[int],
+) -> Iterator[dict]:
+    for row in _member_rows(path, member):
+        if (
+            row["date_jalali"] in days
+            and (after_id is None or row["id"] > after_id)
+            and (not guard or row["guard_name"] == guard)
+            and (not location or row["location_name"] == location)
+        ):
+            yield row
+
+
+def _merge_by_id(readers: List[tuple[int, Iterator[dict]]]) -> Iterator[dict]:
+    """Merge id-sorted row streams, starting each only once no row below its lowest id is left."""
+    readers.sort(key=lambda reader: reader[0])
+    heap: list = []
+    opened = 0
+    while heap or opened < len(readers):
+        while opened < len(readers) and (not heap or readers[opened][0] <= heap[0][0]):
+            rows = readers[opened][1]
+            row = next(rows, None)
+            if row is not None:
+                heapq.heappush(heap, (row["id"], opened, row, rows))
+            opened += 1
+        if not heap:
+            continue
+        _, index, row, rows = heapq.heappop(heap)
+        yield row
+        following = next(rows, None)
+        if following is not None:
+            heapq.heappush(heap, (following["id"], index, following, rows))
+
+
+def archived_history(
+    session: Session,
+    date: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    guard: Optional[str] = None,
+    location: Optional[str] = None,
+    site: Optional[str] = None,
+    archive_dir: Optional[str | Path] = None,
+) -> List[dict]:
+    """``iter_archived_history`` as a list."""
+    return list(
+        iter_archived_history(
+            session, date=date, start=start, end=end, guard=guard, location=location, site=site, archive_dir=archive_dir
+        )
+    )
+
+
+def archived_sites(archive_dir: Optional[str | Path] = None) -> List[str]:
+    root = archive_root(archive_dir)
+    return sorted(p.name for p in root.iterdir() if p.is_dir()) if root.is_dir() else []
@@ -1,18 +1,28 @@
 from __future__ import annotations
 
 import csv
+import heapq
 import io
+from contextlib import contextmanager
+from datetime import datetime
+from operator import itemgetter
 from pathlib import Path
-from typing import Iterable, List
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence
 
 import yaml
 from fastapi import UploadFile
+from sqlalchemy import delete, insert, update
 from sqlmodel import Session, select
 
 from ..db import DATA_DIR
 from ..models.lifeguard import Lifeguard
 from ..models.location import Location
 from ..models.setting import Setting
+from ..models.shift_history import ShiftHistory
+from ..models.site import DEFAULT_SITE
+from .history import history_criteria
+from .history_archive import iter_archived_history
+from .settings_snapshot import SettingsSnapshot, load_setting, new_setting
 
 
 def seed_if_empty(session: Session) -> None:
@@ -24,82 +34,213 @@ def seed_if_empty(session: Session) -> None:
         load_settings_from_yaml(DATA_DIR / "settings.yaml", session)
 
 
-def _read_csv(path: Path | UploadFile) -> Iterable[dict[str, str]]:
-    if isinstance(path, UploadFile):
-        data = path.file.read().decode("utf-8")
+@contextmanager
+def _open_csv(path: Path | UploadFile) -> Iterator[Iterator[dict[str, str]]]:
+    """Yield a row iterator over ``path`` without reading the whole file into memory."""
+    if isinstance(path, (str, Path)):
+        with Path(path).open(encoding="utf-8", newline="") as stream:
+            yield csv.DictReader(stream)
+        return
+    # FastAPI hands handlers Starlette's UploadFile, which is not an instance
+    # of fastapi.UploadFile, so anything that is not a path is an upload.
+    stream = io.TextIOWrapper(path.file, encoding="utf-8", newline="")
+    try:
+        yield csv.DictReader(stream)
+    finally:
+        stream.detach()
         path.file.seek(0)
-    else:
-        data = Path(path).read_text(encoding="utf-8")
-    reader = csv.DictReader(io.StringIO(data))
-    return list(reader)
 
 
-def load_lifeguards_from_csv(path: Path | UploadFile, session: Session) -> None:
-    rows = _read_csv(path)
-    session.query(Lifeguard).delete()
-    session.commit()
-    records: List[Lifeguard] = []
-    for row in rows:
-        records.append(
-            Lifeguard(
-                name=row.get("name"),
-                experience=row.get("experience", "medium"),
-                present=str(row.get("present", "TRUE")).upper() == "TRUE",
-                role=row.get("role", "ناجی") or "ناجی",
-                lunch_at=row.get("lunch_at", "-"),
-                backup_name=row.get("backup_name", "-"),
-                swap_at=row.get("swap_at", "-"),
-                team=row.get("team"),
-            )
-        )
-    session.add_all(records)
-    session.commit()
+def _flag(value: Optional[str], default: str) -> bool:
+    return str(value if value is not None else default).upper() == "TRUE"
 
 
-def export_lifeguards_to_csv(session: Session) -> bytes:
-    guards = session.exec(select(Lifeguard)).all()
-    buffer = io.StringIO()
-    writer = csv.writer(buffer)
-    writer.writerow(["id", "name", "experience", "present", "role", "lunch_at", "backup_name", "swap_at", "team"])
-    for g in guards:
-        writer.writerow([g.id, g.name, g.experience, g.present, g.role, g.lunch_at, g.backup_name, g.swap_at, g.team])
-    return buffer.getvalue().encode("utf-8")
+def _lifeguard_fields(row: dict[str, str], site: str = DEFAULT_SITE) -> dict:
+    return {
+        "name": row.get("name"),
+        "site": site,
+        "experience": row.get("experience", "medium"),
+        "present": _flag(row.get("present"), "TRUE"),
+        "role": row.get("role", "ناجی") or "ناجی",
+        "lunch_at": row.get("lunch_at", "-"),
+        "backup_name": row.get("backup_name", "-"),
+        "swap_at": row.get("swap_at", "-"),
+        "team": row.get("team"),
+    }
 
 
-def load_locations_from_csv(path: Path | UploadFile, session: Session) -> None:
-    rows = _read_csv(path)
-    session.query(Location).delete()
-    session.commit()
-    records = [
-        Location(
-            name=row.get("name"),
-            difficulty=row.get("difficulty", "medium"),
-            is_water=str(row.get("is_water", "FALSE")).upper() == "TRUE",
-            active_today=str(row.get("active_today", "TRUE")).upper() == "TRUE",
-        )
-        for row in rows
-    ]
-    session.add_all(records)
-    session.commit()
+def _location_fields(row: dict[str, str], site: str = DEFAULT_SITE) -> dict:
+    return {
+        "name": row.get("name"),
+        "site": site,
+        "difficulty": row.get("difficulty", "medium"),
+        "is_water": _flag(row.get("is_water"), "FALSE"),
+        "active_today": _flag(row.get("active_today"), "TRUE"),
+    }
+
+
+def _upsert_by_name(
+    session: Session,
+    model,
+    parse: Callable[[dict[str, str]], dict],
+    rows: Iterable[dict[str, str]],
+    dry_run: bool = False,
+    site: str = DEFAULT_SITE,
+) -> dict:
+    """Make ``site``'s rows of ``model`` match ``rows``, keyed on ``name``.
 
+    Existing rows keep their ids: unchanged ones are left alone, changed ones
+    updated, missing ones (and extra rows sharing a name) deleted, new names
+    inserted. Writes go out as ``IMPORT_BATCH_ROWS``-sized executemany
+    batches inside one transaction committed at the end. A repeated name in
+    the file, a row without one, or a row whose ``site`` column names another
+    site is skipped. ``dry_run`` only computes the summary.
+    """
+    fields = list(parse({}, site))
+    # CSV has no NULL: an empty cell in a nullable column means NULL, not ''.
+    nullable = [field for field in fields if model.__table__.columns[field].nullable]
+    existing: dict[str, dict] = {}
+    stale_ids: List[int] = []
+    summary: dict = {"inserted": [], "updated": [], "deleted": [], "unchanged": 0, "skipped": 0, "dry_run": dry_run}
+    columns = select(model.id, *(getattr(model, field) for field in fields))
+    for row in session.exec(columns.where(model.site == site).order_by(model.id)):
+        values = dict(zip(fields, row[1:]), id=row[0])
+        if values["name"] in existing:
+            stale_ids.append(values["id"])
+            summary["deleted"].append(values["name"])
+        else:
+            existing[values["name"]] = values
 
-def export_locations_to_csv(session: Session) -> bytes:
-    locations = session.exec(select(Location)).all()
+    touch = {"updated_at": datetime.utcnow()} if "updated_at" in model.__table__.columns else {}
+    inserts: List[dict] = []
+    updates: List[dict] = []
+
+    def flush(limit: int) -> None:
+        for statement, batch in ((insert(model), inserts), (update(model), updates)):
+            if len(batch) >= limit and batch:
+                if not dry_run:
+                    session.execute(statement, batch)
+                batch.clear()
+
+    seen: set[str] = set()
+    try:
+        for row in rows:
+            record = parse(row, site)
+            for field in nullable:
+                if record[field] == "":
+                    record[field] = None
+            name = record["name"]
+            if not name or name in seen or row.get("site") not in (None, "", site):
+                summary["skipped"] += 1
+                continue
+            seen.add(name)
+            current = existing.get(name)
+            if current is None:
+                inserts.append({**record, **touch})
+                summary["inserted"].append(name)
+            elif any(current[field] != record[field] for field in fields):
+                updates.append({**record, **touch, "id": current["id"]})
+                summary["updated"].append(name)
+            else:
+                summary["unchanged"] += 1
+            flush(IMPORT_BATCH_ROWS)
+        flush(1)
+        for name, values in existing.items():
+            if name not in seen:
+                stale_ids.append(values["id"])
+                summary["deleted"].append(name)
+        if not dry_run:
+            for offset in range(0, len(stale_ids), IMPORT_BATCH_ROWS):
+                session.execute(delete(model).where(model.id.in_(stale_ids[offset : offset + IMPORT_BATCH_ROWS])))
+            session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    return summary
+
+
+def load_lifeguards_from_csv(
+    path: Path | UploadFile, session: Session, dry_run: bool = False, site: str = DEFAULT_SITE
+) -> dict:
+    with _open_csv(path) as rows:
+        return _upsert_by_name(session, Lifeguard, _lifeguard_fields, rows, dry_run=dry_run, site=site)
+
+
+LIFEGUARD_CSV_COLUMNS = [
+    "id", "name", "experience", "present", "role", "lunch_at", "backup_name", "swap_at", "team", "site"
+]
+LOCATION_CSV_COLUMNS = ["id", "name", "difficulty", "is_water", "active_today", "site"]
+HISTORY_CSV_COLUMNS = [
+    "id", "date_jalali", "guard_name", "location_name", "start", "end", "kind", "created_at", "site"
+]
+CSV_CHUNK_ROWS = 500
+IMPORT_BATCH_ROWS = 500
+
+
+def iter_csv(header: Sequence[str], rows: Iterable[Sequence]) -> Iterator[bytes]:
+    """Encode ``rows`` as UTF-8 CSV, yielding one chunk per ``CSV_CHUNK_ROWS`` rows."""
     buffer = io.StringIO()
     writer = csv.writer(buffer)
-    writer.writerow(["id", "name", "difficulty", "is_water", "active_today"])
-    for loc in locations:
-        writer.writerow([loc.id, loc.name, loc.difficulty, loc.is_water, loc.active_today])
-    return buffer.getvalue().encode("utf-8")
+    writer.writerow(header)
+    yield buffer.getvalue().encode("utf-8")
+    buffer.seek(0)
+    buffer.truncate()
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if count % CSV_CHUNK_ROWS == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
 
 
-def load_settings_from_yaml(path: Path | UploadFile, session: Session) -> None:
-    if isinstance(path, UploadFile):
-        data = yaml.safe_load(path.file)
-    else:
+def _stream_columns(session: Session, model, columns: Sequence[str], *criteria) -> Iterator[tuple]:
+    statement = select(*(getattr(model, column) for column in columns)).where(*criteria).order_by(model.id)
+    yield from session.exec(statement.execution_options(yield_per=CSV_CHUNK_ROWS))
+
+
+def iter_lifeguards_csv(session: Session, site: Optional[str] = None) -> Iterator[bytes]:
+    criteria = [Lifeguard.site == site] if site else []
+    return iter_csv(LIFEGUARD_CSV_COLUMNS, _stream_columns(session, Lifeguard, LIFEGUARD_CSV_COLUMNS, *criteria))
+
+
+def load_locations_from_csv(
+    path: Path | UploadFile, session: Session, dry_run: bool = False, site: str = DEFAULT_SITE
+) -> dict:
+    with _open_csv(path) as rows:
+        return _upsert_by_name(session, Location, _location_fields, rows, dry_run=dry_run, site=site)
+
+
+def iter_locations_csv(session: Session, site: Optional[str] = None) -> Iterator[bytes]:
+    criteria = [Location.site == site] if site else []
+    return iter_csv(LOCATION_CSV_COLUMNS, _stream_columns(session, Location, LOCATION_CSV_COLUMNS, *criteria))
+
+
+def iter_history_csv(
+    session: Session,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    guard: Optional[str] = None,
+    location: Optional[str] = None,
+    site: Optional[str] = None,
+) -> Iterator[bytes]:
+    filters = dict(start=start, end=end, guard=guard, location=location, site=site)
+    rows = _stream_columns(session, ShiftHistory, HISTORY_CSV_COLUMNS, *history_criteria(**filters))
+    archived = (
+        tuple(row[column] for column in HISTORY_CSV_COLUMNS) for row in iter_archived_history(session, **filters)
+    )
+    return iter_csv(HISTORY_CSV_COLUMNS, heapq.merge(rows, archived, key=itemgetter(0)))
+
+
+def load_settings_from_yaml(path: Path | UploadFile, session: Session, site: str = DEFAULT_SITE) -> None:
+    if isinstance(path, (str, Path)):
         data = yaml.safe_load(Path(path).read_text(encoding="utf-8"))
+    else:
+        data = yaml.safe_load(path.file)
     payload = Setting(
-        id=1,
+        id=(load_setting(session, site) or new_setting(session, site)).id,
+        site=site,
         start=data.get("start", "09:00"),
         end=data.get("end", "22:00"),
         shift_hours=float(data.get("shift_hours", 2.0)),
@@ -115,11 +256,8 @@ def load_settings_from_yaml(path: Path | UploadFile, session: Session) -> None:
     session.commit()
 
 
-def export_settings_to_yaml(session: Session) -> bytes:
-    setting = session.get(Setting, 1)
-    if not setting:
-        raise ValueError("Settings not configured")
-    payload = {
+def setting_to_dict(setting: Setting | SettingsSnapshot) -> dict:
+    return {
         "start": setting.start,
         "end": setting.end,
         "shift_hours": setting.shift_hours,
@@ -128,7 +266,23 @@ def export_settings_to_yaml(session: Session) -> bytes:
         "dinner_min": setting.dinner_min,
         "shower_min": setting.shower_min,
         "max_concurrent_lunch": setting.max_concurrent_lunch,
-        "check_windows_min": setting.check_windows,
+        "check_windows_min": list(setting.check_windows),
         "check_window_len_min": setting.check_window_len_min,
     }
-    return yaml.safe_dump(payload, allow_unicode=True).encode("utf-8")
+
+
+def export_settings_to_yaml(session: Session, site: str = DEFAULT_SITE) -> bytes:
+    setting = load_setting(session, site)
+    if not setting:
+        raise ValueError("Settings not configured")
+    return yaml.safe_dump(setting_to_dict(setting), allow_unicode=True).encode("utf-8")
+
+
+def iter_rows_csv(rows: List[dict]) -> Iterator[bytes]:
+    """Stream dict rows as CSV; columns are the union of keys in first-seen order."""
+    headers = list(dict.fromkeys(key for row in rows for key in row))
+    return iter_csv(headers, ([row.get(column, "") for column in headers] for row in rows))
+
+
+def rows_to_csv(rows: List[dict]) -> bytes:
+    return b"".join(iter_rows_csv(rows))
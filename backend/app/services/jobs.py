@@ -0,0 +1,279 @@
+from __future__ import annotations
+
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy import delete, update
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, select
+
+from ..core.config import get_settings
+from ..core.responses import dumps
+from ..models.background_job import BackgroundJob
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+# How often a running job writes its progress and looks for a cancel
+# request made through another worker process.
+PROGRESS_SYNC_S = 0.5
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job once cancellation has been requested."""
+
+
+class QueueFull(Exception):
+    """The queue already holds ``max_pending`` unfinished jobs."""
+
+
+class Job:
+    """One background task; workers report through ``progress``."""
+
+    def __init__(self, kind: str, job_id: Optional[str] = None):
+        self.id = job_id or uuid.uuid4().hex
+        self.kind = kind
+        self.status = QUEUED
+        self.done = 0
+        self.total: Optional[int] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow()
+        self.finished_at: Optional[datetime] = None
+        self.future: Optional[Future] = None
+        self._cancel = threading.Event()
+        self._sync: Optional[Callable[[Job], None]] = None
+
+    @classmethod
+    def from_record(cls, record: BackgroundJob) -> "Job":
+        job = cls(record.kind, record.id)
+        job.status = record.status
+        job.done = record.done
+        job.total = record.total
+        job.result = json.loads(record.result) if record.result is not None else None
+        job.error = record.error
+        job.created_at = record.created_at
+        job.finished_at = record.finished_at
+        if record.cancel_requested:
+            job._cancel.set()
+        return job
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel.is_set()
+
+    def progress(self, done: int, total: int) -> None:
+        """Record progress; also the point where a cancelled job stops."""
+        self.done, self.total = done, total
+        if self._sync is not None and not self._cancel.is_set():
+            self._sync(self)
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "done": self.done,
+            "total": self.total,
+            "result": self.result if self.status == DONE else None,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobQueue:
+    """Bounded thread pool for long handlers, polled by job id.
+
+    Job status, progress and results live in the ``BackgroundJob`` table, so
+    any worker process can answer a poll or take a cancel request; the job
+    itself runs in the pool of the process that accepted it. A running job
+    syncs its progress every ``PROGRESS_SYNC_S`` and stops at the first
+    progress report after a cancel made elsewhere.
+
+    At most ``max_pending`` jobs may be queued or running in this process;
+    ``submit`` raises ``QueueFull`` beyond that so a burst of clients cannot
+    grow the backlog without limit. Finished jobs are kept for polling,
+    oldest dropped first once more than ``keep_finished`` have accumulated.
+    """
+
+    def __init__(self, workers: int, max_pending: int, keep_finished: int, bind: Optional[Engine] = None):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.keep_finished = keep_finished
+        self._bind = bind
+        # live jobs of this process, for their futures and cancel events
+        self._jobs: Dict[str, Job] = {}
+        self._synced_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def bind(self) -> Engine:
+        if self._bind is None:
+            from ..db import engine
+
+            self._bind = engine
+        return self._bind
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+        return self._executor
+
+    def submit(self, kind: str, work: Callable[[Job], Any]) -> Job:
+        job = Job(kind)
+        job._sync = self._sync_progress
+        with self._lock:
+            if len(self._jobs) >= self.max_pending:
+                raise QueueFull()
+            with Session(self.bind) as session:
+                session.add(BackgroundJob(id=job.id, kind=kind, status=QUEUED, created_at=job.created_at))
+                self._prune(session)
+                session.commit()
+            self._jobs[job.id] = job
+            job.future = self._pool().submit(self._run, job, work)
+        return job
+
+    def _run(self, job: Job, work: Callable[[Job], Any]) -> None:
+        with self._lock:
+            if job.cancel_requested:
+                return
+            with Session(self.bind) as session:
+                # a cancel from another process may already have closed the job
+                started = session.execute(
+                    update(BackgroundJob)
+                    .where(BackgroundJob.id == job.id, BackgroundJob.status == QUEUED)
+                    .values(status=RUNNING)
+                ).rowcount
+                session.commit()
+            if not started:
+                job._cancel.set()
+                job.status = CANCELLED
+                self._forget(job)
+                return
+            job.status = RUNNING
+        try:
+            result = work(job)
+        except JobCancelled:
+            self._finish(job, CANCELLED)
+        except Exception as exc:  # noqa: BLE001 - reported to the poller instead
+            self._finish(job, FAILED, error=str(exc) or type(exc).__name__)
+        else:
+            self._finish(job, DONE, result=result)
+
+    def _sync_progress(self, job: Job) -> None:
+        now = time.monotonic()
+        last = self._synced_at.get(job.id)
+        if last is not None and now - last < PROGRESS_SYNC_S:
+            return
+        self._synced_at[job.id] = now
+        with Session(self.bind) as session:
+            cancel = session.execute(
+                update(BackgroundJob)
+                .where(BackgroundJob.id == job.id)
+                .values(done=job.done, total=job.total)
+                .returning(BackgroundJob.cancel_requested)
+            ).scalar()
+            session.commit()
+        if cancel:
+            job._cancel.set()
+
+    def _finish(self, job: Job, status: str, result: Any = None, error: Optional[str] = None) -> None:
+        finished_at = datetime.utcnow()
+        with self._lock:
+            with Session(self.bind) as session:
+                session.execute(
+                    update(BackgroundJob)
+                    .where(BackgroundJob.id == job.id)
+                    .values(
+                        status=status,
+                        done=job.done,
+                        total=job.total,
+                        result=dumps(result).decode("utf-8") if status == DONE else None,
+                        error=error,
+                        finished_at=finished_at,
+                    )
+                )
+                session.commit()
+            job.result = result
+            job.error = error
+            job.status = status
+            job.finished_at = finished_at
+            self._forget(job)
+
+    def _forget(self, job: Job) -> None:
+        self._jobs.pop(job.id, None)
+        self._synced_at.pop(job.id, None)
+
+    def _prune(self, session: Session) -> None:
+        stale = (
+            select(BackgroundJob.id)
+            .where(BackgroundJob.status.in_(FINISHED))
+            .order_by(BackgroundJob.created_at.desc())
+            .offset(self.keep_finished)
+        )
+        session.execute(delete(BackgroundJob).where(BackgroundJob.id.in_(stale)))
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with Session(self.bind) as session:
+            record = session.get(BackgroundJob, job_id)
+            return Job.from_record(record) if record is not None else None
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancel a queued job outright; a running one stops at its next progress report."""
+        with self._lock:
+            with Session(self.bind) as session:
+                record = session.get(BackgroundJob, job_id)
+                if record is None or record.status in FINISHED:
+                    return Job.from_record(record) if record is not None else None
+                record.cancel_requested = True
+                if record.status == QUEUED:
+                    record.status = CANCELLED
+                    record.finished_at = datetime.utcnow()
+                session.commit()
+                session.refresh(record)
+                snapshot = Job.from_record(record)
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job._cancel.set()
+                if snapshot.status == CANCELLED:
+                    job.status = CANCELLED
+                    job.finished_at = snapshot.finished_at
+                    if job.future is not None:
+                        job.future.cancel()
+                    self._forget(job)
+            return snapshot
+
+    def shutdown(self) -> None:
+        with self._lock:
+            live = list(self._jobs)
+            for job in self._jobs.values():
+                job._cancel.set()
+            executor, self._executor = self._executor, None
+        if live:
+            # jobs still queued here would never start; running ones stop at
+            # their next progress report and finish themselves
+            with Session(self.bind) as session:
+                session.execute(
+                    update(BackgroundJob)
+                    .where(BackgroundJob.id.in_(live), BackgroundJob.status == QUEUED)
+                    .values(status=CANCELLED, cancel_requested=True, finished_at=datetime.utcnow())
+                )
+                session.commit()
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+_settings = get_settings()
+job_queue = JobQueue(_settings.job_workers, _settings.job_queue_size, _settings.job_history_size)
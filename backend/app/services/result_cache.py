@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Optional
+
+from sqlmodel import Session, select
+
+from ..core.config import get_settings
+from ..models.lifeguard import Lifeguard
+from ..models.location import Location
+from ..models.site import DEFAULT_SITE
+from .allocation_engine import jalali_date
+from .import_export import setting_to_dict
+from .settings_snapshot import settings_snapshot
+from .workload import history_since, load_workload
+
+
+def allocation_fingerprint(session: Session, today: date, solver: str = "greedy", site: str = DEFAULT_SITE) -> str:
+    """Hash of everything ``AllocationEngine`` reads for ``today`` at ``site``.
+
+    The day's own history is left out on purpose: after a run it holds that
+    run's output, so including it would make every repeat a cache miss.
+    Writes to history from other paths invalidate the cache instead. The
+    cross-day workload totals are included without the rows of this day and
+    later ones, the same way the engine reads them, so planning a later day
+    does not change an earlier day's fingerprint.
+    """
+    guards = session.exec(
+        select(
+            Lifeguard.id,
+            Lifeguard.name,
+            Lifeguard.team,
+            Lifeguard.experience,
+            Lifeguard.role,
+            Lifeguard.lunch_at,
+            Lifeguard.backup_name,
+            Lifeguard.swap_at,
+        )
+        .where(Lifeguard.site == site, Lifeguard.present == True)  # noqa: E712
+        .order_by(Lifeguard.id)
+    ).all()
+    locations = session.exec(
+        select(Location.id, Location.name, Location.difficulty, Location.is_water)
+        .where(Location.site == site, Location.active_today == True)  # noqa: E712
+        .order_by(Location.id)
+    ).all()
+    setting = settings_snapshot(session, site)
+    payload = {
+        "date": today.isoformat(),
+        "site": site,
+        "solver": solver,
+        "guards": [list(row) for row in guards],
+        "locations": [list(row) for row in locations],
+        "setting": setting_to_dict(setting) if setting else None,
+    }
+    if get_settings().fairness_weight:
+        workload = load_workload(session, site, exclude=history_since(session, site, jalali_date(today)))
+        payload["workload"] = sorted(
+            [guard, dimension, key, minutes]
+            for guard, totals in workload.items()
+            for (dimension, key), minutes in totals.items()
+        )
+    encoded = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def etag_for(fingerprint: Optional[str], run_id: int) -> str:
+    """Runs are immutable, so the input fingerprint plus run id names one body."""
+    return f'"{(fingerprint or "none")[:32]}-{run_id}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {value.strip().removeprefix("W/") for value in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+class ResultCache:
+    """Thread-safe LRU of allocation results keyed by input fingerprint."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: OrderedDict[str, Any] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: Any) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+allocation_cache = ResultCache(get_settings().allocation_cache_size)
+
+
+def invalidate_allocation_cache() -> None:
+    allocation_cache.invalidate()
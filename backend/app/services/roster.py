@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Iterable, List
+
+from sqlalchemy import or_, update
+from sqlmodel import Session, select
+
+from ..models.site import DEFAULT_SITE
+
+
+def bulk_update(session: Session, model, items: Iterable[dict], site: str = DEFAULT_SITE) -> int:
+    """Apply partial updates keyed by ``id`` (or ``name`` when ``id`` is absent) in one transaction.
+
+    Keys resolve among the rows of ``site`` only, with a single query, and
+    every item is checked before anything is written; an unknown key, two
+    items hitting the same row or an item setting ``site`` raise
+    ``ValueError``. The updates then go out as one executemany per distinct
+    set of fields.
+    """
+    items = list(items)
+    ids = {item["id"] for item in items if item.get("id") is not None}
+    names = {item["name"] for item in items if item.get("id") is None}
+    by_id: dict[int, str] = {}
+    by_name: dict[str, List[int]] = {}
+    if items:
+        rows = session.exec(
+            select(model.id, model.name).where(model.site == site, or_(model.id.in_(ids), model.name.in_(names)))
+        )
+        for row_id, name in rows:
+            by_id[row_id] = name
+            by_name.setdefault(name, []).append(row_id)
+
+    errors: List[str] = []
+    targets: set[int] = set()
+    touch = {"updated_at": datetime.utcnow()} if "updated_at" in model.__table__.columns else {}
+    updates: List[dict] = []
+    for index, item in enumerate(items):
+        fields = {key: value for key, value in item.items() if key != "id"}
+        if "site" in fields:
+            errors.append(f"{index}: site cannot be changed by a bulk update")
+            continue
+        if item.get("id") is not None:
+            row_id = item["id"]
+            if row_id not in by_id:
+                errors.append(f"{index}: no row with id {row_id} at site {site!r}")
+                continue
+        else:
+            matches = by_name.get(item["name"], [])
+            if len(matches) != 1:
+                errors.append(f"{index}: {len(matches)} rows named {item['name']!r} at site {site!r}")
+                continue
+            row_id = matches[0]
+            fields.pop("name")
+        if row_id in targets:
+            errors.append(f"{index}: row {row_id} is updated twice")
+            continue
+        targets.add(row_id)
+        if fields:
+            updates.append({**fields, **touch, "id": row_id})
+    if errors:
+        raise ValueError("; ".join(errors))
+    if updates:
+        session.execute(update(model), updates)
+    session.commit()
+    return len(targets)
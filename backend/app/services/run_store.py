@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import json
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import delete
+from sqlmodel import Session, select
+
+from ..core.config import get_settings
+from ..models.allocation_run import AllocationRun
+from ..models.setting import Setting
+from ..models.site import DEFAULT_SITE
+from .import_export import setting_to_dict
+from .settings_snapshot import SettingsSnapshot
+
+
+def pack_rows(rows: List[dict]) -> str:
+    """Store rows column-wise so repeated keys are written once per run."""
+    columns = list(dict.fromkeys(key for row in rows for key in row))
+    packed = {"columns": columns, "rows": [[row.get(column) for column in columns] for row in rows]}
+    return json.dumps(packed, ensure_ascii=False, separators=(",", ":"))
+
+
+def unpack_rows(data: str) -> List[dict]:
+    packed = json.loads(data)
+    columns = packed["columns"]
+    return [
+        {column: value for column, value in zip(columns, values) if value is not None}
+        for values in packed["rows"]
+    ]
+
+
+def save_run(
+    session: Session,
+    result: dict,
+    date_jalali: str,
+    setting: Setting | SettingsSnapshot,
+    fingerprint: Optional[str] = None,
+    site: str = DEFAULT_SITE,
+) -> AllocationRun:
+    run = AllocationRun(
+        fingerprint=fingerprint,
+        date_jalali=date_jalali,
+        site=site,
+        caption=result["caption"],
+        wide=pack_rows(result["wide"]),
+        long=pack_rows(result["long"]),
+        settings=json.dumps(setting_to_dict(setting), ensure_ascii=False, separators=(",", ":")),
+    )
+    session.add(run)
+    session.commit()
+    session.refresh(run)
+    evict_runs(session)
+    return run
+
+
+def get_run(session: Session, run_id: int) -> Optional[AllocationRun]:
+    return session.get(AllocationRun, run_id)
+
+
+def latest_run(session: Session, site: Optional[str] = None) -> Optional[AllocationRun]:
+    statement = select(AllocationRun)
+    if site is not None:
+        statement = statement.where(AllocationRun.site == site)
+    return session.exec(statement.order_by(AllocationRun.id.desc()).limit(1)).first()
+
+
+def latest_run_id(session: Session, date_jalali: str, site: str = DEFAULT_SITE) -> Optional[int]:
+    """Id of the newest run of one day at ``site``, the one the day's history was written from."""
+    return session.exec(
+        select(AllocationRun.id)
+        .where(AllocationRun.date_jalali == date_jalali, AllocationRun.site == site)
+        .order_by(AllocationRun.id.desc())
+        .limit(1)
+    ).first()
+
+
+def evict_runs(session: Session, max_runs: Optional[int] = None, max_age: Optional[timedelta] = None) -> int:
+    """Drop runs older than ``max_age`` and all but the newest ``max_runs``."""
+    settings = get_settings()
+    max_runs = settings.run_store_max_runs if max_runs is None else max_runs
+    max_age = timedelta(days=settings.run_store_max_age_days) if max_age is None else max_age
+    removed = session.execute(
+        delete(AllocationRun).where(AllocationRun.created_at < datetime.utcnow() - max_age)
+    ).rowcount
+    cutoff = session.exec(
+        select(AllocationRun.id).order_by(AllocationRun.id.desc()).offset(max_runs).limit(1)
+    ).first()
+    if cutoff is not None:
+        removed += session.execute(delete(AllocationRun).where(AllocationRun.id <= cutoff)).rowcount
+    session.commit()
+    return removed
+
+
+def run_to_dict(run: AllocationRun) -> dict:
+    return {
+        "id": run.id,
+        "date_jalali": run.date_jalali,
+        "site": run.site,
+        "caption": run.caption,
+        "created_at": run.created_at,
+        "wide": unpack_rows(run.wide),
+        "long": unpack_rows(run.long),
+        "settings": json.loads(run.settings),
+    }
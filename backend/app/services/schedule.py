@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+GENERAL, WATER, CHECK = range(3)
+KINDS = ("General", "Water", "Check")
+
+# Wide-table column kinds; a column key is ``(kind, index, start, end)``.
+SLOT_COLUMN, CHECK_COLUMN = range(2)
+EMPTY_CELL = "--"
+
+
+@lru_cache(maxsize=2048)
+def clock_text(minutes: int) -> str:
+    """``HH:MM`` for minutes after midnight."""
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def history_fields(guard: str, location: str, start: str, end: str, kind: str) -> dict:
+    """One history row; checks are filed under ``چک - <location>``."""
+    return {
+        "guard_name": guard,
+        "location_name": f"چک - {location}" if kind == KINDS[CHECK] else location,
+        "start": start,
+        "end": end,
+        "kind": kind,
+    }
+
+
+def history_entry(entry: dict) -> dict:
+    """History row for one long-format assignment, such as those of a stored run."""
+    return history_fields(
+        entry["Assignee"], entry["Location"], entry["Start"], entry["End"], entry.get("Kind", KINDS[GENERAL])
+    )
+
+
+class Assignment(NamedTuple):
+    """One guard on one location for ``[start, end)`` minutes after midnight.
+
+    ``location`` and ``guard`` index ``Schedule.locations`` / ``Schedule.guards``.
+    """
+
+    location: int
+    guard: int
+    start: int
+    end: int
+    kind: int
+
+
+class Schedule:
+    """Compact record of one planned day.
+
+    The engine only appends ``Assignment`` tuples and points wide-table cells
+    at them; the dict rows the API, CSV exports and history table expect are
+    built from these records when they are serialized, not while planning.
+    """
+
+    __slots__ = ("guards", "locations", "entries", "rows", "caption", "team", "_guard_ids", "_location_ids")
+
+    def __init__(self, guards: Iterable[str] = (), locations: Iterable[str] = ()):
+        self.guards: List[str] = []
+        self.locations: List[str] = []
+        self._guard_ids: Dict[str, int] = {}
+        self._location_ids: Dict[str, int] = {}
+        for name in guards:
+            self.guard_id(name)
+        for name in locations:
+            self.location_id(name)
+        self.entries: List[Assignment] = []
+        # location id -> {column key -> entry indexes}, in insertion order
+        self.rows: Dict[int, Dict[tuple, tuple[int, ...]]] = {}
+        self.caption = ""
+        self.team: List[dict] = []
+
+    def guard_id(self, name: str) -> int:
+        index = self._guard_ids.get(name)
+        if index is None:
+            index = self._guard_ids[name] = len(self.guards)
+            self.guards.append(name)
+        return index
+
+    def location_id(self, name: str) -> int:
+        index = self._location_ids.get(name)
+        if index is None:
+            index = self._location_ids[name] = len(self.locations)
+            self.locations.append(name)
+        return index
+
+    def add(self, location: str, guard: str, start: int, end: int, kind: int) -> int:
+        """Record an assignment; returns its index for wide-table cells."""
+        self.entries.append(Assignment(self.location_id(location), self.guard_id(guard), start, end, kind))
+        return len(self.entries) - 1
+
+    def row(self, location: str) -> Dict[tuple, tuple[int, ...]]:
+        return self.rows.setdefault(self.location_id(location), {})
+
+    # -- serialization -------------------------------------------------
+
+    def cell_text(self, entries: tuple[int, ...]) -> str:
+        """Wide-table value: the guard, ``a (s-e) | b (s-e)`` for a swap, or ``--``."""
+        if not entries:
+            return EMPTY_CELL
+        if len(entries) == 1:
+            return self.guards[self.entries[entries[0]].guard]
+        return " | ".join(
+            f"{self.guards[entry.guard]} ({clock_text(entry.start)}-{clock_text(entry.end)})"
+            for entry in (self.entries[index] for index in entries)
+        )
+
+    def wide_row(self, location: str) -> Optional[dict]:
+        location_id = self._location_ids.get(location)
+        if location_id is None or location_id not in self.rows:
+            return None
+        return self._wide_row(location_id, self.rows[location_id])
+
+    def _wide_row(self, location_id: int, cells: Dict[tuple, tuple[int, ...]]) -> dict:
+        row = {"لوکیشن": self.locations[location_id]}
+        for column, entries in cells.items():
+            row[_header(column)] = self.cell_text(entries)
+        return row
+
+    def wide_rows(self) -> List[dict]:
+        return [self._wide_row(location_id, cells) for location_id, cells in self.rows.items()]
+
+    def long_row(self, entry: Assignment) -> dict:
+        return {
+            "Location": self.locations[entry.location],
+            "Start": clock_text(entry.start),
+            "End": clock_text(entry.end),
+            "Assignee": self.guards[entry.guard],
+            "Kind": KINDS[entry.kind],
+        }
+
+    def long_rows(self) -> List[dict]:
+        return [self.long_row(entry) for entry in self.entries]
+
+    def history_row(self, entry: Assignment) -> dict:
+        return history_fields(
+            self.guards[entry.guard],
+            self.locations[entry.location],
+            clock_text(entry.start),
+            clock_text(entry.end),
+            KINDS[entry.kind],
+        )
+
+    def iter_history(self) -> Iterator[dict]:
+        return (self.history_row(entry) for entry in self.entries)
+
+    def result(self) -> dict:
+        """The ``AllocationEngine.allocate`` payload."""
+        return {
+            "wide": self.wide_rows(),
+            "long": self.long_rows(),
+            "team": self.team,
+            "history": list(self.iter_history()),
+            "caption": self.caption,
+        }
+
+
+@lru_cache(maxsize=1024)
+def _header(column: tuple) -> str:
+    kind, index, start, end = column
+    if kind == CHECK_COLUMN:
+        return f"چک {index}"
+    return f"شیفت {index} ({clock_text(start)}-{clock_text(end)})"
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
+from typing import Optional
+
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+from ..core.config import get_settings
+from ..models.setting import Setting
+from ..models.site import DEFAULT_SITE
+
+
+@lru_cache(maxsize=1024)
+def clock_minutes(value: str) -> int:
+    """Minutes after midnight for an ``HH:MM`` string."""
+    parsed = datetime.strptime(value, "%H:%M")
+    return parsed.hour * 60 + parsed.minute
+
+
+@dataclass(frozen=True)
+class SettingsSnapshot:
+    """Immutable, pre-parsed copy of the ``Setting`` row.
+
+    Field names match the ORM row so ``setting_to_dict`` accepts either;
+    the derived whole-minute fields are what the engine actually reads.
+    """
+
+    start: str
+    end: str
+    shift_hours: float
+    special_hours: float
+    lunch_min: int
+    dinner_min: int
+    shower_min: int
+    max_concurrent_lunch: int
+    check_windows: tuple[int, ...]
+    check_window_len_min: int
+    start_min: int
+    end_min: int
+    shift_len_min: int
+    special_len_min: int
+    lunch_window_min: int
+
+    @classmethod
+    def from_setting(cls, setting: Setting) -> "SettingsSnapshot":
+        return cls(
+            start=setting.start,
+            end=setting.end,
+            shift_hours=setting.shift_hours,
+            special_hours=setting.special_hours,
+            lunch_min=setting.lunch_min,
+            dinner_min=setting.dinner_min,
+            shower_min=setting.shower_min,
+            max_concurrent_lunch=setting.max_concurrent_lunch,
+            check_windows=tuple(setting.check_windows),
+            check_window_len_min=setting.check_window_len_min,
+            start_min=clock_minutes(setting.start),
+            end_min=clock_minutes(setting.end),
+            shift_len_min=round(setting.shift_hours * 60),
+            special_len_min=round(setting.special_hours * 60),
+            lunch_window_min=setting.lunch_min + setting.shower_min,
+        )
+
+
+def load_setting(session: Session, site: str = DEFAULT_SITE) -> Optional[Setting]:
+    """The ``Setting`` row of ``site``; the default site's row keeps id 1."""
+    return session.exec(select(Setting).where(Setting.site == site)).first()
+
+
+def new_setting(session: Session, site: str) -> Setting:
+    """Unsaved ``Setting`` row for a site that has none yet."""
+    if site == DEFAULT_SITE and session.get(Setting, 1) is None:
+        return Setting(id=1, site=site)
+    return Setting(id=(session.exec(select(func.max(Setting.id))).one() or 0) + 1, site=site)
+
+
+class SettingsCache:
+    """Per-database, per-site snapshot cache.
+
+    Entries are dropped by ``invalidate`` after writes through the API and
+    also expire after ``ttl`` seconds, so writes made by another process
+    (a second worker, a batch job) are picked up eventually.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries: dict[tuple[str, str], tuple[float, SettingsSnapshot]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, session: Session, site: str = DEFAULT_SITE) -> Optional[SettingsSnapshot]:
+        key = (str(session.get_bind().url), site)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and now - entry[0] < self.ttl:
+            return entry[1]
+        setting = load_setting(session, site)
+        if setting is None:
+            return None
+        snapshot = SettingsSnapshot.from_setting(setting)
+        with self._lock:
+            self._entries[key] = (now, snapshot)
+        return snapshot
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+settings_cache = SettingsCache(get_settings().setting_cache_ttl_s)
+
+
+def settings_snapshot(session: Session, site: str = DEFAULT_SITE) -> Optional[SettingsSnapshot]:
+    return settings_cache.get(session, site)
+
+
+def invalidate_settings_cache() -> None:
+    settings_cache.invalidate()
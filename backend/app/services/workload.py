@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import delete, insert
+from sqlmodel import Session, select
+
+from ..models.guard_workload import GuardWorkload
+from ..models.location import Location
+from ..models.shift_history import ShiftHistory
+from ..models.site import DEFAULT_SITE
+from .history_archive import archived_history, archived_sites
+from .settings_snapshot import clock_minutes
+
+LOCATION = "location"
+DIFFICULTY = "difficulty"
+KIND = "kind"
+DIMENSIONS = (LOCATION, DIFFICULTY, KIND)
+UNKNOWN_DIFFICULTY = "unknown"
+REBUILD_BATCH_ROWS = 5000
+
+# Columns of a history row, in the order ``history_dicts`` unpacks them.
+HISTORY_COLUMNS = (
+    ShiftHistory.guard_name,
+    ShiftHistory.location_name,
+    ShiftHistory.start,
+    ShiftHistory.end,
+    ShiftHistory.kind,
+)
+
+Totals = Dict[tuple[str, str, str], List[int]]
+
+
+def history_dicts(rows: Iterable) -> List[dict]:
+    """History dicts from ``HISTORY_COLUMNS`` result rows."""
+    return [
+        {"guard_name": guard, "location_name": location, "start": start, "end": end, "kind": kind}
+        for guard, location, start, end, kind in rows
+    ]
+
+
+def _difficulties(session: Session, site: str, names: Iterable[str]) -> Dict[str, str]:
+    names = list(set(names))
+    if not names:
+        return {}
+    rows = session.exec(select(Location.name, Location.difficulty).where(Location.site == site, Location.name.in_(names)))
+    return {name: difficulty for name, difficulty in rows}
+
+
+def _accumulate(totals: Totals, rows: Iterable[dict], difficulties: Dict[str, str], sign: int) -> None:
+    """Add (``sign`` = 1) or take away (-1) the minutes and shift count of ``rows``.
+
+    Every row counts under its location and kind; checks are not counted
+    under a difficulty since they are short visits, not a post of that level.
+    """
+    for row in rows:
+        minutes = clock_minutes(row["end"]) - clock_minutes(row["start"])
+        keys = [(LOCATION, row["location_name"]), (KIND, row["kind"])]
+        if row["kind"] != "Check":
+            keys.append((DIFFICULTY, difficulties.get(row["location_name"], UNKNOWN_DIFFICULTY)))
+        for dimension, key in keys:
+            total = totals[(row["guard_name"], dimension, key)]
+            total[0] += sign * minutes
+            total[1] += sign
+
+
+def apply_workload_delta(session: Session, site: str, removed: Iterable[dict], added: Iterable[dict]) -> None:
+    """Fold history rows leaving (``removed``) and entering (``added``) the table into the totals.
+
+    Runs inside the caller's transaction, so the totals commit together with
+    the history write that caused them.
+    """
+    removed, added = list(removed), list(added)
+    difficulties = _difficulties(session, site, (row["location_name"] for row in removed + added))
+    totals: Totals = defaultdict(lambda: [0, 0])
+    _accumulate(totals, removed, difficulties, -1)
+    _accumulate(totals, added, difficulties, 1)
+    changed = {key: delta for key, delta in totals.items() if delta != [0, 0]}
+    if not changed:
+        return
+    existing = {
+        (row.guard_name, row.dimension, row.key): row
+        for row in session.exec(
+            select(GuardWorkload).where(
+                GuardWorkload.site == site, GuardWorkload.guard_name.in_({key[0] for key in changed})
+            )
+        )
+    }
+    now = datetime.utcnow()
+    for (guard, dimension, key), (minutes, shifts) in changed.items():
+        row = existing.get((guard, dimension, key))
+        if row is None:
+            row = GuardWorkload(site=site, guard_name=guard, dimension=dimension, key=key)
+        row.minutes += minutes
+        row.shifts += shifts
+        row.updated_at = now
+        if row.shifts == 0 and row.minutes == 0:
+            if row.id is not None:
+                session.delete(row)
+        else:
+            session.add(row)
+
+
+def history_since(session: Session, site: str, date_jalali: str) -> List[dict]:
+    """History dicts of ``site`` dated ``date_jalali`` or later, live and archived, with ``date_jalali`` set."""
+    live = session.exec(
+        select(ShiftHistory.date_jalali, *HISTORY_COLUMNS).where(
+            ShiftHistory.site == site, ShiftHistory.date_jalali >= date_jalali
+        )
+    )
+    rows = [
+        {"date_jalali": day, "guard_name": guard, "location_name": location, "start": start, "end": end, "kind": kind}
+        for day, guard, location, start, end, kind in live
+    ]
+    return rows + archived_history(session, start=date_jalali, site=site)
+
+
+def load_workload(
+    session: Session, site: str = DEFAULT_SITE, exclude: Iterable[dict] = ()
+) -> Dict[str, Dict[tuple[str, str], int]]:
+    """Minutes per guard by ``(dimension, key)`` for the difficulty and kind dimensions.
+
+    History rows in ``exclude`` are taken back out of the totals. The engine
+    passes ``history_since`` of the day being planned, so a day is scored
+    against earlier days only and planning later days leaves it unchanged.
+    """
+    totals: Totals = defaultdict(lambda: [0, 0])
+    for guard, dimension, key, minutes in session.exec(
+        select(GuardWorkload.guard_name, GuardWorkload.dimension, GuardWorkload.key, GuardWorkload.minutes).where(
+            GuardWorkload.site == site, GuardWorkload.dimension.in_((DIFFICULTY, KIND))
+        )
+    ):
+        totals[(guard, dimension, key)][0] += minutes
+    exclude = list(exclude)
+    if exclude:
+        _accumulate(totals, exclude, _difficulties(session, site, (row["location_name"] for row in exclude)), -1)
+    workload: Dict[str, Dict[tuple[str, str], int]] = defaultdict(dict)
+    for (guard, dimension, key), (minutes, _) in totals.items():
+        if dimension != LOCATION and minutes:
+            workload[guard][(dimension, key)] = minutes
+    return dict(workload)
+
+
+def rebuild_workload(session: Session, site: Optional[str] = None, since: Optional[str] = None) -> int:
+    """Recompute the totals from ``ShiftHistory`` (rows on or after ``since`` only); returns rows written.
+
+    Use it to backfill after upgrading, after history was edited outside the
+    allocation paths, or with ``since`` to start a new fairness window.
+    Archived months count as well.
+    """
+    sites = [site] if site else sorted(set(session.exec(select(ShiftHistory.site).distinct())) | set(archived_sites()))
+    session.execute(delete(GuardWorkload).where(*([GuardWorkload.site == site] if site else [])))
+    written = 0
+    now = datetime.utcnow()
+    for current in sites:
+        criteria = [ShiftHistory.site == current]
+        if since:
+            criteria.append(ShiftHistory.date_jalali >= since)
+        difficulties = {
+            name: difficulty
+            for name, difficulty in session.exec(
+                select(Location.name, Location.difficulty).where(Location.site == current)
+            )
+        }
+        totals: Totals = defaultdict(lambda: [0, 0])
+        statement = select(*HISTORY_COLUMNS).where(*criteria).execution_options(yield_per=REBUILD_BATCH_ROWS)
+        for partition in session.exec(statement).partitions():
+            _accumulate(totals, history_dicts(partition), difficulties, 1)
+        _accumulate(totals, archived_history(session, start=since, site=current), difficulties, 1)
+        rows = [
+            {
+                "site": current,
+                "guard_name": guard,
+                "dimension": dimension,
+                "key": key,
+                "minutes": minutes,
+                "shifts": shifts,
+                "updated_at": now,
+            }
+            for (guard, dimension, key), (minutes, shifts) in totals.items()
+        ]
+        if rows:
+            session.execute(insert(GuardWorkload), rows)
+        written += len(rows)
+    session.commit()
+    return written
@@ -0,0 +1,110 @@
+"""Phase-by-phase timing of ``AllocationEngine`` on synthetic rosters.
+
+Run from ``backend/``::
+
+    python -m benchmarks.bench_allocation                    # compare with baseline
+    python -m benchmarks.bench_allocation --update-baseline  # record a new baseline
+
+Exits with status 1 when any phase regresses beyond ``--threshold`` and
+with status 2 when there is no baseline to compare with. The committed
+``baselines/allocation.json`` was recorded on a single-CPU Linux box; record
+your own before comparing on other hardware.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import tempfile
+from datetime import date
+from pathlib import Path
+from time import perf_counter
+from typing import Dict, List
+
+from sqlmodel import Session
+
+from app.services.allocation_engine import AllocationEngine
+
+from .synthetic import RosterProfile, build_database
+
+DEFAULT_GRID = ("50x15", "120x40", "300x100", "600x200")
+BASELINE_PATH = Path(__file__).resolve().parent / "baselines" / "allocation.json"
+# Phases faster than this are too noisy to judge.
+MIN_COMPARABLE_MS = 2.0
+BENCH_DAY = date(2024, 7, 22)
+
+
+def run_case(workdir: Path, profile: RosterProfile, repeats: int) -> Dict[str, float]:
+    """Median milliseconds per phase (plus ``total``) over ``repeats`` runs."""
+    db_engine = build_database(workdir / f"{profile.label}.db", profile)
+    samples: Dict[str, List[float]] = {}
+    try:
+        for _ in range(repeats):
+            with Session(db_engine) as session:
+                began = perf_counter()
+                engine = AllocationEngine(session, today=BENCH_DAY)
+                engine.allocate()
+                total = perf_counter() - began
+            for phase, seconds in {**engine.timings, "total": total}.items():
+                samples.setdefault(phase, []).append(seconds * 1000)
+    finally:
+        db_engine.dispose()
+    return {phase: round(statistics.median(values), 3) for phase, values in samples.items()}
+
+
+def compare(current: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], threshold: float) -> List[str]:
+    regressions = []
+    for case, phases in current.items():
+        for phase, ms in phases.items():
+            before = baseline.get(case, {}).get(phase)
+            if before is None or max(before, ms) < MIN_COMPARABLE_MS:
+                continue
+            if ms > before * (1 + threshold):
+                regressions.append(f"{case} {phase}: {before:.2f} ms -> {ms:.2f} ms (+{(ms / before - 1) * 100:.0f}%)")
+    return regressions
+
+
+def _profile(label: str, seed: int) -> RosterProfile:
+    guards, locations = (int(part) for part in label.split("x"))
+    return RosterProfile(guards=guards, locations=locations, seed=seed)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--grid", nargs="+", default=list(DEFAULT_GRID), help="GUARDSxLOCATIONS cases")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown ratio, e.g. 0.25 = 25%%")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    results: Dict[str, Dict[str, float]] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for label in args.grid:
+            results[label] = run_case(Path(tmp), _profile(label, args.seed), args.repeats)
+            phases = "  ".join(f"{phase}={ms:.1f}" for phase, ms in results[label].items())
+            print(f"{label:>9}  {phases}")
+
+    if args.update_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        payload = {"python": platform.python_version(), "machine": platform.machine(), "seed": args.seed, "results": results}
+        args.baseline.write_text(json.dumps(payload, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+        print(f"baseline written to {args.baseline}")
+        return
+    if not args.baseline.exists():
+        print(f"no baseline at {args.baseline}; run with --update-baseline to record one", file=sys.stderr)
+        sys.exit(2)
+
+    regressions = compare(results, json.loads(args.baseline.read_text(encoding="utf-8"))["results"], args.threshold)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    if regressions:
+        sys.exit(1)
+    print(f"no regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Reader latency while a large history replace is being written, per journal mode.
+
+The main process repeatedly swaps one day's ShiftHistory for ``--rows`` new
+rows via ``replace_history`` (what ``_persist_history`` does), while reader
+processes keep fetching a page of another day through a read-only engine.
+Readers are separate processes so they measure lock waits, not the GIL.
+Run from ``backend/``::
+
+    python -m benchmarks.bench_db_concurrency --rows 100000 --writes 5 --readers 2
+"""
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from sqlmodel import Session, SQLModel, create_engine
+
+from app.core.config import get_settings
+from app.db import configure_sqlite, upgrade_schema
+from app.services.allocation_engine import replace_history
+from app.services.history import history_criteria, page_history
+
+DAY = "1403/05/01"
+OTHER_DAY = "1403/05/02"
+PAGE = 500
+READ_INTERVAL_S = 0.002
+
+
+def _entries(rows: int) -> list[dict]:
+    return [
+        {
+            "guard_name": f"guard-{i % 120:03d}",
+            "location_name": f"post-{i % 40:02d}",
+            "start": "09:00",
+            "end": "11:00",
+            "kind": "General",
+        }
+        for i in range(rows)
+    ]
+
+
+def _percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _read_loop(url: str, mode: str, started, stop, results) -> None:
+    profile = get_settings().model_copy(update={"sqlite_journal_mode": mode})
+    reader = configure_sqlite(create_engine(url), profile, read_only=True)
+    criteria = history_criteria(date=OTHER_DAY)
+    latencies = []
+    with Session(reader) as session:
+        started.release()
+        while not stop.is_set():
+            began = time.perf_counter()
+            page_history(session, criteria, after_id=None, limit=PAGE)
+            session.rollback()
+            latencies.append((time.perf_counter() - began) * 1000)
+            time.sleep(READ_INTERVAL_S)
+    reader.dispose()
+    results.put(latencies)
+
+
+def run(mode: str, rows: int, writes: int, readers: int, tmp: Path) -> dict:
+    profile = get_settings().model_copy(update={"sqlite_journal_mode": mode})
+    url = f"sqlite:///{tmp / f'concurrency_{mode}.db'}"
+    writer = configure_sqlite(create_engine(url), profile)
+    SQLModel.metadata.create_all(writer)
+    upgrade_schema(writer)
+    entries = _entries(rows)
+    with Session(writer) as session:
+        replace_history(session, OTHER_DAY, entries[: PAGE * 4])
+        replace_history(session, DAY, entries)
+
+    context = multiprocessing.get_context("spawn")
+    started, stop, results = context.Semaphore(0), context.Event(), context.Queue()
+    processes = [
+        context.Process(target=_read_loop, args=(url, mode, started, stop, results)) for _ in range(readers)
+    ]
+    for process in processes:
+        process.start()
+    for _ in processes:
+        started.acquire()
+    write_ms = []
+    with Session(writer) as session:
+        for _ in range(writes):
+            began = time.perf_counter()
+            replace_history(session, DAY, entries)
+            write_ms.append((time.perf_counter() - began) * 1000)
+    stop.set()
+    latencies = [latency for _ in processes for latency in results.get()]
+    for process in processes:
+        process.join()
+    writer.dispose()
+    return {
+        "mode": mode,
+        "reads": len(latencies),
+        "p50": statistics.median(latencies),
+        "p95": _percentile(latencies, 0.95),
+        "max": max(latencies),
+        "write": statistics.median(write_ms),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--writes", type=int, default=5)
+    parser.add_argument("--readers", type=int, default=2)
+    parser.add_argument("--modes", nargs="+", default=["delete", "wal"])
+    args = parser.parse_args()
+    if args.readers < 1:
+        parser.error("--readers must be at least 1")
+
+    print(f"{'journal':>8} {'reads':>7} {'p50':>8} {'p95':>8} {'max':>9} {'write':>9}  (ms)")
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in args.modes:
+            result = run(mode, args.rows, args.writes, args.readers, Path(tmp))
+            print(
+                f"{result['mode']:>8} {result['reads']:>7} {result['p50']:>8.2f} {result['p95']:>8.2f}"
+                f" {result['max']:>9.2f} {result['write']:>9.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
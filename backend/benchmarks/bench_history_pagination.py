@@ -0,0 +1,102 @@
+"""Per-page latency of keyset vs OFFSET pagination as ShiftHistory grows.
+
+Run from ``backend/``::
+
+    python -m benchmarks.bench_history_pagination --sizes 10000 100000 400000
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy import insert
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from app.db import upgrade_schema
+from app.models.shift_history import ShiftHistory
+from app.services.history import history_criteria, page_history
+
+PAGE = 500
+BATCH = 20000
+REPEATS = 5
+GUARDS = 60
+
+
+def _fill(session: Session, rows: int, guards: int, seed: int) -> None:
+    rng = random.Random(seed)
+    created_at = datetime.utcnow()
+    for offset in range(0, rows, BATCH):
+        session.execute(
+            insert(ShiftHistory),
+            [
+                {
+                    "date_jalali": f"1403/{1 + (i // 4000) % 6:02d}/{1 + (i // 130) % 30:02d}",
+                    "guard_name": f"guard-{rng.randrange(guards):03d}",
+                    "location_name": f"post-{rng.randrange(40):02d}",
+                    "start": "09:00",
+                    "end": "11:00",
+                    "kind": "General",
+                    "created_at": created_at,
+                }
+                for i in range(offset, min(offset + BATCH, rows))
+            ],
+        )
+    session.commit()
+
+
+def _median_ms(fetch) -> float:
+    timings = []
+    for _ in range(REPEATS):
+        began = time.perf_counter()
+        fetch()
+        timings.append((time.perf_counter() - began) * 1000)
+    return statistics.median(timings)
+
+
+def _keyset_ms(session: Session, criteria: list, depth: int) -> float:
+    """Walk ``depth`` pages, then time fetching the next one."""
+    after_id = None
+    for _ in range(depth):
+        page = page_history(session, criteria, after_id=after_id, limit=PAGE)
+        after_id = page[-1]["id"] if page else after_id
+    return _median_ms(lambda: page_history(session, criteria, after_id=after_id, limit=PAGE))
+
+
+def _offset_ms(session: Session, criteria: list, depth: int) -> float:
+    statement = select(ShiftHistory).where(*criteria).order_by(ShiftHistory.id).offset(depth * PAGE).limit(PAGE)
+    return _median_ms(lambda: list(session.exec(statement)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 400000])
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'filter':>8} {'keyset first':>13} {'keyset deep':>12} {'offset deep':>12}  (ms/page)")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            db_engine = create_engine(f"sqlite:///{Path(tmp) / f'history_{size}.db'}")
+            SQLModel.metadata.create_all(db_engine)
+            upgrade_schema(db_engine)
+            with Session(db_engine) as session:
+                _fill(session, size, guards=GUARDS, seed=args.seed)
+                for label, criteria, rows in (
+                    ("none", [], size),
+                    ("guard", history_criteria(guard="guard-007"), size // GUARDS),
+                ):
+                    depth = rows // PAGE // 2
+                    first = _keyset_ms(session, criteria, 0)
+                    deep = _keyset_ms(session, criteria, depth)
+                    offset = _offset_ms(session, criteria, depth)
+                    print(f"{size:>8} {label:>8} {first:>13.2f} {deep:>12.2f} {offset:>12.2f}")
+            db_engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
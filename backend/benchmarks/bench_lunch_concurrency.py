@@ -0,0 +1,105 @@
+"""Compare the legacy O(G²) lunch-concurrency check with ``GuardScorer.lunch_blocked``.
+
+Run from ``backend/``::
+
+    python -m benchmarks.bench_lunch_concurrency
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlmodel import Session, SQLModel, create_engine
+
+from app.models.lifeguard import Lifeguard
+from app.models.setting import Setting
+from app.services.allocation_engine import AllocationEngine, GuardScorer, GuardState
+
+LUNCH_SLOTS = ["11:30", "12:00", "12:30", "13:00", "13:30", "14:00", "14:30"]
+
+
+def legacy_check_lunch_concurrency(engine: AllocationEngine, start: datetime, end: datetime, guard_state: GuardState) -> bool:
+    """The pre-index implementation, kept verbatim for comparison."""
+    if guard_state.guard.lunch_at in (None, "-"):
+        return True
+    lunch_time = datetime.combine(engine.ctx.today, datetime.strptime(guard_state.guard.lunch_at, "%H:%M").time())
+    lunch_end = lunch_time + timedelta(minutes=engine.setting.lunch_min + engine.setting.shower_min)
+    if end <= lunch_time or start >= lunch_end:
+        return True
+    overlapping = 0
+    for other_state in engine.lifeguards.values():
+        if other_state.guard.name == guard_state.guard.name:
+            continue
+        if other_state.guard.lunch_at in (None, "-"):
+            continue
+        other_start = datetime.combine(engine.ctx.today, datetime.strptime(other_state.guard.lunch_at, "%H:%M").time())
+        other_end = other_start + timedelta(minutes=engine.setting.lunch_min + engine.setting.shower_min)
+        if not (lunch_end <= other_start or lunch_time >= other_end):
+            overlapping += 1
+    return overlapping < engine.setting.max_concurrent_lunch
+
+
+def _build_engine(workdir: Path, guards: int, seed: int) -> tuple[AllocationEngine, Session]:
+    rng = random.Random(seed)
+    db_engine = create_engine(f"sqlite:///{workdir / f'lunch_{guards}.db'}")
+    SQLModel.metadata.create_all(db_engine)
+    session = Session(db_engine)
+    session.add(Setting(id=1))
+    session.add_all(
+        Lifeguard(name=f"guard-{i:04d}", experience="medium", lunch_at=rng.choice(LUNCH_SLOTS + ["-"]))
+        for i in range(guards)
+    )
+    session.commit()
+    return AllocationEngine(session), session
+
+
+def _at(engine: AllocationEngine, minute: int) -> datetime:
+    return datetime.combine(engine.ctx.today, datetime.min.time()) + timedelta(minutes=minute)
+
+
+def _slots(engine: AllocationEngine) -> list[tuple[int, int]]:
+    return [(engine.ctx.start + h * 60, engine.ctx.start + (h + 2) * 60) for h in range(0, 12, 2)]
+
+
+def _time_legacy(engine: AllocationEngine) -> tuple[float, list[bool]]:
+    states = list(engine.lifeguards.values())
+    began = time.perf_counter()
+    results = [
+        legacy_check_lunch_concurrency(engine, _at(engine, start), _at(engine, end), state)
+        for start, end in _slots(engine)
+        for state in states
+    ]
+    return time.perf_counter() - began, results
+
+
+def _time_indexed(engine: AllocationEngine) -> tuple[float, list[bool]]:
+    began = time.perf_counter()
+    scorer = GuardScorer(engine)
+    results = [bool(allowed) for start, end in _slots(engine) for allowed in ~scorer.lunch_blocked(start, end)]
+    return time.perf_counter() - began, results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'guards':>7} {'legacy (s)':>12} {'indexed (s)':>12} {'speedup':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            engine, session = _build_engine(Path(tmp), size, args.seed)
+            legacy_s, legacy = _time_legacy(engine)
+            indexed_s, indexed = _time_indexed(engine)
+            session.close()
+            if legacy != indexed:
+                raise SystemExit(f"results diverge at {size} guards")
+            print(f"{size:>7} {legacy_s:>12.4f} {indexed_s:>12.4f} {legacy_s / max(indexed_s, 1e-9):>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Serialization cost and bytes on the wire of an allocation response.
+
+Plans one synthetic day (``400x140`` gives about 1000 long rows), then times
+each way of turning the result into a response body::
+
+    python -m benchmarks.bench_serialization
+    python -m benchmarks.bench_serialization --case 600x200 --repeats 20
+
+``validated`` is what a plain ``response_model`` route does: validate and
+dump through pydantic, then encode with stdlib ``json``. ``stdlib`` and
+``fast`` skip validation and encode with ``json`` / ``FastJSONResponse``.
+"""
+from __future__ import annotations
+
+import argparse
+import gzip
+import statistics
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+from typing import Callable, Dict
+
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from sqlmodel import Session
+
+from app.core.config import get_settings
+from app.core.responses import FastJSONResponse, orjson
+from app.schemas.history import AllocationResponse
+from app.services.allocation_engine import AllocationEngine
+
+from .synthetic import RosterProfile, build_database
+
+BENCH_DAY = date(2024, 7, 22)
+
+
+def plan_payload(workdir: Path, profile: RosterProfile) -> dict:
+    """The ``POST /allocate`` body for one synthetic day."""
+    db_engine = build_database(workdir / f"{profile.label}.db", profile)
+    try:
+        with Session(db_engine) as session:
+            return {**AllocationEngine(session, today=BENCH_DAY).allocate(), "run_id": 1}
+    finally:
+        db_engine.dispose()
+
+
+def encoders() -> Dict[str, Callable[[dict], bytes]]:
+    adapter = TypeAdapter(AllocationResponse)
+
+    def validated(payload: dict) -> bytes:
+        return JSONResponse(adapter.dump_python(adapter.validate_python(payload), mode="json")).body
+
+    return {
+        "validated": validated,
+        "stdlib": lambda payload: JSONResponse(payload).body,
+        "fast": lambda payload: FastJSONResponse(payload).body,
+    }
+
+
+def median_ms(encode: Callable[[dict], bytes], payload: dict, repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        began = time.perf_counter()
+        encode(payload)
+        timings.append((time.perf_counter() - began) * 1000)
+    return statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--case", default="400x140", help="GUARDSxLOCATIONS")
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--gzip-level", type=int, default=get_settings().gzip_level)
+    args = parser.parse_args()
+
+    guards, locations = (int(part) for part in args.case.split("x"))
+    with tempfile.TemporaryDirectory() as tmp:
+        payload = plan_payload(Path(tmp), RosterProfile(guards=guards, locations=locations, seed=args.seed))
+    counts = ", ".join(f"{len(payload[key])} {key}" for key in ("wide", "long", "history", "team"))
+    print(f"{args.case}: {counts}; encoder: {'orjson' if orjson is not None else 'json (orjson missing)'}")
+    print(f"{'path':>10} {'encode ms':>10} {'gzip ms':>8} {'bytes':>9} {'gzip bytes':>11}")
+    for name, encode in encoders().items():
+        body = encode(payload)
+        encode_ms = median_ms(encode, payload, args.repeats)
+        gzip_ms = median_ms(lambda _: gzip.compress(body, args.gzip_level), payload, args.repeats)
+        compressed = len(gzip.compress(body, args.gzip_level))
+        print(f"{name:>10} {encode_ms:>10.2f} {gzip_ms:>8.2f} {len(body):>9} {compressed:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Seeded generator for synthetic rosters and locations."""
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Sequence, Tuple
+
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, SQLModel, create_engine
+
+from app.db import upgrade_schema
+from app.models.lifeguard import Lifeguard
+from app.models.location import Location
+from app.models.setting import Setting
+
+LUNCH_TIMES = ("11:30", "12:00", "12:30", "13:00", "13:30", "14:00", "14:30", "15:00")
+SWAP_TIMES = ("10:15", "11:45", "13:40", "15:20", "18:10", "19:30")
+
+
+@dataclass(frozen=True)
+class RosterProfile:
+    guards: int = 120
+    locations: int = 40
+    seed: int = 0
+    roles: Sequence[Tuple[str, float]] = (("ناجی", 0.8), ("ناجی چک", 0.12), ("سر ناجی", 0.08))
+    experience: Sequence[Tuple[str, float]] = (("expert", 0.3), ("medium", 0.45), ("low", 0.25))
+    lunch_density: float = 0.7
+    swap_density: float = 0.1
+    absent_ratio: float = 0.05
+    water_ratio: float = 0.4
+    hard_ratio: float = 0.3
+    special_ratio: float = 0.15
+
+    @property
+    def label(self) -> str:
+        return f"{self.guards}x{self.locations}"
+
+
+def _pick(rng: random.Random, weighted: Sequence[Tuple[str, float]]) -> str:
+    values, weights = zip(*weighted)
+    return rng.choices(values, weights=weights)[0]
+
+
+def generate_roster(profile: RosterProfile) -> Tuple[List[Lifeguard], List[Location]]:
+    """Build unsaved guards and locations; the same profile always yields the same rows."""
+    rng = random.Random(profile.seed)
+    names = [f"guard-{i:04d}" for i in range(profile.guards)]
+    guards = []
+    for name in names:
+        swap = rng.random() < profile.swap_density
+        guards.append(
+            Lifeguard(
+                name=name,
+                present=rng.random() >= profile.absent_ratio,
+                team=rng.choice("ABC"),
+                experience=_pick(rng, profile.experience),
+                role=_pick(rng, profile.roles),
+                lunch_at=rng.choice(LUNCH_TIMES) if rng.random() < profile.lunch_density else "-",
+                swap_at=rng.choice(SWAP_TIMES) if swap else "-",
+                backup_name=rng.choice(names) if swap else "-",
+            )
+        )
+    locations = []
+    for i in range(profile.locations):
+        hard = rng.random() < profile.hard_ratio
+        locations.append(
+            Location(
+                name=f"post-{i:03d}" + (" (ویژه)" if rng.random() < profile.special_ratio else ""),
+                difficulty="hard" if hard else rng.choice(("easy", "medium")),
+                is_water=rng.random() < profile.water_ratio,
+                active_today=True,
+            )
+        )
+    return guards, locations
+
+
+def build_database(path: Path, profile: RosterProfile) -> Engine:
+    """Create a fresh SQLite file at ``path`` holding the profile's roster."""
+    path.unlink(missing_ok=True)
+    db_engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    SQLModel.metadata.create_all(db_engine)
+    upgrade_schema(db_engine)
+    guards, locations = generate_roster(profile)
+    with Session(db_engine) as session:
+        session.add(Setting(id=1))
+        session.add_all(guards)
+        session.add_all(locations)
+        session.commit()
+    return db_engine
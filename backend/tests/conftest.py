@@ -5,7 +5,7 @@ from pathlib import Path
 
 import pytest
 from fastapi.testclient import TestClient
-from sqlmodel import Session
+from sqlmodel import Session, SQLModel, create_engine
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 if str(PROJECT_ROOT) not in sys.path:
@@ -13,6 +13,7 @@ if str(PROJECT_ROOT) not in sys.path:
 
 from app.main import app
 from app.db import engine, init_db, session_scope
+from app.models.setting import Setting
 from app.services.import_export import seed_if_empty
 
 
@@ -34,3 +35,22 @@ def client():
 def session():
     with Session(engine) as s:
         yield s
+
+
+@pytest.fixture()
+def make_engine(tmp_path):
+    """Factory for throwaway SQLite databases with default settings."""
+    created = []
+
+    def _make(name: str = "isolated"):
+        db_engine = create_engine(f"sqlite:///{tmp_path / f'{name}.db'}", connect_args={"check_same_thread": False})
+        SQLModel.metadata.create_all(db_engine)
+        with Session(db_engine) as s:
+            s.add(Setting(id=1))
+            s.commit()
+        created.append(db_engine)
+        return db_engine
+
+    yield _make
+    for db_engine in created:
+        db_engine.dispose()
@@ -1,4 +1,16 @@
-from app.services.allocation_engine import AllocationEngine
+from sqlalchemy import event
+from sqlmodel import Session, select
+
+from app.models.lifeguard import Lifeguard
+from app.models.location import Location
+from app.models.shift_history import ShiftHistory
+from app.services.allocation_engine import (
+    ROLE_PRIORITY,
+    SKILL_TO_DIFFICULTY,
+    AllocationEngine,
+    GuardScorer,
+    GuardState,
+)
 
 
 def test_allocation_runs(session):
@@ -15,3 +27,424 @@ def test_check_rotation_prefers_checker(session):
     water_checks = [row for row in result["long"] if row["Kind"] == "Check"]
     assert water_checks, "Expected check entries"
     assert all("ناجی" in entry["Assignee"] for entry in water_checks[: len(water_checks)])
+
+
+def _seed_roster(session, guards: int, locations: int) -> None:
+    experiences = ["expert", "medium", "low"]
+    difficulties = ["hard", "medium", "easy"]
+    for i in range(guards):
+        session.add(Lifeguard(name=f"guard-{i:04d}", experience=experiences[i % 3], lunch_at=f"{12 + i % 3}:00"))
+    for i in range(locations):
+        session.add(Location(name=f"post-{i:03d}", difficulty=difficulties[i % 3], is_water=i % 2 == 0))
+    session.commit()
+
+
+def _count_queries(db_engine, guards: int, locations: int) -> int:
+    statements: list[str] = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with Session(db_engine) as s:
+        _seed_roster(s, guards, locations)
+        event.listen(db_engine, "before_cursor_execute", _record)
+        try:
+            AllocationEngine(s).allocate()
+        finally:
+            event.remove(db_engine, "before_cursor_execute", _record)
+    return sum(1 for statement in statements if "shifthistory" in statement.lower())
+
+
+def test_history_queries_do_not_scale_with_roster(make_engine):
+    small = _count_queries(make_engine("small"), guards=5, locations=3)
+    large = _count_queries(make_engine("large"), guards=60, locations=20)
+    # one read of the day's pairs, one delete and one bulk insert
+    assert small == large == 3
+
+
+def test_guard_state_bitmask_matches_interval_scan():
+    import random
+
+    rng = random.Random(7)
+    origin = 9 * 60
+
+    def interval(min_len: int = 0):
+        start = origin + rng.randint(0, 800)
+        return start, start + rng.randint(min_len, 150)
+
+    for _ in range(200):
+        state = GuardState(guard=Lifeguard(name="x", experience="medium"), assignments=[], breaks=[], origin=origin)
+        booked = []
+        for _ in range(rng.randint(0, 6)):
+            b_start, b_end = interval()
+            state.block(b_start, b_end)
+            booked.append((b_start, b_end))
+        for _ in range(20):
+            start, end = interval(min_len=1)
+            expected = all(end <= b_start or start >= b_end for b_start, b_end in booked)
+            assert state.is_available(start, end) == expected
+            if expected:
+                state.assign(start, end)
+                booked.append((start, end))
+
+
+def test_lunch_overlap_counts_match_pairwise_scan(make_engine):
+    lunches = ["12:00", "12:10", "12:30", "12:45", "13:20", "-", "15:00"]
+    with Session(make_engine()) as s:
+        for i, lunch_at in enumerate(lunches):
+            s.add(Lifeguard(name=f"guard-{i}", experience="medium", lunch_at=lunch_at))
+        s.commit()
+        engine = AllocationEngine(s)
+    windows = engine.lunch_windows
+    for name, (start, end) in windows.items():
+        expected = sum(
+            1 for other, (o_start, o_end) in windows.items() if other != name and not (end <= o_start or start >= o_end)
+        )
+        assert engine.lunch_overlaps[name] == expected
+    assert "guard-5" not in engine.lunch_overlaps
+
+
+def test_upgrade_schema_adds_missing_columns_and_indexes(tmp_path):
+    from sqlalchemy import create_engine, inspect, text
+
+    from app.db import upgrade_schema
+
+    legacy = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with legacy.begin() as conn:
+        conn.execute(
+            text(
+                "CREATE TABLE shifthistory (id INTEGER PRIMARY KEY, date_jalali VARCHAR, guard_name VARCHAR, "
+                "location_name VARCHAR, start VARCHAR, \"end\" VARCHAR, kind VARCHAR, created_at DATETIME)"
+            )
+        )
+        conn.execute(
+            text(
+                "CREATE TABLE allocationrun (id INTEGER PRIMARY KEY, date_jalali VARCHAR, caption VARCHAR, "
+                "wide VARCHAR, long VARCHAR, settings VARCHAR, created_at DATETIME)"
+            )
+        )
+    upgrade_schema(legacy)
+    upgrade_schema(legacy)
+    names = {index["name"] for index in inspect(legacy).get_indexes("shifthistory")}
+    run_columns = {column["name"] for column in inspect(legacy).get_columns("allocationrun")}
+    legacy.dispose()
+    assert "ix_shifthistory_date_guard_location" in names
+    assert "fingerprint" in run_columns and "site" in run_columns
+    assert "ix_shifthistory_site_date" in names
+
+
+def test_run_store_evicts_by_count_and_age(make_engine):
+    from datetime import datetime, timedelta
+
+    from app.models.allocation_run import AllocationRun
+    from app.models.setting import Setting
+    from app.services.run_store import evict_runs, save_run, unpack_rows
+
+    result = {"caption": "c", "wide": [{"a": "1"}, {"a": "2", "b": "3"}], "long": []}
+    with Session(make_engine()) as s:
+        setting = s.get(Setting, 1)
+        runs = [save_run(s, result, "1403/05/01", setting) for _ in range(4)]
+        assert unpack_rows(runs[-1].wide) == result["wide"]
+        runs[0].created_at = datetime.utcnow() - timedelta(days=2)
+        s.add(runs[0])
+        s.commit()
+        assert evict_runs(s, max_runs=2, max_age=timedelta(days=1)) == 2
+        assert [run.id for run in s.query(AllocationRun).all()] == [runs[2].id, runs[3].id]
+
+
+def test_min_cost_assignment_matches_brute_force():
+    import itertools
+    import random
+
+    from app.services.assignment import min_cost_assignment
+
+    rng = random.Random(3)
+    for _ in range(300):
+        rows, columns = rng.randint(1, 4), rng.randint(0, 5)
+        costs = [[rng.randint(-2, 15) if rng.random() < 0.7 else None for _ in range(columns)] for _ in range(rows)]
+
+        def key(pick):
+            return (-sum(c is not None for c in pick), sum(costs[r][c] for r, c in enumerate(pick) if c is not None))
+
+        best = min(
+            key(pick)
+            for pick in itertools.product([None, *range(columns)], repeat=rows)
+            if len({c for c in pick if c is not None}) == sum(c is not None for c in pick)
+            and all(c is None or costs[r][c] is not None for r, c in enumerate(pick))
+        )
+        assert key(min_cost_assignment(costs)) == best
+
+
+def test_matching_solver_fills_at_least_as_many_slots(make_engine):
+    from datetime import date
+
+    with Session(make_engine()) as s:
+        _seed_roster(s, guards=24, locations=14)
+        greedy = AllocationEngine(s, today=date(2024, 7, 22))
+        greedy_result = greedy.allocate(persist=False)
+        matching = AllocationEngine(s, today=date(2024, 7, 22), solver="matching")
+        matching_result = matching.allocate(persist=False)
+    assert matching.filled_slots >= greedy.filled_slots
+    assert [row["لوکیشن"] for row in matching_result["wide"]] == [row["لوکیشن"] for row in greedy_result["wide"]]
+    assert all(row.keys() == other.keys() for row, other in zip(matching_result["wide"], greedy_result["wide"]))
+
+
+def _scalar_score(engine, state, location, slot_start, slot_end):
+    """One guard's greedy ranking key, written out rule by rule as a reference for ``GuardScorer``."""
+    guard = state.guard
+    if location.difficulty not in SKILL_TO_DIFFICULTY.get(guard.experience, {"easy"}):
+        return (99, 0, 99, guard.name)
+    priority = ROLE_PRIORITY.get(guard.role, 3)
+    if guard.role == "ناجی چک" and location.is_water:
+        priority += 1
+    if guard.role == "سر ناجی" and location.difficulty == "hard":
+        priority -= 1
+    repeat_penalty = 5 if (guard.name, location.name) in engine.history_pairs else 0
+    fairness = engine._fairness_terms(location).get(guard.name, 0)
+    return (priority + repeat_penalty, fairness, len(state.assignments), guard.name)
+
+
+def _scalar_eligible(engine, state, location, slot_start, slot_end):
+    guard = state.guard
+    window = engine.lunch_windows.get(guard.name)
+    if window is not None and slot_start < window[1] and slot_end > window[0]:
+        if engine.lunch_overlaps[guard.name] >= engine.setting.max_concurrent_lunch:
+            return False
+    if location.is_water and guard.role == "ناجی چک":
+        return False
+    return not (guard.role == "سر ناجی" and location.is_water and location.difficulty != "hard")
+
+
+def _scalar_select(engine, location, slot_start, slot_end):
+    """Reference greedy choice built from ``_scalar_score``/``_scalar_eligible``."""
+    available = [state for state in engine.lifeguards.values() if state.is_available(slot_start, slot_end)]
+    eligible = [
+        (score, state.guard.name)
+        for state in available
+        if _scalar_eligible(engine, state, location, slot_start, slot_end)
+        for score in [_scalar_score(engine, state, location, slot_start, slot_end)]
+        if score[0] < 99
+    ]
+    candidates = eligible or [
+        (_scalar_score(engine, state, location, slot_start, slot_end), state.guard.name) for state in available
+    ]
+    return min(candidates)[1] if candidates else None
+
+
+def test_vectorised_scorer_matches_scalar_scoring(make_engine):
+    from datetime import date
+
+    from benchmarks.synthetic import RosterProfile, generate_roster
+
+    guards, locations = generate_roster(RosterProfile(guards=60, locations=24, seed=5))
+    with Session(make_engine()) as s:
+        s.add_all(guards + locations)
+        s.commit()
+        engine = AllocationEngine(s, today=date(2024, 7, 22))
+        engine.history_pairs = {(guard.name, location.name) for guard, location in zip(guards[::3], locations)}
+        engine.scorer = GuardScorer(engine)
+        compared = 0
+        for location in engine.locations:
+            for slot_start, slot_end in engine._build_slots(location):
+                chosen = engine._select_guard(location, slot_start, slot_end)
+                assert chosen == _scalar_select(engine, location, slot_start, slot_end)
+                engine._place_guard(chosen, location, slot_start, slot_end)
+                compared += 1
+    assert compared == engine.slot_count
+
+
+def test_repair_only_refills_the_absent_guards_slots(make_engine):
+    from collections import Counter
+    from datetime import date
+
+    from app.models.shift_history import ShiftHistory
+    from app.services.schedule import history_entry
+
+    day = date(2024, 7, 22)
+    with Session(make_engine()) as s:
+        _seed_roster(s, guards=30, locations=12)
+        before = AllocationEngine(s, today=day).allocate()
+        absent = before["long"][0]["Assignee"]
+        guard = s.query(Lifeguard).filter(Lifeguard.name == absent).one()
+        guard.present = False
+        s.commit()
+
+        repaired = AllocationEngine(s, today=day).repair(before["wide"], before["long"], guard=absent)
+        untouched = [entry for entry in before["long"] if entry not in repaired["removed"]]
+        assert all(entry["Assignee"] == absent for entry in repaired["removed"] if entry["Kind"] == "Check")
+        assert untouched == repaired["long"][: len(untouched)]
+        assert absent not in {entry["Assignee"] for entry in repaired["long"]}
+        assert absent not in {value for row in repaired["wide"] for value in row.values()}
+
+        stored = s.query(ShiftHistory).all()
+        assert Counter(
+            (row.guard_name, row.location_name, row.start, row.end, row.kind) for row in stored
+        ) == Counter(tuple(history_entry(entry).values()) for entry in repaired["long"])
+
+        closed = repaired["wide"][0]["لوکیشن"]
+        s.query(Location).filter(Location.name == closed).one().active_today = False
+        s.commit()
+        dropped = AllocationEngine(s, today=day).repair(repaired["wide"], repaired["long"], location=closed)
+        assert closed not in {row["لوکیشن"] for row in dropped["wide"]}
+        assert not dropped["added"]
+        assert all(entry["Location"] != closed for entry in dropped["long"])
+
+
+def test_settings_snapshot_parses_clock_fields():
+    from app.models.setting import Setting
+    from app.services.settings_snapshot import SettingsSnapshot
+
+    snapshot = SettingsSnapshot.from_setting(Setting(start="08:30", check_windows_min="30,,90", lunch_min=20, shower_min=5))
+    assert (snapshot.start_min, snapshot.end_min) == (510, 1320)
+    assert snapshot.check_windows == (30, 90)
+    assert snapshot.lunch_window_min == 25
+    assert (snapshot.shift_len_min, snapshot.special_len_min) == (120, 90)
+
+
+def test_sqlite_profile_enables_wal_and_read_only_pool(tmp_path):
+    import pytest
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.exc import OperationalError
+
+    from app.core.config import get_settings
+    from app.db import configure_sqlite
+
+    url = f"sqlite:///{tmp_path / 'profile.db'}"
+    writer = configure_sqlite(create_engine(url), get_settings())
+    reader = configure_sqlite(create_engine(url), get_settings(), read_only=True)
+    with writer.begin() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        conn.execute(text("CREATE TABLE t (x INTEGER)"))
+    with reader.connect() as conn:
+        assert conn.execute(text("PRAGMA query_only")).scalar() == 1
+        with pytest.raises(OperationalError):
+            conn.execute(text("INSERT INTO t VALUES (1)"))
+    writer.dispose()
+    reader.dispose()
+
+
+def test_schedule_rows_are_derived_from_one_record(make_engine):
+    import pickle
+    from datetime import date
+
+    from app.services.schedule import history_entry
+    from app.services.schedule import CHECK, CHECK_COLUMN, SLOT_COLUMN, WATER, Schedule
+
+    with Session(make_engine()) as s:
+        _seed_roster(s, guards=12, locations=4)
+        schedule = AllocationEngine(s, today=date(2024, 7, 22)).plan()
+    result = pickle.loads(pickle.dumps(schedule)).result()
+    assert result["history"] == [history_entry(entry) for entry in result["long"]]
+    assert len(result["long"]) == len(schedule.entries)
+
+    schedule = Schedule(["a", "b"], ["pool"])
+    row = schedule.row("pool")
+    row[(SLOT_COLUMN, 1, 540, 660)] = (
+        schedule.add("pool", "a", 540, 600, WATER),
+        schedule.add("pool", "b", 600, 660, WATER),
+    )
+    row[(SLOT_COLUMN, 2, 660, 780)] = ()
+    row[(CHECK_COLUMN, 1, 0, 0)] = (schedule.add("pool", "b", 570, 580, CHECK),)
+    assert schedule.wide_rows() == [
+        {
+            "لوکیشن": "pool",
+            "شیفت 1 (09:00-11:00)": "a (09:00-10:00) | b (10:00-11:00)",
+            "شیفت 2 (11:00-13:00)": "--",
+            "چک 1": "b",
+        }
+    ]
+    assert [entry["location_name"] for entry in schedule.iter_history()] == ["pool", "pool", "چک - pool"]
+
+
+def test_slot_templates_are_shared_per_length(make_engine):
+    with Session(make_engine()) as s:
+        s.add_all([Location(name="post-a"), Location(name="post-b"), Location(name="چاله 1")])
+        s.commit()
+        engine = AllocationEngine(s)
+    by_name = {location.name: location for location in engine.locations}
+    regular, other, special = (engine._build_slots(by_name[name]) for name in ("post-a", "post-b", "چاله 1"))
+    assert regular is other
+    assert regular[0] == (540, 660) and regular[-1] == (1260, 1320)
+    assert special[:2] == ((540, 630), (630, 720)) and special[-1][1] == 1320
+
+
+def test_workload_totals_track_history_and_steer_scoring(make_engine):
+    from datetime import date
+
+    from app.models.guard_workload import GuardWorkload
+    from app.services.workload import DIFFICULTY, load_workload, rebuild_workload
+
+    def snapshot(s):
+        return sorted((r.guard_name, r.dimension, r.key, r.minutes, r.shifts) for r in s.query(GuardWorkload))
+
+    with Session(make_engine()) as s:
+        _seed_roster(s, guards=20, locations=6)
+        for day in (22, 23, 24):
+            result = AllocationEngine(s, today=date(2024, 7, day)).allocate()
+        AllocationEngine(s, today=date(2024, 7, 23)).allocate()
+        absent = result["long"][0]["Assignee"]
+        AllocationEngine(s, today=date(2024, 7, 24)).repair(result["wide"], result["long"], guard=absent)
+        incremental = snapshot(s)
+        assert incremental and all(minutes >= 0 for *_, minutes, _ in incremental)
+        rebuild_workload(s)
+        assert snapshot(s) == incremental
+
+        engine = AllocationEngine(s, today=date(2024, 7, 25))
+        hard = next(loc for loc in engine.locations if loc.difficulty == "hard" and not loc.is_water)
+        loads = {name: totals.get((DIFFICULTY, "hard"), 0) for name, totals in load_workload(s).items()}
+        terms = engine._fairness_terms(hard)
+        assert terms and all(loads[name] - min(loads.values()) >= engine.fairness_unit for name in terms)
+        assert _scalar_score(engine, engine.lifeguards[max(terms, key=terms.get)], hard, 540, 660)[1] >= 1
+
+
+def test_planning_later_days_does_not_change_an_earlier_day(make_engine):
+    from datetime import date
+
+    from app.services.result_cache import allocation_fingerprint
+
+    with Session(make_engine()) as s:
+        _seed_roster(s, guards=20, locations=6)
+        AllocationEngine(s, today=date(2024, 7, 21)).allocate()
+        AllocationEngine(s, today=date(2024, 7, 22)).allocate()
+        fingerprint = allocation_fingerprint(s, date(2024, 7, 22))
+        replanned = AllocationEngine(s, today=date(2024, 7, 22)).plan().result()
+        for day in (23, 24):
+            AllocationEngine(s, today=date(2024, 7, day)).allocate()
+        assert allocation_fingerprint(s, date(2024, 7, 22)) == fingerprint
+        assert AllocationEngine(s, today=date(2024, 7, 22)).plan().result() == replanned
+
+
+def test_replanning_an_archived_day_keeps_workload_consistent(make_engine, tmp_path, monkeypatch):
+    from datetime import date
+
+    from app.core.config import get_settings
+    from app.models.guard_workload import GuardWorkload
+    from app.services.history_archive import archive_history, archived_history
+    from app.services.workload import rebuild_workload
+
+    def snapshot(s):
+        return sorted((r.guard_name, r.dimension, r.key, r.minutes, r.shifts) for r in s.query(GuardWorkload))
+
+    monkeypatch.setattr(get_settings(), "history_archive_dir", str(tmp_path / "archive"))
+    with Session(make_engine()) as s:
+        _seed_roster(s, guards=20, locations=6)
+        AllocationEngine(s, today=date(2024, 7, 22)).allocate()
+        AllocationEngine(s, today=date(2024, 8, 22)).allocate()
+        assert [m["month"] for m in archive_history(s, before="1403/06")] == ["1403/05"]
+
+        result = AllocationEngine(s, today=date(2024, 7, 22)).allocate()
+        incremental = snapshot(s)
+        rebuild_workload(s)
+        assert snapshot(s) == incremental
+
+        # a repair of an archived day keeps the rows it does not touch
+        AllocationEngine(s, today=date(2024, 8, 23)).allocate()
+        assert [m["month"] for m in archive_history(s, before="1403/06")] == ["1403/05"]
+        absent = result["long"][0]["Assignee"]
+        AllocationEngine(s, today=date(2024, 7, 22)).repair(result["wide"], result["long"], guard=absent)
+        live = s.exec(select(ShiftHistory).where(ShiftHistory.date_jalali == "1403/05/01")).all()
+        assert {row.guard_name for row in live} >= {entry["Assignee"] for entry in result["long"]} - {absent}
+        assert archived_history(s, date="1403/05/01") == []
+        incremental = snapshot(s)
+        rebuild_workload(s)
+        assert snapshot(s) == incremental
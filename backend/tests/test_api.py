@@ -1,4 +1,9 @@
 from fastapi.testclient import TestClient
+from sqlalchemy import delete
+from sqlmodel import select
+
+from app.models.shift_history import ShiftHistory
+from app.services.workload import rebuild_workload
 
 
 def test_health(client: TestClient):
@@ -35,3 +40,429 @@ def test_allocate_endpoint(client: TestClient):
     data = resp.json()
     assert "wide" in data and "long" in data
     assert data["caption"].startswith("تاریخ")
+
+
+def test_fast_responses_match_validated_output(client: TestClient, session):
+    import json
+
+    from sqlmodel import select
+
+    from app.core.responses import dumps, dumps_stdlib
+    from app.models.lifeguard import Lifeguard
+    from app.schemas.history import AllocationResponse
+    from app.schemas.lifeguard import LifeguardRead
+
+    resp = client.post("/api/v1/allocate", json={"date": "2024-07-24"}, headers={"Accept-Encoding": "gzip"})
+    assert resp.headers["content-encoding"] == "gzip"
+    assert resp.json() == AllocationResponse.model_validate(resp.json()).model_dump(mode="json")
+    assert json.loads(dumps(resp.json())) == json.loads(dumps_stdlib(resp.json()))
+
+    guards = client.get("/api/v1/lifeguards").json()
+    rows = session.exec(select(Lifeguard)).all()
+    assert guards == [LifeguardRead.model_validate(g, from_attributes=True).model_dump(mode="json") for g in rows]
+    assert list(guards[0]) == list(LifeguardRead.model_fields)
+    small = client.get("/api/v1/lifeguards", params={"q": "no-such-guard"}, headers={"Accept-Encoding": "gzip"})
+    assert small.json() == [] and "content-encoding" not in small.headers
+
+
+def test_allocate_for_explicit_date(client: TestClient):
+    resp = client.post("/api/v1/allocate", json={"date": "2024-07-22"})
+    assert resp.status_code == 200
+    assert "1403/05/01" in resp.json()["caption"]
+    assert client.post("/api/v1/allocate", json={"date": "not-a-date"}).status_code == 422
+
+
+def _clear_history(session, *dates_jalali: str) -> None:
+    session.execute(delete(ShiftHistory).where(ShiftHistory.date_jalali.in_(dates_jalali)))
+    session.commit()
+    rebuild_workload(session)
+
+
+def test_allocate_date_range_matches_planning_days_one_by_one(client: TestClient, session):
+    from app.services.result_cache import invalidate_allocation_cache
+
+    payload = {"start_date": "2024-07-22", "end_date": "2024-07-24"}
+    days = ("1403/05/01", "1403/05/02", "1403/05/03")
+    _clear_history(session, *days)
+    ranged = client.post("/api/v1/allocate/range", json=payload)
+    assert ranged.status_code == 200
+    assert "workers" not in ranged.json()
+    range_days = ranged.json()["days"]
+    assert [day["date"] for day in range_days] == ["2024-07-22", "2024-07-23", "2024-07-24"]
+    assert all(day["allocate_ms"] >= 0 and day["persist_ms"] >= 0 for day in range_days)
+
+    _clear_history(session, *days)
+    invalidate_allocation_cache()
+    one_by_one = [client.post("/api/v1/allocate", json={"date": day["date"]}).json() for day in range_days]
+    assert [day["long"] for day in one_by_one] == [day["long"] for day in range_days]
+
+    history = client.get("/api/v1/allocate/history", params={"date": "1403/05/02"}).json()
+    assert len(history) == len(range_days[1]["history"])
+
+
+def test_allocation_runs_are_persisted_and_exportable(client: TestClient):
+    allocated = client.post("/api/v1/allocate").json()
+    run_id = allocated["run_id"]
+
+    run = client.get(f"/api/v1/allocate/runs/{run_id}")
+    assert run.status_code == 200
+    assert run.json()["long"] == allocated["long"]
+    assert run.json()["wide"] == allocated["wide"]
+    assert run.json()["settings"]["start"]
+
+    wide_csv = client.get(f"/api/v1/allocate/runs/{run_id}/export/wide.csv")
+    assert wide_csv.status_code == 200
+    assert wide_csv.text.splitlines()[0].startswith("لوکیشن")
+    latest = client.get("/api/v1/allocate/export/long.csv")
+    assert latest.text == client.get(f"/api/v1/allocate/runs/{run_id}/export/long.csv").text
+    assert client.get("/api/v1/allocate/runs/999999").status_code == 404
+
+
+def test_history_csv_export_streams_date_range(client: TestClient):
+    client.post("/api/v1/allocate/range", json={"start_date": "2024-07-22", "end_date": "2024-07-23"})
+    expected = client.get("/api/v1/allocate/history", params={"date": "1403/05/02"}).json()
+    resp = client.get("/api/v1/allocate/history/export.csv", params={"start": "1403/05/02", "end": "1403/05/02"})
+    assert resp.status_code == 200
+    lines = resp.text.splitlines()
+    assert lines[0] == "id,date_jalali,guard_name,location_name,start,end,kind,created_at,site"
+    assert len(lines) - 1 == len(expected)
+    assert all(",1403/05/02," in line for line in lines[1:])
+
+
+def test_roster_exports_stream_csv(client: TestClient):
+    guards = client.get("/api/v1/lifeguards").json()
+    resp = client.get("/api/v1/lifeguards/export")
+    assert resp.status_code == 200
+    assert len(resp.text.splitlines()) == len(guards) + 1
+    assert client.get("/api/v1/locations/export").text.startswith("id,name,difficulty")
+
+
+def test_history_keyset_pagination_and_ndjson(client: TestClient):
+    import json
+
+    client.post("/api/v1/allocate/range", json={"start_date": "2024-07-22", "end_date": "2024-07-23"})
+    params = {"start": "1403/05/01", "end": "1403/05/02"}
+    everything = client.get("/api/v1/allocate/history", params={**params, "limit": 10000}).json()
+    assert everything and {row["date_jalali"] for row in everything} == {"1403/05/01", "1403/05/02"}
+
+    pages, after_id = [], None
+    while True:
+        query = {**params, "limit": 7} | ({"after_id": after_id} if after_id is not None else {})
+        resp = client.get("/api/v1/allocate/history", params=query)
+        pages.extend(resp.json())
+        after_id = resp.headers.get("X-Next-After-Id")
+        if after_id is None:
+            break
+    assert [row["id"] for row in pages] == [row["id"] for row in everything]
+
+    guard = everything[0]["guard_name"]
+    by_guard = client.get("/api/v1/allocate/history", params={**params, "guard": guard}).json()
+    assert by_guard and all(row["guard_name"] == guard for row in by_guard)
+
+    resp = client.get("/api/v1/allocate/history", params=params, headers={"Accept": "application/x-ndjson"})
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    assert [json.loads(line)["id"] for line in resp.text.splitlines()] == [row["id"] for row in everything]
+
+
+def test_history_without_paging_params_returns_every_row(client: TestClient, session):
+    from app.services.history import HISTORY_PAGE_SIZE
+
+    site = "unpaged"
+    session.add_all(
+        ShiftHistory(date_jalali="1403/05/09", site=site, guard_name=f"g{i}", location_name="L", start="09:00", end="10:00")
+        for i in range(HISTORY_PAGE_SIZE + 5)
+    )
+    session.commit()
+    resp = client.get("/api/v1/allocate/history", params={"site": site})
+    assert len(resp.json()) == HISTORY_PAGE_SIZE + 5 and "X-Next-After-Id" not in resp.headers
+    paged = client.get("/api/v1/allocate/history", params={"site": site, "after_id": 0})
+    assert len(paged.json()) == HISTORY_PAGE_SIZE and "X-Next-After-Id" in paged.headers
+    session.exec(delete(ShiftHistory).where(ShiftHistory.site == site))
+    session.commit()
+
+
+def test_history_reads_through_to_archived_months(client: TestClient, session, tmp_path, monkeypatch):
+    from app.core.config import get_settings
+
+    monkeypatch.setattr(get_settings(), "history_archive_dir", str(tmp_path))
+    site = "archived"
+    session.add_all(
+        ShiftHistory(date_jalali=day, site=site, guard_name=guard, location_name="L", start="09:00", end="10:00")
+        for day, guard in (("1402/01/01", "a"), ("1402/01/02", "b"), ("1402/02/01", "c"))
+    )
+    session.commit()
+    params = {"site": site, "start": "1402/01/01", "end": "1402/12/29"}
+    live = client.get("/api/v1/allocate/history", params=params).json()
+
+    resp = client.post("/api/v1/allocate/history/archive", json={"site": site, "before": "1402/02"})
+    assert resp.status_code == 200
+    assert resp.json()["rows"] == 2 and resp.json()["months"][0]["month"] == "1402/01"
+    assert (tmp_path / site / "1402-01.ndjson.gz").exists()
+    assert client.post("/api/v1/allocate/history/archive", json={"before": "1402-02"}).status_code == 422
+
+    assert client.get("/api/v1/allocate/history", params=params).json() == live
+    page = client.get("/api/v1/allocate/history", params={**params, "limit": 1})
+    assert page.json() == live[:1] and page.headers["X-Next-After-Id"] == str(live[0]["id"])
+    ndjson = client.get("/api/v1/allocate/history", params={**params, "format": "ndjson"}).text.splitlines()
+    assert len(ndjson) == 3
+    csv_rows = client.get("/api/v1/allocate/history/export.csv", params=params).text.splitlines()
+    assert [row.split(",")[0] for row in csv_rows[1:]] == [str(row["id"]) for row in live]
+    session.exec(delete(ShiftHistory).where(ShiftHistory.site == site))
+    session.commit()
+
+
+def test_allocation_cache_and_etags(client: TestClient):
+    payload = {"date": "2024-08-01"}
+    first = client.post("/api/v1/allocate", json=payload)
+    second = client.post("/api/v1/allocate", json=payload)
+    assert second.headers["X-Allocation-Cache"] == "hit"
+    assert second.json() == first.json()
+    etag = second.headers["ETag"]
+
+    run_url = f"/api/v1/allocate/runs/{first.json()['run_id']}"
+    assert client.get(run_url).headers["ETag"] == etag
+    assert client.get(run_url, headers={"If-None-Match": etag}).status_code == 304
+    assert client.get(f"{run_url}/export/long.csv", headers={"If-None-Match": etag}).status_code == 304
+
+    guard = client.get("/api/v1/lifeguards").json()[0]
+    client.put(f"/api/v1/lifeguards/{guard['id']}", json={"team": guard["team"]})
+    third = client.post("/api/v1/allocate", json=payload)
+    assert third.headers["X-Allocation-Cache"] == "miss"
+    assert third.json()["run_id"] != first.json()["run_id"]
+
+
+def test_allocation_cache_misses_after_a_run_from_another_worker(client: TestClient, session):
+    from datetime import date
+
+    from app.services.batch_allocation import allocate_range
+
+    payload = {"date": "2024-08-02"}
+    first = client.post("/api/v1/allocate", json=payload)
+    assert client.post("/api/v1/allocate", json=payload).headers["X-Allocation-Cache"] == "hit"
+    # another process stores a newer run of the day without touching this process's cache
+    newer = allocate_range(session, date(2024, 8, 2), date(2024, 8, 2))["days"][0]["run_id"]
+    assert newer != first.json()["run_id"]
+    again = client.post("/api/v1/allocate", json=payload)
+    assert again.headers["X-Allocation-Cache"] == "miss"
+    assert again.json()["run_id"] > newer
+
+
+def test_server_timing_and_metrics(client: TestClient):
+    from app.services.result_cache import invalidate_allocation_cache
+
+    invalidate_allocation_cache()
+    resp = client.post("/api/v1/allocate", json={"date": "2024-09-01"})
+    assert resp.headers["X-Allocation-Cache"] == "miss"
+    timing = resp.headers["Server-Timing"]
+    assert "total;dur=" in timing and "select;dur=" in timing and "db;dur=" in timing
+
+    body = client.get("/metrics").text
+    assert 'http_request_duration_seconds_bucket{method="POST",route="/api/v1/allocate",status="200",le="+Inf"}' in body
+    assert "allocation_slot_fill_ratio_count" in body
+    assert "db_query_duration_seconds_sum" in body
+
+
+def test_repair_run_writes_a_new_run(client: TestClient):
+    allocated = client.post("/api/v1/allocate", json={"date": "2024-07-25"}).json()
+    run_id = allocated["run_id"]
+    guard = allocated["long"][0]["Assignee"]
+    bad = client.post(f"/api/v1/allocate/runs/{run_id}/repair", json={})
+    assert bad.status_code == 422
+    assert client.post("/api/v1/allocate/runs/999999/repair", json={"guard": guard}).status_code == 404
+
+    resp = client.post(f"/api/v1/allocate/runs/{run_id}/repair", json={"guard": guard})
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["run_id"] != run_id
+    assert data["removed"] and all(entry in allocated["long"] for entry in data["removed"])
+    assert client.get(f"/api/v1/allocate/runs/{data['run_id']}").json()["long"] == data["long"]
+
+
+def test_repair_refuses_a_superseded_run(client: TestClient, session):
+    from app.services.result_cache import invalidate_allocation_cache
+
+    payload = {"date": "2024-07-26"}
+    first = client.post("/api/v1/allocate", json=payload).json()
+    invalidate_allocation_cache()
+    second = client.post("/api/v1/allocate", json=payload).json()
+    assert second["run_id"] != first["run_id"]
+    guard = first["long"][0]["Assignee"]
+    day = (ShiftHistory.date_jalali == "1403/05/05", ShiftHistory.site == "default")
+
+    resp = client.post(f"/api/v1/allocate/runs/{first['run_id']}/repair", json={"guard": guard})
+    assert resp.status_code == 409
+    stored = session.exec(select(ShiftHistory).where(*day)).all()
+    assert len(stored) == len(second["history"])
+
+    repaired = client.post(f"/api/v1/allocate/runs/{second['run_id']}/repair", json={"guard": guard})
+    assert repaired.status_code == 200
+    session.expire_all()
+    stored = session.exec(select(ShiftHistory).where(*day)).all()
+    assert len(stored) == len(repaired.json()["history"])
+
+
+def test_async_allocation_job_can_be_polled(client: TestClient):
+    import time
+
+    resp = client.post("/api/v1/allocate", params={"async": "true"}, json={"date": "2024-07-26"})
+    assert resp.status_code == 202
+    job = resp.json()
+    assert resp.headers["Location"].endswith(f"/api/v1/jobs/{job['id']}")
+    for _ in range(200):
+        job = client.get(f"/api/v1/jobs/{job['id']}").json()
+        if job["status"] not in ("queued", "running"):
+            break
+        time.sleep(0.05)
+    assert job["status"] == "done"
+    assert job["done"] == job["total"] > 0
+    assert client.get(f"/api/v1/allocate/runs/{job['result']['run_id']}").status_code == 200
+    assert client.get("/api/v1/jobs/missing").status_code == 404
+
+
+def test_roster_import_dry_run_reports_diff(client: TestClient):
+    exported = client.get("/api/v1/locations/export").content
+    resp = client.post(
+        "/api/v1/locations/import", params={"dry_run": "true"}, files={"file": ("locations.csv", exported, "text/csv")}
+    )
+    assert resp.status_code == 200
+    summary = resp.json()
+    assert summary["dry_run"] is True
+    assert summary["inserted"] == summary["updated"] == summary["deleted"] == []
+    assert summary["unchanged"] == len(client.get("/api/v1/locations").json())
+
+
+def test_roster_csv_round_trip_stays_within_its_site(client: TestClient, session):
+    from app.models.location import Location
+
+    client.post("/api/v1/locations", json={"name": "elsewhere-pool", "site": "csv-b"})
+    try:
+        exported = client.get("/api/v1/locations/export").text
+        assert "elsewhere-pool" not in exported
+        assert "elsewhere-pool" in client.get("/api/v1/locations/export", params={"site": "csv-b"}).text
+        foreign = exported + "999,elsewhere-pool,medium,False,True,csv-b\r\n"
+        resp = client.post(
+            "/api/v1/locations/import", params={"dry_run": "true"}, files={"file": ("locations.csv", foreign, "text/csv")}
+        )
+        summary = resp.json()
+        assert summary["inserted"] == summary["updated"] == summary["deleted"] == []
+        assert summary["skipped"] == 1
+    finally:
+        session.exec(delete(Location).where(Location.site == "csv-b"))
+        session.commit()
+
+
+def test_bulk_patch_lifeguards_is_all_or_nothing(client: TestClient):
+    guards = client.get("/api/v1/lifeguards").json()[:3]
+    first, second, third = guards
+    bad = client.patch(
+        "/api/v1/lifeguards",
+        json=[{"id": first["id"], "present": not first["present"]}, {"name": "no-such-guard", "present": False}],
+    )
+    assert bad.status_code == 422
+    assert client.get("/api/v1/lifeguards").json()[0]["present"] == first["present"]
+
+    updates = [
+        {"id": first["id"], "present": not first["present"]},
+        {"name": second["name"], "lunch_at": "13:30"},
+        {"id": third["id"], "swap_at": third["swap_at"]},
+    ]
+    resp = client.patch("/api/v1/lifeguards", json=updates)
+    assert resp.status_code == 200 and resp.json()["updated"] == 3
+    after = {guard["id"]: guard for guard in client.get("/api/v1/lifeguards").json()}
+    assert after[first["id"]]["present"] is not first["present"]
+    assert after[second["id"]]["lunch_at"] == "13:30"
+    client.patch(
+        "/api/v1/lifeguards",
+        json=[{"id": first["id"], "present": first["present"]}, {"id": second["id"], "lunch_at": second["lunch_at"]}],
+    )
+    assert client.patch("/api/v1/locations", json=[{"active_today": False}]).status_code == 422
+
+
+def test_bulk_patch_resolves_names_within_one_site(client: TestClient, session):
+    from app.models.lifeguard import Lifeguard
+
+    created = [
+        client.post("/api/v1/lifeguards", json={"name": "shared-name", "site": site, "experience": "low"}).json()
+        for site in ("patch-a", "patch-b")
+    ]
+    resp = client.patch("/api/v1/lifeguards", params={"site": "patch-b"}, json=[{"name": "shared-name", "team": "B"}])
+    assert resp.status_code == 200 and resp.json()["updated"] == 1
+    guards = client.get("/api/v1/lifeguards", params={"q": "shared-name"}).json()
+    teams = {guard["site"]: guard["team"] for guard in guards}
+    assert teams == {"patch-a": None, "patch-b": "B"}
+
+    moved = client.patch("/api/v1/lifeguards", params={"site": "patch-a"}, json=[{"name": "shared-name", "site": "x"}])
+    assert moved.status_code == 422
+    other_site = client.patch("/api/v1/lifeguards", json=[{"id": created[0]["id"], "team": "A"}])
+    assert other_site.status_code == 422
+    session.exec(delete(Lifeguard).where(Lifeguard.name == "shared-name"))
+    session.commit()
+
+
+def test_settings_snapshot_is_refreshed_on_update(client: TestClient):
+    original = client.get("/api/v1/settings").json()
+    try:
+        changed = client.put("/api/v1/settings", json={**original, "check_windows_min": [15, 45]})
+        assert changed.status_code == 200
+        assert changed.json()["check_windows_min"] == [15, 45]
+        assert client.get("/api/v1/settings").json()["check_windows_min"] == [15, 45]
+        wide = client.post("/api/v1/allocate", json={"date": "2024-07-27"}).json()["wide"]
+        assert any("چک 2" in row for row in wide) and not any("چک 3" in row for row in wide)
+    finally:
+        client.put("/api/v1/settings", json=original)
+    assert client.get("/api/v1/settings").json() == original
+
+
+def test_allocate_sites_partitions_by_site(client: TestClient, session):
+    from sqlmodel import select
+
+    from app.models.lifeguard import Lifeguard
+    from app.models.location import Location
+    from app.models.setting import Setting
+    from app.services.settings_snapshot import invalidate_settings_cache
+
+    settings = client.get("/api/v1/settings").json()
+    assert client.put("/api/v1/settings", params={"site": "pool"}, json=settings).status_code == 200
+    guard = {"experience": "expert", "role": "ناجی", "lunch_at": "-", "backup_name": "-", "swap_at": "-"}
+    try:
+        for index in range(3):
+            client.post("/api/v1/lifeguards", json={**guard, "name": f"pool-guard-{index}", "site": "pool"})
+        client.post("/api/v1/locations", json={"name": "pool-deck", "site": "pool"})
+        assert [g["name"] for g in client.get("/api/v1/lifeguards", params={"site": "pool"}).json()] == [
+            "pool-guard-0",
+            "pool-guard-1",
+            "pool-guard-2",
+        ]
+
+        resp = client.post("/api/v1/allocate/sites", json={"date": "2024-07-28", "sites": ["default", "pool"]})
+        assert resp.status_code == 200
+        by_site = {result["site"]: result for result in resp.json()["sites"]}
+        assert set(by_site) == {"default", "pool"}
+        pool_guards = {row["Assignee"] for row in by_site["pool"]["long"]}
+        default_guards = {row["Assignee"] for row in by_site["default"]["long"]}
+        assert pool_guards and pool_guards <= {"pool-guard-0", "pool-guard-1", "pool-guard-2"}
+        assert not pool_guards & default_guards
+        assert by_site["pool"]["timings_ms"]
+        history = client.get("/api/v1/allocate/history", params={"date": "1403/05/07", "site": "pool"}).json()
+        assert history and {row["site"] for row in history} == {"pool"}
+        assert client.get(f"/api/v1/allocate/runs/{by_site['pool']['run_id']}").json()["site"] == "pool"
+
+        missing = client.post("/api/v1/allocate/sites", json={"date": "2024-07-28", "sites": ["nowhere"]})
+        assert missing.status_code == 422
+    finally:
+        for model in (Lifeguard, Location, Setting, ShiftHistory):
+            session.execute(delete(model).where(model.site == "pool"))
+        session.commit()
+        invalidate_settings_cache()
+    assert session.exec(select(Setting.site)).all() == ["default"]
+
+
+def test_allocate_rejects_unknown_sites(client: TestClient):
+    for site in ("nowhere", "../x"):
+        resp = client.post("/api/v1/allocate", json={"date": "2024-07-28", "site": site})
+        assert resp.status_code == 422
+        assert client.post("/api/v1/allocate?async=true", json={"site": site}).status_code == 422
+        ranged = client.post(
+            "/api/v1/allocate/range", json={"start_date": "2024-07-28", "end_date": "2024-07-29", "site": site}
+        )
+        assert ranged.status_code == 422
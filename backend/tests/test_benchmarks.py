@@ -0,0 +1,30 @@
+from benchmarks.bench_allocation import compare
+from benchmarks.bench_serialization import encoders
+from benchmarks.synthetic import RosterProfile, generate_roster
+
+
+def test_synthetic_roster_is_seeded():
+    profile = RosterProfile(guards=30, locations=10, seed=5)
+    first, second = generate_roster(profile), generate_roster(profile)
+    assert [g.model_dump(exclude={"updated_at"}) for g in first[0]] == [g.model_dump(exclude={"updated_at"}) for g in second[0]]
+    assert [loc.model_dump() for loc in first[1]] == [loc.model_dump() for loc in second[1]]
+    assert len(first[0]) == 30 and len(first[1]) == 10
+
+
+def test_compare_flags_only_material_regressions():
+    baseline = {"120x40": {"select": 100.0, "persist": 1.0, "total": 150.0}}
+    current = {"120x40": {"select": 130.0, "persist": 1.9, "total": 160.0}}
+    assert compare(current, baseline, threshold=0.25) == ["120x40 select: 100.00 ms -> 130.00 ms (+30%)"]
+
+
+def test_serialization_paths_produce_the_same_body():
+    payload = {
+        "wide": [{"لوکیشن": "L1", "شیفت 1 (09:00-11:00)": "a"}],
+        "long": [{"Location": "L1", "Start": "09:00", "End": "11:00", "Assignee": "a", "Kind": "General"}],
+        "team": [{"name": "a", "present": True}],
+        "history": [],
+        "caption": "تاریخ",
+        "run_id": 3,
+    }
+    bodies = {name: encode(payload) for name, encode in encoders().items()}
+    assert len(set(bodies.values())) == 1
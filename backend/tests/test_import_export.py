@@ -0,0 +1,149 @@
+import csv
+import io
+
+from sqlmodel import Session, select
+
+from app.models.lifeguard import Lifeguard
+from app.models.shift_history import ShiftHistory
+from app.services.history import page_history
+from app.services.history_archive import archive_history, archived_history, month_path
+from app.services.import_export import (
+    CSV_CHUNK_ROWS,
+    iter_csv,
+    iter_lifeguards_csv,
+    iter_rows_csv,
+    load_lifeguards_from_csv,
+)
+
+
+def test_iter_csv_yields_header_first_then_fixed_size_chunks():
+    rows = [(i, f"name-{i}") for i in range(CSV_CHUNK_ROWS * 2 + 7)]
+    chunks = list(iter_csv(["id", "name"], rows))
+    assert chunks[0] == b"id,name\r\n"
+    assert len(chunks) == 4
+    parsed = list(csv.reader(io.StringIO(b"".join(chunks).decode("utf-8"))))
+    assert parsed[1:] == [[str(i), name] for i, name in rows]
+
+
+def test_iter_rows_csv_uses_union_of_columns():
+    body = b"".join(iter_rows_csv([{"a": "1"}, {"a": "2", "b": "3"}])).decode("utf-8")
+    assert body.splitlines() == ["a,b", "1,", "2,3"]
+
+
+def _write_roster(path, rows):
+    with path.open("w", encoding="utf-8", newline="") as handle:
+        writer = csv.DictWriter(handle, fieldnames=["name", "experience", "present", "lunch_at"])
+        writer.writeheader()
+        writer.writerows(rows)
+    return path
+
+
+def test_lifeguard_import_upserts_by_name(make_engine, tmp_path):
+    roster = [
+        {"name": "a", "experience": "low", "present": "TRUE", "lunch_at": "12:00"},
+        {"name": "b", "experience": "medium", "present": "TRUE", "lunch_at": "-"},
+        {"name": "c", "experience": "expert", "present": "FALSE", "lunch_at": "-"},
+    ]
+    with Session(make_engine()) as s:
+        first = load_lifeguards_from_csv(_write_roster(tmp_path / "one.csv", roster), s)
+        assert first["inserted"] == ["a", "b", "c"]
+        ids = dict(s.exec(select(Lifeguard.name, Lifeguard.id)).all())
+
+        changed = [{**roster[0], "present": "FALSE"}, roster[1], roster[1], {**roster[2], "name": "d"}]
+        path = _write_roster(tmp_path / "two.csv", changed)
+        preview = load_lifeguards_from_csv(path, s, dry_run=True)
+        assert dict(s.exec(select(Lifeguard.name, Lifeguard.id)).all()) == ids
+
+        applied = load_lifeguards_from_csv(path, s)
+        assert {key: applied[key] for key in ("inserted", "updated", "deleted", "unchanged", "skipped")} == {
+            "inserted": ["d"],
+            "updated": ["a"],
+            "deleted": ["c"],
+            "unchanged": 1,
+            "skipped": 1,
+        }
+        assert {**preview, "dry_run": False} == applied
+        rows = {guard.name: guard for guard in s.exec(select(Lifeguard)).all()}
+        assert set(rows) == {"a", "b", "d"}
+        assert rows["a"].id == ids["a"] and rows["b"].id == ids["b"]
+        assert rows["a"].present is False
+
+
+def test_unchanged_roster_round_trip_reports_no_changes(make_engine, tmp_path):
+    with Session(make_engine()) as s:
+        s.add_all([Lifeguard(name="a", experience="low"), Lifeguard(name="b", experience="medium", team="A")])
+        s.commit()
+        path = tmp_path / "export.csv"
+        path.write_bytes(b"".join(iter_lifeguards_csv(s)))
+        summary = load_lifeguards_from_csv(path, s)
+        assert summary["inserted"] == summary["updated"] == summary["deleted"] == []
+        assert summary["unchanged"] == 2
+        assert s.exec(select(Lifeguard.team).where(Lifeguard.name == "a")).one() is None
+
+
+def _history(date_jalali, guard, start="09:00", end="11:00"):
+    return ShiftHistory(date_jalali=date_jalali, guard_name=guard, location_name="L1", start=start, end=end)
+
+
+def test_archive_moves_closed_months_and_reads_back(make_engine, tmp_path):
+    archive = tmp_path / "archive"
+    with Session(make_engine()) as s:
+        s.add_all([_history("1403/04/30", "a"), _history("1403/05/01", "a"), _history("1403/05/02", "b")])
+        s.add_all([_history("1403/06/01", "c"), _history("1403/05/03", "d")])
+        s.commit()
+        before = page_history(s, [], limit=100)
+
+        archived = archive_history(s, before="1403/06", archive_dir=archive)
+        # 1403/05 holds the newest row, so only 1403/04 goes this time
+        assert [(m["month"], m["rows"]) for m in archived] == [("1403/04", 1)]
+        s.add(_history("1403/06/02", "e"))
+        s.commit()
+        archived = archive_history(s, before="1403/06", archive_dir=archive)
+        assert [(m["month"], m["rows"]) for m in archived] == [("1403/05", 3)]
+        assert month_path(archive, "default", "1403/05").exists()
+        assert {row.date_jalali for row in s.exec(select(ShiftHistory))} == {"1403/06/01", "1403/06/02"}
+
+        merged = page_history(s, [], limit=100, archived=archived_history(s, archive_dir=archive))
+        assert merged[: len(before)] == before
+        assert [row["guard_name"] for row in archived_history(s, date="1403/05/02", archive_dir=archive)] == ["b"]
+        assert archived_history(s, start="1403/06/01", archive_dir=archive) == []
+
+        # re-planning an archived day: live rows win, and archiving again replaces the day
+        s.add(_history("1403/05/02", "z"))
+        s.add(_history("1403/07/01", "newest"))
+        s.commit()
+        assert archived_history(s, date="1403/05/02", archive_dir=archive) == []
+        archive_history(s, before="1403/06", archive_dir=archive)
+        assert [row["guard_name"] for row in archived_history(s, date="1403/05/02", archive_dir=archive)] == ["z"]
+        month = archived_history(s, start="1403/05/01", end="1403/05/31", archive_dir=archive)
+        assert [row["guard_name"] for row in month] == ["a", "d", "z"]
+
+
+def test_archived_pages_skip_members_by_header_id_range(make_engine, tmp_path, monkeypatch):
+    from app.services import history_archive
+
+    archive = tmp_path / "archive"
+    opened = []
+    member_rows = history_archive._member_rows
+    monkeypatch.setattr(
+        history_archive, "_member_rows", lambda path, member: opened.append(member) or member_rows(path, member)
+    )
+    with Session(make_engine()) as s:
+        for month in ("1403/03", "1403/04", "1403/05"):
+            s.add_all(_history(f"{month}/0{day}", f"g{day}") for day in range(1, 4))
+        s.add(_history("1403/06/01", "newest"))
+        s.commit()
+        archive_history(s, before="1403/06", archive_dir=archive)
+        ids = [row.id for row in s.exec(select(ShiftHistory).order_by(ShiftHistory.id))]
+        assert len(ids) == 1
+
+        page = page_history(s, [], limit=2, archived=history_archive.iter_archived_history(s, archive_dir=archive))
+        assert [row["date_jalali"] for row in page] == ["1403/03/01", "1403/03/02"] and len(opened) == 1
+
+        opened.clear()
+        rows = history_archive.iter_archived_history(s, after_id=page[-1]["id"] + 4, archive_dir=archive)
+        assert [row["date_jalali"] for row in rows] == ["1403/05/01", "1403/05/02", "1403/05/03"]
+        assert len(opened) == 1
+        opened.clear()
+        assert list(history_archive.iter_archived_history(s, after_id=ids[0], archive_dir=archive)) == []
+        assert opened == []
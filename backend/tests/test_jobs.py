@@ -0,0 +1,72 @@
+import threading
+import time
+
+import pytest
+
+from app.services.jobs import CANCELLED, DONE, FAILED, JobQueue, QueueFull
+
+
+def test_job_queue_runs_cancels_and_bounds_pending():
+    queue = JobQueue(workers=1, max_pending=2, keep_finished=10)
+    started, release = threading.Event(), threading.Event()
+
+    def blocking(job):
+        started.set()
+        release.wait(5)
+        job.progress(1, 2)
+        return "unreachable"
+
+    running = queue.submit("test", blocking)
+    waiting = queue.submit("test", lambda job: "queued result")
+    with pytest.raises(QueueFull):
+        queue.submit("test", lambda job: None)
+
+    assert started.wait(5)
+    assert queue.cancel(waiting.id).status == CANCELLED
+    queue.cancel(running.id)
+    release.set()
+    running.future.result(5)
+    assert queue.get(running.id).status == CANCELLED
+    assert queue.get(running.id).done == 1
+
+    finished = queue.submit("test", lambda job: job.progress(3, 3) or "ok")
+    failed = queue.submit("test", lambda job: 1 / 0)
+    finished.future.result(5)
+    failed.future.result(5)
+    assert (finished.status, finished.result, finished.done) == (DONE, "ok", 3)
+    assert failed.status == FAILED and failed.error
+    queue.shutdown()
+
+
+def test_job_state_is_shared_between_worker_processes(make_engine):
+    from app.services.jobs import RUNNING
+
+    db_engine = make_engine("jobs")
+    owner = JobQueue(workers=1, max_pending=2, keep_finished=1, bind=db_engine)
+    other = JobQueue(workers=1, max_pending=2, keep_finished=1, bind=db_engine)
+    started, release = threading.Event(), threading.Event()
+
+    def blocking(job):
+        job.progress(1, 3)
+        started.set()
+        release.wait(5)
+        job.progress(2, 3)
+        return "unreachable"
+
+    done = owner.submit("test", lambda job: {"rows": [1, 2]})
+    done.future.result(5)
+    assert other.get(done.id).to_dict()["result"] == {"rows": [1, 2]}
+
+    running = owner.submit("test", blocking)
+    assert started.wait(5)
+    seen = other.get(running.id)
+    assert (seen.status, seen.done, seen.total) == (RUNNING, 1, 3)
+    other.cancel(running.id)
+    time.sleep(0.6)  # past the progress sync interval
+    release.set()
+    running.future.result(5)
+    assert other.get(running.id).status == CANCELLED
+    other.submit("test", lambda job: None).future.result(5)
+    assert other.get(done.id) is None and other.get(running.id) is not None  # keep_finished=1
+    owner.shutdown()
+    other.shutdown()